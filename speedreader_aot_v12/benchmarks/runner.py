@@ -0,0 +1,230 @@
+
+"""Time each pipeline stage on synthetic workloads and compare against baselines.
+
+    python -m benchmarks.runner run --out bench.json
+    python -m benchmarks.runner run --baseline bench.json --threshold 0.10
+    python -m benchmarks.runner compare new.json bench.json
+    python -m benchmarks.runner startup --out startup.json
+    python -m benchmarks.runner memory --out memory.json
+    python -m benchmarks.runner gen deep_for depth=4 width=6 > deep.sr
+"""
+from __future__ import annotations
+import argparse, json, os, platform, statistics, subprocess, sys, tempfile, time, tracemalloc
+from typing import Callable, Dict, List, Optional
+from speedreader.lexer import lex
+from speedreader.parser import Parser
+from speedreader.optimizer import optimize
+from speedreader.verifier import verify
+from speedreader.vm import VM
+from .workloads import WORKLOADS
+
+STAGES = ("lex", "parse", "optimize", "verify", "load", "run")
+STARTUP_STAGES = ("interpreter", "cli_run")
+MEMORY_STAGES = ("bindings", "retained", "per_binding", "peak")
+MEMORY_WORKLOADS = ("mutables", "recursion")   # enough bindings to outweigh freelist reuse
+STARTUP_SRC = "let mut x = 1\nx = x + 1\nprint x\n"
+BUDGETS = {"PRINT": 10**9, "MUTATE": 10**9, "LOOP_FUEL": 10**9}
+
+def _parse(toks) -> bytes:
+    p = Parser("")
+    p._toks = iter(toks)   # parse only; lexing is its own stage
+    return p.parse().to_blob()
+
+def _discard(_v):
+    pass
+
+def _time(fn: Callable[[], object], warmup: int, reps: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(reps):
+        t0 = time.perf_counter(); fn(); samples.append(time.perf_counter() - t0)
+    return {"min": min(samples), "median": statistics.median(samples), "mean": statistics.fmean(samples)}
+
+def bench_source(src: str, warmup: int = 1, reps: int = 5) -> Dict[str, Dict[str, float]]:
+    """Per-stage timings for one source; each stage is fed the previous stage's output."""
+    toks = lex(src)
+    raw = _parse(toks)
+    blob = optimize(raw)
+    return {
+        "lex": _time(lambda: lex(src), warmup, reps),
+        "parse": _time(lambda: _parse(toks), warmup, reps),
+        "optimize": _time(lambda: optimize(raw), warmup, reps),
+        "verify": _time(lambda: verify(blob, BUDGETS), warmup, reps),
+        "load": _time(lambda: VM(blob, stdout=_discard), warmup, reps),
+        "run": _time(lambda: VM(blob, stdout=_discard).run(), warmup, reps),
+    }
+
+def bench_startup(warmup: int = 1, reps: int = 10) -> Dict[str, Dict[str, float]]:
+    """Cold-start wall time of fresh processes: a bare interpreter, and
+    `python -m speedreader.cli run` on a three-line script."""
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "startup.sr")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(STARTUP_SRC)
+        def spawn(*args):
+            return lambda: subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL, check=True)
+        return {
+            "interpreter": _time(spawn("-c", "pass"), warmup, reps),
+            "cli_run": _time(spawn("-m", "speedreader.cli", "run", path), warmup, reps),
+        }
+
+def bench_memory(src: str) -> Dict[str, Dict[str, float]]:
+    """Allocator bytes (tracemalloc) of one run: what the finished VM still
+    holds beyond the loaded blob, per live binding, and the peak. Objects
+    reused from CPython's freelists are not counted, so scripts with a
+    handful of bindings read as noise."""
+    blob = optimize(_parse(lex(src)))
+    tracemalloc.start()
+    try:
+        vm = VM(blob, stdout=_discard)
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        vm.run()
+        cur, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    bindings = sum(len(env) for env in vm.env_stack)
+    return {
+        "bindings": {"min": bindings},
+        "retained": {"min": cur - base},
+        "per_binding": {"min": (cur - base) / max(bindings, 1)},
+        "peak": {"min": peak - base},
+    }
+
+def _env() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform()}
+
+def run_startup(warmup: int, reps: int) -> dict:
+    return {"env": _env(), "warmup": warmup, "reps": reps, "workloads": {
+        "startup": {"params": {}, "source_bytes": len(STARTUP_SRC), "stages": bench_startup(warmup, reps)}}}
+
+def run_memory(names: List[str], params: Dict[str, Dict[str, int]]) -> dict:
+    out = {"env": _env(), "unit": "bytes", "workloads": {}}
+    for name in names:
+        p = params.get(name, {})
+        src = WORKLOADS[name](**p)
+        out["workloads"][name] = {"params": p, "source_bytes": len(src), "stages": bench_memory(src)}
+    return out
+
+def run_suite(names: List[str], params: Dict[str, Dict[str, int]], warmup: int, reps: int) -> dict:
+    out = {
+        "env": _env(),
+        "warmup": warmup, "reps": reps, "workloads": {},
+    }
+    for name in names:
+        p = params.get(name, {})
+        src = WORKLOADS[name](**p)
+        out["workloads"][name] = {"params": p, "source_bytes": len(src), "stages": bench_source(src, warmup, reps)}
+    return out
+
+def _ms(t: float) -> str:
+    return f"{t*1e3:.3f} ms"
+
+def _bytes(b: float) -> str:
+    return f"{b:.0f} B"
+
+def compare(new: dict, base: dict, threshold: float) -> List[str]:
+    """Regressions where a stage's best time (or size) grew by more than `threshold` (0.10 = 10%)."""
+    unit = _bytes if new.get("unit") == "bytes" else _ms
+    regressions = []
+    for name, w in new["workloads"].items():
+        b = base.get("workloads", {}).get(name)
+        if b is None or b.get("params") != w.get("params"):
+            continue
+        for stage, t in w["stages"].items():
+            bt = b["stages"].get(stage)
+            if bt and bt["min"] > 0 and t["min"] / bt["min"] > 1 + threshold:
+                regressions.append(f"{name}.{stage}: {unit(bt['min'])} -> {unit(t['min'])} (+{(t['min']/bt['min']-1)*100:.0f}%)")
+    return regressions
+
+def format_table(res: dict, stages=STAGES) -> str:
+    lines = [f"{'workload':<16}" + "".join(f"{s:>12}" for s in stages) + "   (best ms)"]
+    for name, w in res["workloads"].items():
+        lines.append(f"{name:<16}" + "".join(f"{w['stages'][s]['min']*1e3:>12.3f}" for s in stages))
+    return "\n".join(lines)
+
+def format_memory(res: dict) -> str:
+    lines = [f"{'workload':<16}" + "".join(f"{s:>12}" for s in MEMORY_STAGES) + "   (bytes)"]
+    for name, w in res["workloads"].items():
+        lines.append(f"{name:<16}" + "".join(f"{w['stages'][s]['min']:>12.0f}" for s in MEMORY_STAGES))
+    return "\n".join(lines)
+
+def _kv(pairs: List[str]) -> Dict[str, int]:
+    out = {}
+    for p in pairs:
+        k, _, v = p.partition("=")
+        out[k] = int(v)
+    return out
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(prog="benchmarks.runner")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run")
+    r.add_argument("--workload", action="append", choices=sorted(WORKLOADS), help="repeatable; default all")
+    r.add_argument("--param", action="append", default=[], help="workload.key=value, e.g. deep_for.width=10")
+    r.add_argument("--warmup", type=int, default=1)
+    r.add_argument("--reps", type=int, default=5)
+    r.add_argument("--out", help="write results JSON here (use as a future baseline)")
+    r.add_argument("--baseline", help="compare against this results JSON")
+    r.add_argument("--threshold", type=float, default=0.10)
+
+    c = sub.add_parser("compare")
+    c.add_argument("new"); c.add_argument("baseline")
+    c.add_argument("--threshold", type=float, default=0.10)
+
+    s = sub.add_parser("startup", help="time cold `python -m speedreader.cli run` in fresh processes")
+    s.add_argument("--warmup", type=int, default=1)
+    s.add_argument("--reps", type=int, default=10)
+    s.add_argument("--out", help="write results JSON here (use as a future baseline)")
+    s.add_argument("--baseline", help="compare against this results JSON")
+    s.add_argument("--threshold", type=float, default=0.10)
+
+    m = sub.add_parser("memory", help="allocator bytes held by VM bindings after a run")
+    m.add_argument("--workload", action="append", choices=sorted(WORKLOADS), help=f"repeatable; default {', '.join(MEMORY_WORKLOADS)}")
+    m.add_argument("--param", action="append", default=[], help="workload.key=value, e.g. mutables.count=5000")
+    m.add_argument("--out", help="write results JSON here (use as a future baseline)")
+    m.add_argument("--baseline", help="compare against this results JSON")
+    m.add_argument("--threshold", type=float, default=0.10)
+
+    g = sub.add_parser("gen")
+    g.add_argument("workload", choices=sorted(WORKLOADS))
+    g.add_argument("params", nargs="*", help="key=value")
+
+    args = ap.parse_args(argv)
+
+    if args.cmd == "gen":
+        sys.stdout.write(WORKLOADS[args.workload](**_kv(args.params)))
+        return 0
+    if args.cmd == "compare":
+        with open(args.new, encoding="utf-8") as f: new = json.load(f)
+        with open(args.baseline, encoding="utf-8") as f: base = json.load(f)
+    else:
+        if args.cmd == "startup":
+            new = run_startup(args.warmup, args.reps)
+            print(format_table(new, STARTUP_STAGES))
+        else:
+            params: Dict[str, Dict[str, int]] = {}
+            for p in args.param:
+                name, _, kv = p.partition(".")
+                params.setdefault(name, {}).update(_kv([kv]))
+            if args.cmd == "memory":
+                new = run_memory(args.workload or list(MEMORY_WORKLOADS), params)
+                print(format_memory(new))
+            else:
+                new = run_suite(args.workload or list(WORKLOADS), params, args.warmup, args.reps)
+                print(format_table(new))
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(new, f, indent=2)
+        if not args.baseline:
+            return 0
+        with open(args.baseline, encoding="utf-8") as f: base = json.load(f)
+    regressions = compare(new, base, args.threshold)
+    for line in regressions:
+        print(f"[regression] {line}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
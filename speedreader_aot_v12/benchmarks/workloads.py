@@ -0,0 +1,93 @@
+
+"""Parametrised synthetic `.sr` workloads for the benchmark runner."""
+from __future__ import annotations
+from typing import Callable, Dict
+
+def deep_for(depth: int = 3, width: int = 8) -> str:
+    """`depth` nested literal range-fors of `width` iterations each."""
+    lines = ["let mut acc = 0"]
+    for d in range(depth):
+        lines.append("  " * d + f"for (i{d} in 0..{width}) {{")
+    lines.append("  " * depth + "acc = acc + 1")
+    for d in reversed(range(depth)):
+        lines.append("  " * d + "}")
+    lines.append("print acc")
+    return "\n".join(lines) + "\n"
+
+def closures(calls: int = 500) -> str:
+    """A capturing function bumping a global mutable, called `calls` times."""
+    return (
+        "let mut base = 0\n"
+        "fn bump(d) capture[base] {\n"
+        "  base = base + d\n"
+        "}\n"
+        f"for (i in 0..{calls}) {{\n"
+        "  bump(i)\n"
+        "}\n"
+        "print base\n"
+    )
+
+def recursion(depth: int = 300) -> str:
+    """Self-recursive countdown `depth` frames deep."""
+    return (
+        "let mut acc = 0\n"
+        "fn down(n) capture[acc] {\n"
+        "  acc = acc + n\n"
+        "  if n > 0 { down(n - 1) }\n"
+        "}\n"
+        f"down({depth})\n"
+        "print acc\n"
+    )
+
+def flat(lines: int = 5000) -> str:
+    """A long straight-line program: one mutation per line, a print every 100."""
+    out = ["let mut x = 0"]
+    for i in range(lines):
+        out.append(f"x = x + {i % 97}")
+        if i % 100 == 99:
+            out.append("print x")
+    return "\n".join(out) + "\n"
+
+def many_functions(count: int = 300) -> str:
+    """`count` distinct functions, each called once."""
+    out = []
+    for i in range(count):
+        out.append(f"fn f{i}(a, b) {{\n  print a * {i} + b\n}}")
+    for i in range(count):
+        out.append(f"f{i}({i}, 1)")
+    return "\n".join(out) + "\n"
+
+def reductions(n: int = 10000) -> str:
+    """Sum, sum-of-squares, affine and counter loops over a range of `n`
+    (folded to closed form by the VM), followed by one with a call in its
+    body that must be interpreted."""
+    return (
+        "let mut s = 0\nlet mut q = 0\nlet mut h = 7\nlet mut c = 0\n"
+        f"for (i in 0..{n}) {{\n  s = s + i\n  q = q + i * i - 3\n}}\n"
+        f"for (i in 0..{n}; step 3) {{\n  h = h * 31 + 5\n  c = c + 1\n}}\n"
+        "fn noop() {\n}\n"
+        f"for (i in 0..{n // 10}) {{\n  s = s + i\n  noop()\n}}\n"
+        "print s\nprint q\nprint h % 1000003\nprint c\n"
+    )
+
+def mutables(count: int = 2000, closures: int = 200) -> str:
+    """`count` top-level mutables, each stored once, and `closures` functions
+    capturing ten of them apiece, each called once."""
+    out = [f"let mut v{i} = {i}" for i in range(count)]
+    out += [f"v{i} = v{i} + 1" for i in range(count)]
+    for k in range(closures):
+        names = [f"v{(k * 10 + j) % count}" for j in range(10)]
+        out.append(f"fn c{k}() capture[{', '.join(names)}] {{\n  {names[0]} = {' + '.join(names)}\n}}")
+        out.append(f"c{k}()")
+    out.append("print v0")
+    return "\n".join(out) + "\n"
+
+WORKLOADS: Dict[str, Callable[..., str]] = {
+    "deep_for": deep_for,
+    "closures": closures,
+    "recursion": recursion,
+    "flat": flat,
+    "many_functions": many_functions,
+    "reductions": reductions,
+    "mutables": mutables,
+}
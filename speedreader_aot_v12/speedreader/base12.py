@@ -1,5 +1,6 @@
 
 from __future__ import annotations
+from .opcodes import NAMES, TABLE_SIZE
 
 DIGITS = "0123456789AB"
 
@@ -40,61 +41,12 @@ class UCIO:
     @property
     def names(self):
         return list(self.by_name.keys())
-
-UCIO_REG = UCIO()
-
-# Core
-UCIO_REG.add("NOP", 0)
-UCIO_REG.add("SCOPE_ENTER", 1)
-UCIO_REG.add("SCOPE_EXIT", 2)
-UCIO_REG.add("BIND_CONST", 3)
-UCIO_REG.add("BIND_MUT", 4)
-UCIO_REG.add("LOAD", 5)
-UCIO_REG.add("STORE", 6)
-UCIO_REG.add("LITERAL_I64", 7)
-UCIO_REG.add("LITERAL_STR", 8)
-UCIO_REG.add("PRINT", 9)
-UCIO_REG.add("IF_BEGIN", 10)
-UCIO_REG.add("IF_ELSE", 11)
-UCIO_REG.add("IF_END", 12)
-UCIO_REG.add("CMP_GT", 13)
-UCIO_REG.add("CMP_GE", 14)
-UCIO_REG.add("CMP_LT", 15)
-UCIO_REG.add("CMP_LE", 16)
-UCIO_REG.add("CMP_EQ", 17)
-UCIO_REG.add("CMP_NE", 18)
-UCIO_REG.add("JMP_IF_FALSE", 19)
-UCIO_REG.add("JMP", 20)
-UCIO_REG.add("ADD", 21)
-UCIO_REG.add("SUB", 22)
-UCIO_REG.add("MUL", 23)
-UCIO_REG.add("DIV", 24)
-UCIO_REG.add("MOD", 25)
-UCIO_REG.add("HALT", 26)
-
-# Hooks & ranges
-UCIO_REG.add("HOOK_PRE_RULE", 27)
-UCIO_REG.add("HOOK_POST_RULE", 28)
-UCIO_REG.add("RANGE_BEGIN", 29)
-UCIO_REG.add("RANGE_END", 30)
-
-# Tracing
-UCIO_REG.add("TRACE_START", 31)
-UCIO_REG.add("TRACE_MARK", 32)
-UCIO_REG.add("TRACE_END", 33)
-
-# Functions & Loops
-UCIO_REG.add("CALL", 34)          # args: function name (str), argc (int)
-UCIO_REG.add("RET", 35)
-UCIO_REG.add("FN_LABEL", 36)      # name (str), param_count (int), params..., capture_count, captures...
-UCIO_REG.add("LOOP_BEGIN", 37)    # expects cond on stack; skip body if false
-UCIO_REG.add("LOOP_END", 38)      # jump back to matching LOOP_BEGIN
-UCIO_REG.add("LOOP_CONTINUE", 39)
-UCIO_REG.add("LOOP_BREAK", 40)
-
-# Hints for verifier (ignored by VM)
-UCIO_REG.add("FOR_HINT", 41)      # a(int), b(int), step(int), inclusive(0/1)
-
-# Fill table to 144 slots to keep codes stable
-for i in range(42, 144):
-    UCIO_REG.add(f"RES_{i}", i)
+    @classmethod
+    def from_names(cls, names):
+        # Bulk load from the static opcode table (codes are the indices).
+        reg = cls()
+        reg.by_code = {code: Opcode(name, code) for code, name in enumerate(names)}
+        reg.by_name = {oc.name: oc for oc in reg.by_code.values()}
+        return reg
+
+UCIO_REG = UCIO.from_names(NAMES[:TABLE_SIZE])
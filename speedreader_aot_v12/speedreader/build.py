@@ -0,0 +1,162 @@
+
+"""Incremental, parallel compilation of a tree of `.sr` sources.
+
+Each output's build key is a SHA-256 over the compiler fingerprint (the
+sources of the modules that produce blobs), the build options and the
+source bytes; keys are kept in a manifest (`.srbuild.json`) in the output
+root, together with each source's size and mtime so unchanged files are not
+even re-read on a no-op build. Stale files are compiled (and optionally
+optimized, verified, certified) across a process pool; each worker writes
+its `.srdg` through a temp file and `os.replace`, so readers never see a
+partial blob, and only successful outputs enter the manifest. Libraries and
+programs that import them are not verified here; verify after `link`.
+"""
+from __future__ import annotations
+import fnmatch, hashlib, json, os, tempfile, time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MANIFEST = ".srbuild.json"
+BUDGETS = {"PRINT": 1_000_000, "MUTATE": 1_000_000, "LOOP_FUEL": 1_000_000}
+STAGES = ("read", "compile", "optimize", "verify", "write")
+
+_COMPILER = ("lexer", "parser", "ir", "opcodes", "base12", "grammar", "lineage",
+             "emitter", "debuginfo", "optimizer", "verifier", "memory", "loops", "wide",
+             "pgo", "linker")
+
+def compiler_fingerprint() -> str:
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for mod in _COMPILER:
+        with open(os.path.join(here, mod + ".py"), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def _atomic_write(path: str, data: bytes):
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp); raise
+
+def _build_one(task: Tuple[str, str, Optional[str], dict]) -> Tuple[str, Dict[str, float], Optional[str]]:
+    # Worker: (source path, output path, library module or None, options)
+    # -> (source path, stage timings, error).
+    src, out, module, opts = task
+    t: Dict[str, float] = {}
+    try:
+        t0 = time.perf_counter()
+        with open(src, "r", encoding="utf-8") as f:
+            text = f.read()
+        t1 = time.perf_counter(); t["read"] = t1 - t0
+        from .parser import compile_to_bytes, Parser
+        from .linker import link_info
+        Parser._scope_id = 0   # identical sources give identical blobs
+        blob = compile_to_bytes(text, module=module, instrument=opts["instrument"] and not opts["opt"])
+        t0 = time.perf_counter(); t["compile"] = t0 - t1
+        if opts["opt"]:
+            from .optimizer import optimize
+            blob = optimize(blob)
+        t1 = time.perf_counter(); t["optimize"] = t1 - t0
+        # Libraries and programs with imports are only complete once linked,
+        # so verification (and certificates) are left to the link step.
+        if (opts["verify"] or opts["certify"]) and module is None and not link_info(blob).get("imports"):
+            from .verifier import verify, certify, attach_certificate
+            if opts["certify"]: blob = attach_certificate(blob, certify(blob, BUDGETS))
+            else: verify(blob, BUDGETS)
+        t0 = time.perf_counter(); t["verify"] = t0 - t1
+        _atomic_write(out, blob)
+        t["write"] = time.perf_counter() - t0
+        return src, t, None
+    except Exception as e:
+        return src, t, f"{type(e).__name__}: {e}"
+
+class BuildReport:
+    def __init__(self):
+        self.total = 0
+        self.built: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self.stages: Dict[str, float] = {s: 0.0 for s in STAGES}   # summed over workers
+        self.scan = 0.0   # walking the tree and checking keys
+        self.wall = 0.0
+
+    def summary(self) -> str:
+        up = self.total - len(self.built) - len(self.failed)
+        lines = [f"{self.total} sources: {len(self.built)} built, {up} up to date, {len(self.failed)} failed in {self.wall:.3f}s (scan {self.scan:.3f}s)"]
+        if self.built:
+            lines.append("  " + "  ".join(f"{s} {self.stages[s]:.3f}s" for s in STAGES) + "  (summed over workers)")
+        for src, err in sorted(self.failed.items()):
+            lines.append(f"  [failed] {src}: {err}")
+        return "\n".join(lines)
+
+def _sources(root: str) -> List[str]:
+    out = []
+    for d, dirs, files in os.walk(root):
+        dirs[:] = sorted(x for x in dirs if not x.startswith("."))
+        out.extend(os.path.relpath(os.path.join(d, f), root) for f in sorted(files) if f.endswith(".sr"))
+    return out
+
+def build(src_dir: str, out_dir: Optional[str] = None, opt: bool = False, verify: bool = False,
+          certify: bool = False, jobs: Optional[int] = None, libs: Sequence[str] = (), force: bool = False,
+          instrument: bool = True) -> BuildReport:
+    """Compile every stale `.sr` under `src_dir` to `out_dir` (default:
+    next to the sources), mirroring the tree. Sources whose relative path
+    matches one of the `libs` globs are compiled as libraries named after
+    the file. `jobs` worker processes (default: CPU count; 1 = in-process)."""
+    report = BuildReport(); t_start = time.perf_counter()
+    out_dir = out_dir or src_dir
+    opts = {"opt": opt, "verify": verify, "certify": certify, "instrument": instrument}
+    mpath = os.path.join(out_dir, MANIFEST)
+    try:
+        with open(mpath, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    prefix = hashlib.sha256((compiler_fingerprint() + json.dumps(opts, sort_keys=True)).encode("utf-8"))
+    if manifest.get("prefix") != prefix.hexdigest() or force:
+        manifest = {"prefix": prefix.hexdigest(), "files": {}}
+    old = manifest["files"]; files: Dict[str, dict] = {}
+    tasks = []; pending: Dict[str, Tuple[str, dict]] = {}
+    for rel in _sources(src_dir):
+        src = os.path.join(src_dir, rel); out = os.path.join(out_dir, os.path.splitext(rel)[0] + ".srdg")
+        module = os.path.splitext(os.path.basename(rel))[0] if any(fnmatch.fnmatch(rel, g) for g in libs) else None
+        st = os.stat(src); ent = old.get(rel)
+        stamp = [st.st_size, st.st_mtime_ns, module]
+        if ent is not None and ent["stamp"] == stamp and os.path.exists(out):
+            files[rel] = ent; continue
+        with open(src, "rb") as f:
+            h = prefix.copy(); h.update(repr(module).encode("utf-8")); h.update(f.read())
+        key = h.hexdigest()
+        if ent is not None and ent["key"] == key and os.path.exists(out):
+            files[rel] = {"key": key, "stamp": stamp}; continue
+        tasks.append((src, out, module, opts)); pending[src] = (rel, {"key": key, "stamp": stamp})
+    report.total = len(files) + len(tasks)
+    report.scan = time.perf_counter() - t_start
+
+    if tasks:
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1 or len(tasks) == 1:
+            results = map(_build_one, tasks)
+            pool = None
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(jobs)
+            results = pool.map(_build_one, tasks, chunksize=max(1, len(tasks) // (jobs * 8)))
+        try:
+            for src, t, err in results:
+                rel, ent = pending[src]
+                for s, dt in t.items(): report.stages[s] += dt
+                if err is None:
+                    files[rel] = ent; report.built.append(rel)
+                else:
+                    report.failed[rel] = err
+        finally:
+            if pool is not None: pool.shutdown()
+    if files != old:
+        manifest["files"] = files
+        _atomic_write(mpath, json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+    report.wall = time.perf_counter() - t_start
+    return report
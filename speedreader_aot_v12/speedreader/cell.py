@@ -0,0 +1,30 @@
+
+"""Mutable bindings: `BIND_MUT` stores a `Cell` that captures share, while
+constants and parameters are stored bare; `VM.kinds` records which way the
+code binds each name, so only names bound both ways test the value.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Optional
+
+MUT = True     # always bound by BIND_MUT: the binding is a Cell
+CONST = False  # only BIND_CONST or a parameter: the binding is the value
+
+class Cell:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"Cell({self.value!r})"
+
+def unwrap(v: Any) -> Any:
+    """The value of a binding of unknown kind."""
+    return v.value if type(v) is Cell else v
+
+def bind_kind(kinds: Dict[str, Optional[bool]], name: str, kind: bool):
+    """Record that `name` is bound as `kind`; a second kind makes it mixed (None)."""
+    if kinds.get(name, kind) is kind:
+        kinds[name] = kind
+    else:
+        kinds[name] = None
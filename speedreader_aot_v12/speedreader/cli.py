@@ -1,24 +1,45 @@
 
 from __future__ import annotations
-import argparse, sys, json
-from .parser import compile_to_bytes
-from .optimizer import optimize
-from .verifier import verify, VerifyError
-from .emitter import load_dgm, _load_blob
-from .base12 import UCIO_REG
-from .vm import VM
+import argparse, os, sys
+from .opcodes import NAMES
+# Everything else is imported by the subcommand that needs it: a plain `run`
+# never loads the optimizer, verifier, tracers or snapshot code.
 
 def read_file(p):
     with open(p, "r", encoding="utf-8") as f:
         return f.read()
 
+def load_program(p, library=False, instrument=True) -> bytes:
+    """A compiled blob as is, or a source compiled on the fly (libraries are
+    named after the file)."""
+    with open(p, "rb") as f:
+        raw = f.read()
+    if raw.startswith(b"SRDG"):
+        return raw
+    from .parser import compile_to_bytes
+    module = os.path.splitext(os.path.basename(p))[0] if library else None
+    return compile_to_bytes(raw.decode("utf-8"), module=module, instrument=instrument)
+
 def write_file(p, b):
     with open(p, "wb") as f:
         f.write(b)
 
+def _optimize(blob: bytes, profile=None) -> bytes:
+    from .optimizer import optimize
+    if profile is None:
+        return optimize(blob)
+    from .pgo import ProfileError
+    try:
+        return optimize(blob, profile=profile)
+    except ProfileError as e:
+        print(f"[pgo error] {e}", file=sys.stderr); sys.exit(2)
+
 def disasm(blob: bytes):
+    from .emitter import _load_blob
     meta, code = _load_blob(blob)
     strings = meta.get("strings", [])
+    if meta.get("encoding") == "wide":
+        return _disasm_wide(meta, code)
     i = 0
     def read_varint():
         nonlocal i
@@ -33,7 +54,7 @@ def disasm(blob: bytes):
     out = []
     while i < len(code):
         op = code[i]; i += 1
-        name = UCIO_REG[op].name if op in UCIO_REG.by_code else f"UNK_{op}"
+        name = NAMES[op]
         row = [name]
         if name in {"LITERAL_I64","SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}:
             row.append(str(read_varint()))
@@ -57,6 +78,25 @@ def disasm(blob: bytes):
         out.append(" ".join(row))
     return "\n".join(out)
 
+def _disasm_wide(meta, code):
+    # Same rows as disasm(); each instruction is decoded on its own.
+    from .wide import words, instruction
+    w = words(code); strings = meta.get("strings", [])
+    out = []
+    for k in range(meta["insns"]):
+        name, args = instruction(w, strings, k)
+        row = [name]
+        if name == "FOR_HINT":
+            row += [f"a={args[0]}", f"b={args[1]}", f"s={args[2]}", f"inc={args[3]}"]
+        elif name == "CALL":
+            row += [args[0], f"argc={args[1]}"]
+        elif name == "FN_LABEL":
+            row += [args[0], f"params={len(args[1])}", *(f"p:{p}" for p in args[1]), f"captures={len(args[2])}", *(f"c:{c}" for c in args[2])]
+        else:
+            row += [str(a) for a in args]
+        out.append(" ".join(row))
+    return "\n".join(out)
+
 def main(argv=None):
     ap = argparse.ArgumentParser()
     sub = ap.add_subparsers(dest="cmd", required=True)
@@ -64,40 +104,273 @@ def main(argv=None):
     c = sub.add_parser("compile")
     c.add_argument("src")
     c.add_argument("--opt", action="store_true")
+    c.add_argument("--no-instrument", dest="instrument", action="store_false", help="emit no TRACE_*/HOOK_* opcodes (implied by --opt, which strips them)")
+    c.add_argument("--pgo", metavar="PROFILE", help="optimize with a profile from `profile --opt --pgo-out` (implies --opt)")
     c.add_argument("--verify", action="store_true")
     c.add_argument("--disasm", action="store_true")
+    c.add_argument("--certify", action="store_true", help="verify and attach a certificate for trusted runs")
+    c.add_argument("-o", "--out", help="write the blob here (streams with bounded memory when no other stage runs)")
+    c.add_argument("--lib", action="store_true", help="compile a library: the top level may only declare functions and import")
+    c.add_argument("--module", help="library name (default: the file name)")
+    c.add_argument("--encoding", choices=("compact", "wide"), default="compact", help="varint code, or fixed-width instructions addressable by index")
+
+    cv = sub.add_parser("convert", help="re-encode a blob as compact or wide code")
+    cv.add_argument("blob")
+    cv.add_argument("--to", choices=("compact", "wide"), required=True)
+    cv.add_argument("-o", "--out", required=True)
+
+    ln = sub.add_parser("link", help="merge a program or library with compiled libraries")
+    ln.add_argument("entry", help="program or library (source or blob)")
+    ln.add_argument("libs", nargs="*", help="libraries (blobs, or sources compiled as libraries)")
+    ln.add_argument("-o", "--out", required=True)
+    ln.add_argument("--opt", action="store_true")
+    ln.add_argument("--no-instrument", dest="instrument", action="store_false", help="emit no TRACE_*/HOOK_* opcodes (implied by --opt, which strips them)")
+    ln.add_argument("--certify", action="store_true", help="verify and attach a certificate for trusted runs")
+
+    b = sub.add_parser("build", help="incrementally compile every .sr under a directory")
+    b.add_argument("src_dir")
+    b.add_argument("-o", "--out-dir", help="mirror the tree here (default: next to the sources)")
+    b.add_argument("--opt", action="store_true")
+    b.add_argument("--no-instrument", dest="instrument", action="store_false", help="emit no TRACE_*/HOOK_* opcodes (implied by --opt, which strips them)")
+    b.add_argument("--verify", action="store_true")
+    b.add_argument("--certify", action="store_true", help="verify and attach a certificate for trusted runs")
+    b.add_argument("-j", "--jobs", type=int, help="worker processes (default: CPU count)")
+    b.add_argument("--lib", action="append", default=[], metavar="GLOB", help="compile sources matching this relative-path glob as libraries (repeatable)")
+    b.add_argument("--force", action="store_true", help="rebuild everything")
 
     r = sub.add_parser("run")
     r.add_argument("src")
     r.add_argument("--opt", action="store_true")
-    r.add_argument("--trace", action="store_true")
-    r.add_argument("--fuel", type=int, default=10000)
+    r.add_argument("--no-instrument", dest="instrument", action="store_false", help="emit no TRACE_*/HOOK_* opcodes (implied by --opt, which strips them)")
+    r.add_argument("--pgo", metavar="PROFILE", help="optimize with a profile from `profile --opt --pgo-out` (implies --opt)")
+    r.add_argument("--link", action="append", default=[], metavar="LIB", help="link this library before running (repeatable)")
+    r.add_argument("--trace", action="store_true", help="dump the full in-memory trace as JSON after the run")
+    r.add_argument("--trace-out", help="stream a compact trace to this file")
+    r.add_argument("--trace-format", choices=("jsonl", "bin"), default="jsonl")
+    r.add_argument("--snapshot-every", type=int, default=1024, help="full stack/env snapshot interval in records (0 = only the first)")
+    r.add_argument("--until-line", type=int, help="run the prelude until execution reaches this source line, then snapshot")
+    r.add_argument("--snapshot-out", help="write the --until-line VM snapshot here")
+    r.add_argument("--from-snapshot", help="resume from a snapshot taken on the same program")
+    r.add_argument("--repeat", type=int, default=0, help="launch this many runs from the snapshot")
+    r.add_argument("--fuel", type=int, help="stop after this many loop iterations plus calls (skipped when the worst-case cost is proven to fit)")
+    r.add_argument("--no-fold-loops", dest="fold_loops", action="store_false", help="interpret reduction loops instead of evaluating them in closed form")
+    r.add_argument("--trusted", action="store_true", help="certify, then run without per-instruction checks")
+    r.add_argument("--parallel", type=int, default=0, metavar="N", help="run independent range-for loops across N worker processes")
+    r.add_argument("--memory", type=int, metavar="BYTES", help="MEMORY budget: fail once bindings, frames and stack exceed this many (modelled) bytes")
+    r.add_argument("--print-buffer", type=int, default=1 << 16, help="PRINT output flush threshold in characters (0 = flush every value)")
+
+    co = sub.add_parser("cost", help="worst-case instructions, PRINTs, mutations and fuel per function")
+    co.add_argument("src", help="source or blob")
+    co.add_argument("--opt", action="store_true")
+    co.add_argument("--json", action="store_true")
+
+    pr = sub.add_parser("profile")
+    pr.add_argument("src")
+    pr.add_argument("--opt", action="store_true")
+    pr.add_argument("--report", help="write the table here instead of stderr")
+    pr.add_argument("--collapsed", help="write collapsed stacks for flame graph tools")
+    pr.add_argument("--pgo-out", help="write a profile for `compile`/`run --pgo` (requires --opt)")
+
+    t = sub.add_parser("trace")
+    t.add_argument("path")
+    t.add_argument("--ip", help="inclusive ip range A:B")
+    t.add_argument("--fn", help="only records executed inside this function")
+    t.add_argument("--line", type=int, help="only records from this source line")
+    t.add_argument("--full", action="store_true", help="reconstruct the stack after each record")
+
+    sv = sub.add_parser("serve", help="answer JSON Lines requests from stdin or a Unix socket")
+    sv.add_argument("--socket", help="listen on this Unix socket path instead of stdin")
+    sv.add_argument("--workers", type=int, default=0, help="pre-forked worker processes (0 = serve in-process)")
+    sv.add_argument("--cache-size", type=int, default=256, help="compiled programs kept per process")
 
     args = ap.parse_args(argv)
 
+    if args.cmd in ("compile", "run", "profile", "link", "cost"):
+        from .parser import compile_to_bytes, compile_file
+        profile = None
+        if getattr(args, "pgo", None):
+            from .pgo import load_profile
+            profile = load_profile(args.pgo); args.opt = True
+        if args.opt: from .optimizer import optimize
+        instrument = getattr(args, "instrument", True) and not args.opt
     if args.cmd == "compile":
+        module = None
+        if args.lib:
+            module = args.module or os.path.splitext(os.path.basename(args.src))[0]
+        if args.encoding == "wide" and args.certify:
+            print("[compile] certificates are bound to compact code; drop --certify or --encoding wide", file=sys.stderr); sys.exit(2)
+        if args.out and not (args.opt or args.verify or args.certify or args.disasm or args.encoding == "wide"):
+            compile_file(args.src, args.out, module=module, instrument=instrument); return
         src = read_file(args.src)
-        blob = compile_to_bytes(src)
+        blob = compile_to_bytes(src, module=module, instrument=instrument)
         if args.opt:
-            blob = optimize(blob)
+            blob = _optimize(blob, profile)
+        if args.verify or args.certify:
+            from .verifier import verify, certify, attach_certificate, VerifyError
         if args.verify:
             try:
                 verify(blob, {"PRINT": 1_000_000, "MUTATE": 1_000_000, "LOOP_FUEL": 1_000_000})
             except VerifyError as e:
                 print(f"[verify error] {e}", file=sys.stderr); sys.exit(2)
+        if args.certify:
+            try:
+                blob = attach_certificate(blob, certify(blob, {"PRINT": 1_000_000, "MUTATE": 1_000_000, "LOOP_FUEL": 1_000_000}))
+            except VerifyError as e:
+                print(f"[verify error] {e}", file=sys.stderr); sys.exit(2)
+        if args.encoding == "wide":
+            from .wide import to_wide
+            blob = to_wide(blob)
         if args.disasm:
             print(disasm(blob))
+        elif args.out:
+            write_file(args.out, blob)
         else:
             sys.stdout.buffer.write(blob)
+    elif args.cmd == "convert":
+        from .wide import to_wide, to_compact
+        with open(args.blob, "rb") as f:
+            blob = f.read()
+        write_file(args.out, to_wide(blob) if args.to == "wide" else to_compact(blob))
+    elif args.cmd == "build":
+        from .build import build
+        report = build(args.src_dir, args.out_dir, opt=args.opt, verify=args.verify, certify=args.certify,
+                       jobs=args.jobs, libs=args.lib, force=args.force, instrument=args.instrument)
+        print(report.summary(), file=sys.stderr)
+        if report.failed: sys.exit(1)
+    elif args.cmd == "link":
+        from .linker import link, LinkError
+        try:
+            blob = link(load_program(args.entry, instrument=instrument), [load_program(p, library=True, instrument=instrument) for p in args.libs])
+        except LinkError as e:
+            print(f"[link error] {e}", file=sys.stderr); sys.exit(2)
+        if args.opt:
+            blob = optimize(blob)
+        if args.certify:
+            from .verifier import certify, attach_certificate, VerifyError
+            try:
+                blob = attach_certificate(blob, certify(blob, {"PRINT": 1_000_000, "MUTATE": 1_000_000, "LOOP_FUEL": 1_000_000}))
+            except VerifyError as e:
+                print(f"[verify error] {e}", file=sys.stderr); sys.exit(2)
+        write_file(args.out, blob)
     elif args.cmd == "run":
+        from .vm import VM
+        from .sinks import BufferedSink
+        blob = load_program(args.src, instrument=instrument)
+        if args.link:
+            from .linker import link, LinkError
+            try:
+                blob = link(blob, [load_program(p, library=True, instrument=instrument) for p in args.link])
+            except LinkError as e:
+                print(f"[link error] {e}", file=sys.stderr); sys.exit(2)
+        if args.opt:
+            blob = _optimize(blob, profile)
+        cert = None
+        if args.trusted:
+            from .verifier import certify, VerifyError
+            from .wide import to_compact
+            blob = to_compact(blob)   # trusted runs need compact code
+            try:
+                budgets = {"PRINT": 1_000_000, "MUTATE": 1_000_000, "LOOP_FUEL": 1_000_000}
+                if args.memory is not None: budgets["MEMORY"] = args.memory
+                if args.fuel is not None: budgets["LOOP_FUEL"] = args.fuel
+                cert = certify(blob, budgets)
+            except VerifyError as e:
+                print(f"[verify error] {e}", file=sys.stderr); sys.exit(2)
+        fuel = args.fuel
+        if fuel is not None and not args.trusted:
+            from .verifier import cost_report
+            total = cost_report(blob).program
+            if total is not None and total.fuel <= fuel: fuel = None   # proven to fit
+        snap = None
+        if args.from_snapshot or args.until_line is not None:
+            from .snapshot import take_snapshot, restore_snapshot, run_to
+        if args.from_snapshot:
+            with open(args.from_snapshot, "rb") as f: snap = f.read()
+        elif args.until_line is not None:
+            from .debuginfo import LineTable
+            lines = LineTable.from_blob(blob)
+            stops = lines.offsets(args.until_line) if lines else []
+            if not stops:
+                print(f"[snapshot] no code on line {args.until_line}", file=sys.stderr); sys.exit(2)
+            pre = VM(blob, stdout=BufferedSink(threshold=args.print_buffer))
+            if not run_to(pre, stops):
+                print(f"[snapshot] program halted before line {args.until_line}", file=sys.stderr); sys.exit(2)
+            pre.flush(); snap = take_snapshot(pre)
+            if args.snapshot_out:
+                write_file(args.snapshot_out, snap)
+                if not args.repeat: return
+        if snap is not None and (args.trusted or args.memory is not None or ((args.trace or args.trace_out) and args.repeat > 1)):
+            print("[snapshot] runs from a snapshot cannot be trusted, memory-budgeted or traced more than once", file=sys.stderr); sys.exit(2)
+        tracer = args.trace; trace_file = None
+        if args.trace_out:
+            from .trace import JsonlTraceWriter, BinaryTraceWriter
+            if args.trace_format == "bin":
+                trace_file = open(args.trace_out, "wb"); tracer = BinaryTraceWriter(trace_file, args.snapshot_every)
+            else:
+                trace_file = open(args.trace_out, "w", encoding="utf-8"); tracer = JsonlTraceWriter(trace_file, args.snapshot_every)
+        try:
+            if snap is not None:
+                for _ in range(max(1, args.repeat)):
+                    trace = restore_snapshot(blob, snap, stdout=BufferedSink(threshold=args.print_buffer), trace=tracer, fold_loops=args.fold_loops, parallel=args.parallel, fuel=fuel).run()
+            else:
+                vm = VM(blob, stdout=BufferedSink(threshold=args.print_buffer), trace=tracer, trusted=args.trusted, certificate=cert, fold_loops=args.fold_loops, memory=args.memory, parallel=args.parallel, fuel=fuel)
+                trace = vm.run()
+        finally:
+            if trace_file is not None: trace_file.close()
+        if args.trace and not args.trace_out:
+            import json
+            print(json.dumps(trace, indent=2))
+    elif args.cmd == "cost":
+        from .verifier import cost_report
+        blob = load_program(args.src, instrument=instrument)
+        if args.opt:
+            blob = optimize(blob)
+        report = cost_report(blob)
+        if args.json:
+            import json
+            print(json.dumps({"program": report.program and report.program.to_dict(),
+                              "functions": {f: c and c.to_dict() for f, c in report.functions.items()},
+                              "recursive": report.recursive, "unbounded_loops": report.unbounded_loops}))
+        else:
+            print(report.format())
+    elif args.cmd == "profile":
+        from .vm import VM
+        from .profiler import Profiler
+        if args.pgo_out and not args.opt:
+            print("[profile] --pgo-out records the optimized blob; add --opt", file=sys.stderr); sys.exit(2)
         src = read_file(args.src)
-        blob = compile_to_bytes(src)
+        blob = compile_to_bytes(src, instrument=instrument)
         if args.opt:
             blob = optimize(blob)
-        vm = VM(blob, trace=args.trace)
-        trace = vm.run()
-        if args.trace:
-            print(json.dumps(trace, indent=2))
+        prof = Profiler()
+        vm = VM(blob, profiler=prof); vm.run()
+        if args.pgo_out:
+            import json
+            from .pgo import collect
+            with open(args.pgo_out, "w", encoding="utf-8") as f:
+                json.dump(collect(prof, vm), f, separators=(",", ":"))
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                f.write(prof.report() + "\n")
+        else:
+            print(prof.report(), file=sys.stderr)
+        if args.collapsed:
+            with open(args.collapsed, "w", encoding="utf-8") as f:
+                f.write(prof.collapsed())
+
+    elif args.cmd == "serve":
+        from .server import serve
+        serve(args.socket, args.workers, args.cache_size)
+    elif args.cmd == "trace":
+        import json
+        from .trace import read_trace
+        ip_range = None
+        if args.ip:
+            a, _, b = args.ip.partition(":")
+            ip_range = (int(a or 0), int(b) if b else sys.maxsize)
+        out = sys.stdout
+        for rec in read_trace(args.path, ip_range=ip_range, fn=args.fn, full=args.full, line=args.line):
+            out.write(json.dumps(rec, default=repr) + "\n")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,82 @@
+
+from __future__ import annotations
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+from .ir import _SVARINT, _svarint
+
+LINES = "lines"   # blob section name
+
+Entry = Tuple[int, int, int]   # (code offset, line, column)
+
+def encode_lines(entries: Iterable[Entry], prev: Entry = (0, 0, 0)) -> bytes:
+    """Delta-encode (offset, line, col) entries sorted by offset: per entry,
+    svarints for the offset delta, line delta and the absolute column.
+    Deltas start from `prev`, the last entry of an earlier chunk."""
+    out = bytearray(); pos, line = prev[0], prev[1]
+    for p, l, c in entries:
+        out += _SVARINT.get(p - pos) or _svarint(p - pos)
+        out += _SVARINT.get(l - line) or _svarint(l - line)
+        out += _SVARINT.get(c) or _svarint(c)
+        pos = p; line = l
+    return bytes(out)
+
+def decode_lines(raw: bytes) -> List[Entry]:
+    out: List[Entry] = []; vals = [0, 0, 0]; i = 0; n = len(raw); pos = line = 0
+    while i < n:
+        for k in range(3):
+            b = raw[i]; i += 1
+            if b < 128:   # single-byte svarint
+                vals[k] = b - 128 if b & 0x40 else b; continue
+            shift = 7; result = b & 0x7F
+            while True:
+                b = raw[i]; i += 1
+                result |= (b & 0x7F) << shift; shift += 7
+                if b < 128: break
+            vals[k] = result - (1 << shift) if b & 0x40 else result
+        pos += vals[0]; line += vals[1]
+        out.append((pos, line, vals[2]))
+    return out
+
+def normalize(entries: Iterable[Entry]) -> List[Entry]:
+    """Collapse entries (sorted by offset) to the last one per offset and
+    drop entries that repeat their predecessor's position."""
+    out: List[Entry] = []
+    for e in entries:
+        while out and out[-1][0] == e[0]:
+            out.pop()
+        if out and out[-1][1] == e[1] and out[-1][2] == e[2]:
+            continue
+        out.append(e)
+    return out
+
+def remap(entries: Iterable[Entry], *rewrites: Tuple[Dict[int, int], int]) -> List[Entry]:
+    """Move entries through successive rewrites, each given as (offsets, end):
+    `offsets` maps every old instruction start to its new offset (removed
+    instructions map to whatever follows, so order is preserved) and `end`
+    is the new code length."""
+    def move(p: int) -> int:
+        for offsets, end in rewrites:
+            p = offsets.get(p, end)
+        return p
+    return normalize((move(p), l, c) for p, l, c in entries)
+
+class LineTable:
+    """Offset -> (line, col) lookup over a decoded `lines` section."""
+    def __init__(self, entries: List[Entry]):
+        self.entries = entries
+        self._pos = [e[0] for e in entries]
+
+    @classmethod
+    def from_blob(cls, blob: bytes) -> Optional["LineTable"]:
+        from .emitter import load_sections
+        raw = load_sections(blob).get(LINES)
+        return cls(decode_lines(raw)) if raw is not None else None
+
+    def lookup(self, ip: int) -> Optional[Tuple[int, int]]:
+        """Source (line, col) of the instruction starting at or before `ip`."""
+        k = bisect_right(self._pos, ip) - 1
+        return self.entries[k][1:] if k >= 0 else None
+
+    def offsets(self, line: int) -> List[int]:
+        """Code offsets where instructions attributed to `line` begin."""
+        return [p for p, l, _ in self.entries if l == line]
@@ -1,6 +1,7 @@
 
 from __future__ import annotations
 import json
+from typing import Dict, Optional
 
 MAGIC = b"SRDG"
 
@@ -10,8 +11,25 @@ def _load_blob(blob: bytes):
     ver = blob[4]
     mlen = int.from_bytes(blob[5:9], "big")
     meta = json.loads(blob[9:9+mlen].decode("utf-8"))
-    code = blob[9+mlen:]
+    # Side sections (meta["sections"]: name -> length) trail the code in order.
+    tail = sum(meta.get("sections", {}).values())
+    code = blob[9+mlen:len(blob)-tail]
     return meta, code
 
+def load_sections(blob: bytes) -> Dict[str, bytes]:
+    meta, code = _load_blob(blob)
+    out = {}; pos = 9 + int.from_bytes(blob[5:9], "big") + len(code)
+    for name, n in meta.get("sections", {}).items():
+        out[name] = blob[pos:pos+n]; pos += n
+    return out
+
 def load_dgm(blob: bytes):
     return _load_blob(blob)
+
+def pack_blob(meta: dict, code, sections: Optional[Dict[str, bytes]] = None) -> bytes:
+    meta = {k: v for k, v in meta.items() if k != "sections"}
+    if sections:
+        meta["sections"] = {k: len(v) for k, v in sections.items()}
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    header = MAGIC + bytes([1]) + len(meta_bytes).to_bytes(4, "big")
+    return header + meta_bytes + bytes(code) + b"".join((sections or {}).values())
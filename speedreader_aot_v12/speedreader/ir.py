@@ -1,7 +1,8 @@
 
 from __future__ import annotations
-from typing import List, Tuple, Any, Dict
-import json
+from typing import List, Tuple, Any, Dict, Optional, BinaryIO
+import io, json
+from array import array
 from .base12 import UCIO_REG
 
 def _svarint(n: int) -> bytes:
@@ -19,11 +20,98 @@ def _svarint(n: int) -> bytes:
         out.append(byte)
     return bytes(out)
 
+# Precomputed encodings for the immediates the parser emits most (scope ids,
+# string indices, small literals); anything outside falls back to _svarint.
+_SVARINT: Dict[int, bytes] = {n: _svarint(n) for n in range(-1024, 1024)}
+
+_STR_TAG = 254
+_INT_OPS = {"LITERAL_I64","SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}
+_STR_OPS = {"LITERAL_STR","BIND_CONST","BIND_MUT","LOAD","STORE"}
+
 class IR:
-    def __init__(self):
-        self.code: List[int] = []  # stream of opcodes and immediates (as ints/markers)
+    def __init__(self, spill_threshold: Optional[int]=None):
+        self.code = bytearray()  # unflushed tail of the opcode/immediate stream
         self.strings: Dict[str,int] = {}
         self.strtab: List[str] = []
+        # With a threshold, code beyond it is spilled to a temp file so peak
+        # memory stays bounded; marks pin the tail until they are cut.
+        self.spill_threshold = spill_threshold
+        self._limit = spill_threshold if spill_threshold is not None else float("inf")
+        self._spill: Optional[BinaryIO] = None
+        self._flushed = 0
+        self._pins = 0
+        self._lines = array("q")   # flat (offset, line, col) triples not yet encoded
+        # The debug line table, delta-encoded as the code spills and spilled
+        # past the same threshold; _lprev is the base of the next delta.
+        self._ltab = bytearray()
+        self._lspill: Optional[BinaryIO] = None
+        self._lspilled = 0
+        self._lprev = (0, 0, 0)
+        self.sections: Dict[str, bytes] = {}   # extra blob sections, written after the line table
+        self.header: Dict[str, Any] = {}   # extra meta fields
+
+    @property
+    def pos(self) -> int:
+        return self._flushed + len(self.code)
+
+    def mark(self) -> int:
+        self._pins += 1
+        return self.pos
+
+    def unmark(self):
+        """Release a mark without cutting."""
+        self._pins -= 1; self._maybe_spill()
+
+    def cut(self, mark: int) -> Tuple[bytes, List[Tuple[int,int,int]]]:
+        """Remove and return everything emitted since `mark`, with its line
+        entries (offsets relative to `mark`)."""
+        self._pins -= 1
+        rel = mark - self._flushed
+        out = bytes(self.code[rel:]); del self.code[rel:]
+        L = self._lines; k = len(L)
+        while k and L[k-3] >= mark:
+            k -= 3
+        lines = [(L[j]-mark, L[j+1], L[j+2]) for j in range(k, len(L), 3)]
+        del L[k:]
+        return out, lines
+
+    def extend(self, raw: bytes, lines: List[Tuple[int,int,int]] = ()):
+        base = self.pos
+        for p, l, c in lines:
+            self._lines.extend((base + p, l, c))
+        self.code.extend(raw); self._maybe_spill()
+
+    def loc(self, line: int, col: int):
+        """Attribute code emitted from here on to source `line`:`col`."""
+        L = self._lines; pos = self._flushed + len(self.code)
+        if L and L[-3] == pos:
+            L[-2] = line; L[-1] = col
+        elif not L or L[-2] != line or L[-1] != col:
+            L.extend((pos, line, col))
+
+    def _maybe_spill(self):
+        if self.spill_threshold is None or self._pins or len(self.code) < self.spill_threshold:
+            return
+        if self._spill is None:
+            import tempfile
+            self._spill = tempfile.TemporaryFile()
+        self._spill.write(self.code); self._flushed += len(self.code)
+        self.code = bytearray()
+        self._spill_lines()
+
+    def _spill_lines(self):
+        # Encode all but the last entry, which loc may still move.
+        from .debuginfo import encode_lines
+        L = self._lines; n = len(L) - 3
+        if n > 0:
+            self._ltab += encode_lines(zip(L[0:n:3], L[1:n:3], L[2:n:3]), self._lprev)
+            self._lprev = (L[n-3], L[n-2], L[n-1]); del L[:n]
+        if len(self._ltab) >= self.spill_threshold:
+            if self._lspill is None:
+                import tempfile
+                self._lspill = tempfile.TemporaryFile()
+            self._lspill.write(self._ltab); self._lspilled += len(self._ltab)
+            self._ltab = bytearray()
 
     def _str_idx(self, s: str) -> int:
         if s in self.strings:
@@ -32,44 +120,93 @@ class IR:
         self.strings[s] = idx; self.strtab.append(s)
         return idx
 
+    # Fast emit API keyed by integer opcode, one method per operand shape.
+    def op(self, op: int):
+        code = self.code; code.append(op)
+        if len(code) >= self._limit: self._maybe_spill()
+
+    def op_int(self, op: int, n: int):
+        code = self.code; code.append(op)
+        code += _SVARINT.get(n) or _svarint(n)
+        if len(code) >= self._limit: self._maybe_spill()
+
+    def op_str(self, op: int, s: str):
+        idx = self.strings.get(s)
+        if idx is None: idx = self._str_idx(s)
+        code = self.code; code.append(op); code.append(_STR_TAG)
+        code += _SVARINT.get(idx) or _svarint(idx)
+        if len(code) >= self._limit: self._maybe_spill()
+
+    def op_call(self, op: int, fname: str, argc: int):
+        self.op_str(op, fname)
+        self.code += _SVARINT.get(argc) or _svarint(argc)
+
+    def op_fn_label(self, op: int, fname: str, params: List[str], captures: List[str]):
+        code = self.code; code.append(op)
+        self._put_str(fname); code += _svarint(len(params))
+        for p in params: self._put_str(p)
+        code += _svarint(len(captures))
+        for c in captures: self._put_str(c)
+        if len(code) >= self._limit: self._maybe_spill()
+
+    def op_for_hint(self, op: int, a: int, b: int, s: int, inc: int):
+        code = self.code; code.append(op)
+        code += _svarint(a); code += _svarint(b); code += _svarint(s); code += _svarint(inc)
+        if len(code) >= self._limit: self._maybe_spill()
+
+    def _put_str(self, s: str):
+        self.code.append(_STR_TAG); self.code += _svarint(self._str_idx(s))
+
     def emit(self, name: str, *args, src_span=None):
+        """Name-keyed emit; routes to the shape-specific methods above."""
         op = UCIO_REG.emit(name)
-        self.code.append(op)
-        if name in {"LITERAL_I64","SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}:
-            self.code.extend(_svarint(int(args[0])))
-        elif name in {"FOR_HINT"}:
-            a,b,s,inc = args
-            self.code.extend(_svarint(int(a))); self.code.extend(_svarint(int(b)))
-            self.code.extend(_svarint(int(s))); self.code.extend(_svarint(int(inc)))
-        elif name in {"LITERAL_STR","BIND_CONST","BIND_MUT","LOAD","STORE","CALL","FN_LABEL"}:
-            # string immediates are tagged by 254 then string index
-            if name == "CALL":
-                fname, argc = args
-                self.code.append(254); self.code.extend(_svarint(self._str_idx(fname)))
-                self.code.extend(_svarint(int(argc)))
-            elif name == "FN_LABEL":
-                fname = args[0]; pcount = int(args[1])
-                self.code.append(254); self.code.extend(_svarint(self._str_idx(fname)))
-                self.code.extend(_svarint(pcount))
-                # param names
-                pos = 2
-                for _ in range(pcount):
-                    self.code.append(254); self.code.extend(_svarint(self._str_idx(str(args[pos])))); pos+=1
-                # capture count and names (optional; default 0 if not provided)
-                if pos < len(args):
-                    ccount = int(args[pos]); pos+=1
-                else:
-                    ccount = 0
-                self.code.extend(_svarint(ccount))
-                for _ in range(ccount):
-                    self.code.append(254); self.code.extend(_svarint(self._str_idx(str(args[pos])))); pos+=1
-            else:
-                name_str = str(args[0])
-                self.code.append(254); self.code.extend(_svarint(self._str_idx(name_str)))
+        if name in _INT_OPS:
+            self.op_int(op, int(args[0]))
+        elif name in _STR_OPS:
+            self.op_str(op, str(args[0]))
+        elif name == "CALL":
+            self.op_call(op, str(args[0]), int(args[1]))
+        elif name == "FN_LABEL":
+            pcount = int(args[1]); params = [str(a) for a in args[2:2+pcount]]
+            rest = args[2+pcount:]
+            captures = [str(a) for a in rest[1:1+int(rest[0])]] if rest else []
+            self.op_fn_label(op, str(args[0]), params, captures)
+        elif name == "FOR_HINT":
+            self.op_for_hint(op, *(int(a) for a in args))
+        else:
+            self.op(op)
         return op
 
-    def to_blob(self) -> bytes:
-        meta = {"strings": self.strtab}
+    def _line_tail(self) -> bytes:
+        # The entries not yet encoded, continuing the encoded table.
+        from .debuginfo import encode_lines
+        L = self._lines
+        return encode_lines(zip(L[0::3], L[1::3], L[2::3]), self._lprev)
+
+    def _header(self, n_lines: int) -> bytes:
+        meta: Dict[str, Any] = {"strings": self.strtab}
+        meta.update(self.header)
+        sections = {"lines": n_lines} if n_lines else {}   # debuginfo.LINES
+        sections.update((k, len(v)) for k, v in self.sections.items())
+        if sections:
+            meta["sections"] = sections
         meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
-        header = b"SRDG" + bytes([1]) + len(meta_bytes).to_bytes(4, "big")
-        return header + meta_bytes + bytes(self.code)
+        return b"SRDG" + bytes([1]) + len(meta_bytes).to_bytes(4, "big") + meta_bytes
+
+    def to_blob(self) -> bytes:
+        out = io.BytesIO(); self.write_blob(out)
+        return out.getvalue()
+
+    def write_blob(self, out: BinaryIO, chunk_size: int = 1 << 20):
+        """Write the blob to a binary stream, copying spilled code and line
+        table in chunks."""
+        tail = self._line_tail()
+        out.write(self._header(self._lspilled + len(self._ltab) + len(tail)))
+        for spill, rest in ((self._spill, self.code), (self._lspill, self._ltab + tail)):
+            if spill is not None:
+                spill.seek(0)
+                for chunk in iter(lambda: spill.read(chunk_size), b""):
+                    out.write(chunk)
+            out.write(rest)
+        for raw in self.sections.values():
+            out.write(raw)
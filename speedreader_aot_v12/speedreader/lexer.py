@@ -1,57 +1,98 @@
 
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List
+from typing import Iterator, List, Optional, TextIO, Tuple, Union
 
 KEYWORDS = {
     "let","mut","print","if","else","true","false",
-    "fn","return","while","break","continue","for","in","capture","step"
+    "fn","return","while","break","continue","for","in","capture","step","import"
 }
 
-@dataclass
 class Tok:
-    kind: str
-    text: str
-    start: int
-    end: int
+    # Plain slots class: one is built per token, and importing dataclasses
+    # costs more than the rest of the lexer at CLI startup.
+    __slots__ = ("kind", "text", "start", "end", "line", "col")
+    def __init__(self, kind: str, text: str, start: int, end: int, line: int = 0, col: int = 0):
+        self.kind = kind; self.text = text; self.start = start; self.end = end
+        self.line = line   # 1-based; 0 when unknown
+        self.col = col
 
-def lex(src: str) -> List[Tok]:
-    i = 0
-    out: List[Tok] = []
-    while i < len(src):
-        ch = src[i]
-        if ch.isspace():
-            i += 1; continue
-        if ch.isalpha() or ch == "_":
-            j = i+1
-            while j < len(src) and (src[j].isalnum() or src[j] == "_"):
-                j += 1
-            t = src[i:j]
-            kind = "KW" if t in KEYWORDS else "ID"
-            out.append(Tok(kind, t, i, j)); i = j; continue
-        if ch.isdigit():
-            j = i+1
-            while j < len(src) and src[j].isdigit():
-                j += 1
-            out.append(Tok("INT", src[i:j], i, j)); i = j; continue
-        if i+2 < len(src) and src[i:i+3] == "..=":
-            out.append(Tok("OP", "..=", i, i+3)); i += 3; continue
-        if i+1 < len(src) and src[i:i+2] in {"==","!=",">=","<=",".."}:
-            out.append(Tok("OP", src[i:i+2], i, i+2)); i += 2; continue
-        if ch in "+-*/%(){}=<>!,;[]":
-            out.append(Tok("OP", ch, i, i+1)); i += 1; continue
-        if ch == '"':
-            j = i+1
-            while j < len(src) and src[j] != '"':
-                if src[j] == "\\": j += 1
-                j += 1
+    def __repr__(self):
+        return f"Tok({self.kind!r}, {self.text!r}, {self.start}, {self.end}, line={self.line}, col={self.col})"
+
+def _scan(src: str, i: int, final: bool) -> Optional[Tuple[Optional[str], int]]:
+    # Token at src[i] as (kind, end); kind None for comments. Returns None when
+    # the token may continue past the end of src and more input can follow.
+    n = len(src)
+    ch = src[i]
+    if ch.isalpha() or ch == "_":
+        j = i+1
+        while j < n and (src[j].isalnum() or src[j] == "_"):
+            j += 1
+        if j == n and not final: return None
+        return ("KW" if src[i:j] in KEYWORDS else "ID"), j
+    if ch.isdigit():
+        j = i+1
+        while j < n and src[j].isdigit():
+            j += 1
+        if j == n and not final: return None
+        return "INT", j
+    if ch == '"':
+        j = i+1
+        while j < n and src[j] != '"':
+            if src[j] == "\\": j += 1
+            j += 1
+        if j >= n and not final: return None
+        return "STR", j+1
+    if ch == "#":
+        j = i
+        while j < n and src[j] != "\n":
             j += 1
-            out.append(Tok("STR", src[i:j], i, j)); i = j; continue
-        if ch == "#":
-            j = i
-            while j < len(src) and src[j] != "\n":
-                j += 1
-            i = j; continue
-        raise SyntaxError(f"Unknown char {ch!r} at {i}")
-    out.append(Tok("EOF", "", len(src), len(src)))
-    return out
+        if j == n and not final: return None
+        return None, j
+    if n - i < 3 and not final: return None
+    if i+2 < n and src[i:i+3] == "..=":
+        return "OP", i+3
+    if i+1 < n and src[i:i+2] in {"==","!=",">=","<=",".."}:
+        return "OP", i+2
+    if ch in "+-*/%(){}=<>!,;[]":
+        return "OP", i+1
+    raise SyntaxError(f"Unknown char {ch!r} at {i}")
+
+def iter_lex(src: Union[str, TextIO], chunk_size: int = 1 << 16) -> Iterator[Tok]:
+    """Yield tokens from a string or a text stream read in `chunk_size` pieces.
+
+    Only the unconsumed tail of the current chunk is held in memory, so
+    lexing a file never materialises the whole source or token list.
+    """
+    chunks = iter((src,)) if isinstance(src, str) else iter(lambda: src.read(chunk_size), "")
+    buf = ""; base = 0; i = 0; final = False
+    line = 1; line_start = 0   # absolute offset of the current line
+    def refill() -> bool:
+        nonlocal buf, base, i, final
+        chunk = next(chunks, "")
+        if not chunk:
+            final = True; return False
+        buf = buf[i:] + chunk; base += i; i = 0
+        return True
+    while True:
+        if i >= len(buf) and not refill():
+            break
+        if buf[i].isspace():
+            if buf[i] == "\n": line += 1; line_start = base+i+1
+            i += 1; continue
+        try:
+            r = _scan(buf, i, final)
+        except SyntaxError:
+            raise SyntaxError(f"Unknown char {buf[i]!r} at {base+i}") from None
+        if r is None:
+            refill(); continue
+        kind, j = r
+        if kind is not None:
+            yield Tok(kind, buf[i:j], base+i, base+j, line, base+i-line_start+1)
+            if kind == "STR" and "\n" in buf[i:j]:
+                line += buf.count("\n", i, j); line_start = base + buf.rindex("\n", i, j) + 1
+        i = j
+    yield Tok("EOF", "", base+len(buf), base+len(buf), line, base+len(buf)-line_start+1)
+
+def lex(src: str) -> List[Tok]:
+    return list(iter_lex(src))
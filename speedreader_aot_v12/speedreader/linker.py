@@ -0,0 +1,119 @@
+
+"""Separate compilation: library blobs and a linker that merges them.
+
+A library is a source whose top level only declares functions (and
+`import`s other libraries); compiled with a module name it is an ordinary
+SRDG blob whose `link` section records
+
+    {"module": "mathlib", "exports": ["gcd", ...], "imports": [...]}
+
+Programs record their `import`s in the same section. `link(entry, libs)`
+appends each library's code after the entry program's HALT (function
+bodies are only reached through CALL, by name), merges the string tables
+with duplicates removed, renumbers scope ids so they stay unique, and
+carries every part's line table along. Linking fails with `LinkError` when
+a function is defined in two parts, a call has no definition, or an import
+is not among the linked modules.
+"""
+from __future__ import annotations
+import json
+from typing import Callable, Dict, List, Optional, Sequence
+from .emitter import _load_blob, load_sections
+from .debuginfo import LINES, decode_lines
+from .ir import IR
+from .wide import to_compact
+from .opcodes import (CODES, SCOPE_ENTER, SCOPE_EXIT, RANGE_BEGIN, RANGE_END, FOR_HINT, CALL, FN_LABEL,
+    LITERAL_STR, BIND_CONST, BIND_MUT, LOAD, STORE)
+
+LINK = "link"   # blob section name
+
+_SCOPED = {SCOPE_ENTER, SCOPE_EXIT, RANGE_BEGIN, RANGE_END}
+_NAMED = {LITERAL_STR, BIND_CONST, BIND_MUT, LOAD, STORE}
+
+class LinkError(Exception): pass
+
+def emit_insn(ir: IR, op: int, args: list, strings: List[str], rename: Dict[str, str] = {},
+              scope: Optional[Callable[[int], int]] = None):
+    """Emit an instruction decoded by `verifier._decode` into `ir` as `op`
+    (its own opcode, or one with the same operands), mapping names other
+    than string literals through `rename` and scope ids through `scope`."""
+    if op in _SCOPED:
+        ir.op_int(op, args[0] if scope is None else scope(args[0]))
+    elif op == FOR_HINT:
+        ir.op_for_hint(op, *args)
+    elif op == CALL:
+        ir.op_call(op, strings[args[0]], args[1])
+    elif op == FN_LABEL:
+        pc = args[1]
+        ir.op_fn_label(op, strings[args[0]], [strings[x] for x in args[2:2+pc]], [strings[x] for x in args[3+pc:]])
+    elif args and op in _NAMED:
+        s = strings[args[0]]
+        ir.op_str(op, s if op == LITERAL_STR else rename.get(s, s))
+    elif args:
+        ir.op_int(op, args[0])
+    else:
+        ir.op(op)
+
+def link_info(blob: bytes) -> dict:
+    """The blob's `link` section ({} for programs without imports)."""
+    raw = load_sections(blob).get(LINK)
+    return json.loads(raw) if raw is not None else {}
+
+def compile_library(src: str, module: str, hooks=None) -> bytes:
+    from .parser import compile_to_bytes
+    return compile_to_bytes(src, hooks=hooks, module=module)
+
+def link(entry: bytes, libraries: Sequence[bytes] = ()) -> bytes:
+    """Merge `entry` (a program or a library) with `libraries` into one blob."""
+    from .verifier import _decode
+    parts = [to_compact(b) for b in (entry, *libraries)]
+    infos = [link_info(b) for b in parts]
+    names = [infos[0].get("module") or "<entry>"]
+    for k, info in enumerate(infos[1:], 1):
+        if "module" not in info:
+            raise LinkError(f"Blob {k} is not a library (compile it with --lib)")
+        if info["module"] in names:
+            raise LinkError(f"Module {info['module']} linked twice")
+        names.append(info["module"])
+    for name, info in zip(names, infos):
+        for imp in info.get("imports", []):
+            if imp not in names:
+                raise LinkError(f"Unresolved import {imp} in {name}")
+
+    decoded = []; defined: Dict[str, str] = {}; called: Dict[str, str] = {}
+    instrumented = False
+    for name, blob in zip(names, parts):
+        meta, code = _load_blob(blob)
+        instrumented = instrumented or meta.get("instrumented") is not False
+        strings = meta.get("strings", []); insns = _decode(code)
+        for at, op, args in insns:
+            if op == "FN_LABEL":
+                fname = strings[args[0]]
+                if fname in defined:
+                    raise LinkError(f"Symbol clash: function {fname} is defined in {defined[fname]} and {name}")
+                defined[fname] = name
+            elif op == "CALL":
+                called.setdefault(strings[args[0]], name)
+        decoded.append((strings, insns, load_sections(blob).get(LINES)))
+    for fname, name in called.items():
+        if fname not in defined:
+            raise LinkError(f"Undefined function {fname} (called from {name})")
+
+    ir = IR(); base = 0
+    shifted = lambda sid: sid + base   # scope ids of the part being copied
+    if not instrumented: ir.header["instrumented"] = False
+    for strings, insns, raw_lines in decoded:
+        lines = decode_lines(raw_lines) if raw_lines is not None else []
+        k = 0; top = 0
+        for at, name, args in insns:
+            start = at - 1
+            while k < len(lines) and lines[k][0] <= start:
+                if lines[k][0] == start: ir.loc(lines[k][1], lines[k][2])
+                k += 1
+            op = CODES[name]
+            if op in _SCOPED: top = max(top, args[0])
+            emit_insn(ir, op, args, strings, scope=shifted)
+        base += top
+    if "module" in infos[0]:
+        ir.sections[LINK] = json.dumps({"imports": [], "module": names[0], "exports": list(defined)}).encode("utf-8")
+    return ir.to_blob()
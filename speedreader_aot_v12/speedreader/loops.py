@@ -0,0 +1,75 @@
+
+"""Proven trip counts of range-for loops: `range_trips` checks a FOR_HINT
+against the loop's code. The range-for lowering is described in
+`parser.Parser.stmt`.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Set
+
+ANY = "*"   # in `stores`: the function calls one that is not defined here
+
+_INERT = {"NOP", "TRACE_START", "TRACE_MARK", "TRACE_END", "HOOK_PRE_RULE", "HOOK_POST_RULE"}
+
+def trips(a: int, b: int, s: int, inclusive: int) -> int:
+    """Iterations of `for (i in a..b; step s)` (`..=` when inclusive)."""
+    if s > 0: return max(0, (b + inclusive - a + s - 1) // s)
+    return max(0, (a - (b - inclusive) - s - 1) // -s)
+
+def stores(bodies: Dict[str, list], captures: Dict[str, List[str]], strings: List[str]) -> Dict[str, Set[str]]:
+    """Names each function may store to, itself or through the functions it
+    calls, given decoded bodies; captures count as stores."""
+    direct: Dict[str, Set[str]] = {}; calls: Dict[str, Set[str]] = {}
+    for f, body in bodies.items():
+        direct[f] = set(captures.get(f, ())) | {strings[args[0]] for _, name, args in body if name == "STORE"}
+        calls[f] = {strings[args[0]] for _, name, args in body if name == "CALL"}
+        if calls[f] - bodies.keys(): direct[f].add(ANY)
+    out = {f: set(v) for f, v in direct.items()}
+    changed = True
+    while changed:   # to a fixed point over the call graph, recursion included
+        changed = False
+        for f, callees in calls.items():
+            n = len(out[f])
+            for g in callees & bodies.keys(): out[f] |= out[g]
+            changed |= len(out[f]) != n
+    return out
+
+def range_trips(region, k: int, strings: List[str], writes: Dict[str, Set[str]]) -> Optional[int]:
+    """Trip count of the loop whose LOOP_HEAD is region[k] (decoded
+    instructions), or None unless it is proven: the code matches its
+    FOR_HINT, and no STORE, rebinding, `continue` or call that may store or
+    capture the variable or its bound can move them besides the step."""
+    if k < 4 or region[k-1][1] != "FOR_HINT": return None
+    a, b, s, inc = region[k-1][2]
+    if s == 0 or inc not in (0, 1): return None
+    (_, n1, x1), (_, n2, x2) = region[k-3], region[k-2]
+    if n1 != "BIND_CONST" or n2 != "BIND_MUT": return None
+    var = strings[x2[0]]; end = f"__for_end_{var}"
+    if strings[x1[0]] != end: return None
+    # the two values bound are the hinted literals
+    j = k - 4
+    for want in (b, a):
+        while j >= 0 and region[j][1] in _INERT: j -= 1
+        if j < 0 or region[j][1] != "LITERAL_I64" or region[j][2][0] != want: return None
+        j -= 1
+    cmp = ("CMP_LE" if inc else "CMP_LT") if s > 0 else ("CMP_GE" if inc else "CMP_GT")
+    cond = [(name, strings[args[0]] if name == "LOAD" else None) for _, name, args in region[k+1:k+5]]
+    if cond != [("LOAD", var), ("LOAD", end), (cmp, None), ("LOOP_BEGIN", None)]: return None
+    nest = 0; e = None
+    for m in range(k + 5, len(region)):
+        _, name, args = region[m]
+        if name == "LOOP_HEAD": nest += 1
+        elif name == "LOOP_END":
+            if not nest: e = m; break
+            nest -= 1
+        elif name == "LOOP_CONTINUE" and not nest: return None
+        elif name in ("STORE", "BIND_CONST", "BIND_MUT") and strings[args[0]] in (var, end):
+            # only the step's store, right before this loop's LOOP_END
+            if name != "STORE" or nest or region[m+1][1] != "LOOP_END": return None
+        elif name == "CALL":
+            w = writes.get(strings[args[0]], {ANY})
+            if ANY in w or var in w or end in w: return None
+        elif name in ("JMP", "JMP_IF_FALSE"): return None
+    if e is None: return None
+    step = [(name, strings[args[0]] if name in ("LOAD", "STORE") else args) for _, name, args in region[e-4:e]]
+    if step != [("LOAD", var), ("LITERAL_I64", [s]), ("ADD", []), ("STORE", var)]: return None
+    return trips(a, b, s, inc)
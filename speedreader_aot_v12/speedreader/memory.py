@@ -0,0 +1,267 @@
+
+"""MEMORY budget: an `Arena` modelled on `c_runtime/arena.c` charges VM
+values, and `static_bound` proves a worst-case bound ahead of time (README,
+"Memory budget").
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Set, Tuple
+from .loops import range_trips, stores
+
+VALUE = 16
+STR = 49
+CELL = 64
+FRAME = 256
+_SMALL = 1 << 63
+
+def size_of(v) -> int:
+    if type(v) is int:
+        return VALUE if -_SMALL < v < _SMALL else VALUE + (v.bit_length() + 7) // 8
+    if type(v) is str:
+        return STR + len(v)
+    return VALUE
+
+class Arena:
+    __slots__ = ("cap", "used", "peak")
+
+    def __init__(self, cap: int):
+        self.cap = cap
+        self.used = 0
+        self.peak = 0
+
+    def alloc(self, n: int) -> bool:
+        used = self.used + n
+        if used > self.cap: return False
+        self.used = used
+        if used > self.peak: self.peak = used
+        return True
+
+    def free(self, n: int):
+        self.used -= n
+
+    def fits(self, n: int) -> bool:
+        return self.used + n <= self.cap
+
+# --- static bound ----------------------------------------------------------
+# Abstract values are (bits, chars): the largest bit length the value has if
+# it is an int and the longest it is if it is a str, -1 where it cannot be one;
+# None is unbounded. Every abstract operation is monotone and built from max
+# and +, which the range-loop extrapolation below relies on.
+
+Val = Optional[Tuple[int, int]]
+
+def _size(v: Tuple[int, int]) -> int:
+    bits, chars = v
+    n = VALUE if bits <= 63 else VALUE + (bits + 7) // 8
+    return max(n, STR + chars) if chars >= 0 else n
+
+def _join(a: Val, b: Val) -> Val:
+    if a is None or b is None: return None
+    return (max(a[0], b[0]), max(a[1], b[1]))
+
+def _join_states(s: Dict[str, Val], *others: Dict[str, Val]) -> Dict[str, Val]:
+    out = dict(s)
+    for o in others:
+        for k, v in o.items():
+            out[k] = _join(out[k], v) if k in out else v
+    return out
+
+def _arith(name: str, a: Val, b: Val) -> Val:
+    if a is None or b is None: return None
+    ints = a[0] >= 0 and b[0] >= 0
+    if name == "ADD":
+        return (max(a[0], b[0]) + 1 if ints else -1, a[1] + b[1] if a[1] >= 0 and b[1] >= 0 else -1)
+    if name == "SUB": return (max(a[0], b[0]) + 1 if ints else -1, -1)
+    if name != "DIV" and (a[1] >= 0 or b[1] >= 0): return None   # str repetition / formatting
+    if name == "MUL": return (a[0] + b[0] if ints else -1, -1)
+    if name == "DIV": return (a[0] if ints else -1, -1)
+    return (b[0] if ints else -1, -1)   # MOD: |a % b| < |b|
+
+class _Unbounded(Exception): pass
+
+def _region(region, strings: List[str], state: Dict[str, Val], ret_arity: Dict[str, int], writes: Dict[str, Set[str]],
+            captured=frozenset(), local: Optional[Set[str]] = None):
+    # -> (peak value per binding, max stack depth, return arity, arg bounds per callee)
+    #
+    # Bindings are tracked flow-sensitively and IF branches join. In a
+    # function, `local` is what the frame has certainly bound; a STORE to
+    # anything else reaches a caller's binding, which the caller's analysis
+    # does not see. A loop body is re-run until the state at its head is
+    # stable, widening what still grows after a few passes to None -- except
+    # for a range-for whose trip count T is proven (loops.range_trips):
+    # after one pass learns the state's shape, a second
+    # gives the growth d per iteration and the head is extrapolated to
+    # H = h + T*d. The state after k iterations is a convex function of k, so
+    # checking that one more pass from H stays within H + d proves the bound
+    # for every k <= T. The loop variable is pinned to its range.
+    peak: Dict[str, Val] = {}; calls: Dict[str, List[Val]] = {}
+    stack: List[Val] = []; max_depth = 0; arity = 0
+    loops: List[dict] = []
+    ifs: List[list] = []     # [entry state, (then-branch state, depth, local), entry depth, entry local]
+    def pop() -> Val: return stack.pop() if stack else None
+    def bind(n: str, v: Val):
+        state[n] = v; peak[n] = _join(peak[n], v) if n in peak else v
+    i = 0
+    while i < len(region):
+        _, name, args = region[i]; i += 1
+        if name == "LITERAL_I64":
+            stack.append((abs(args[0]).bit_length(), -1))
+        elif name == "LITERAL_STR":
+            stack.append((-1, len(strings[args[0]])))
+        elif name == "LOAD":
+            stack.append(state.get(strings[args[0]]))
+        elif name in ("BIND_CONST", "BIND_MUT", "STORE"):
+            n = strings[args[0]]
+            if name == "STORE" and n in captured: raise _Unbounded()   # grows a cell its owner analysed already
+            if local is not None:
+                if name != "STORE": local.add(n)
+                elif n not in local: raise _Unbounded()
+            bind(n, pop())
+        elif name in ("ADD", "SUB", "MUL", "DIV", "MOD"):
+            b = pop(); a = pop(); stack.append(_arith(name, a, b))
+        elif name.startswith("CMP_"):
+            pop(); pop(); stack.append((1, -1))
+        elif name == "PRINT":
+            pop()
+        elif name == "CALL":
+            callee = strings[args[0]]
+            argv = [pop() for _ in range(args[1])][::-1]
+            prev = calls.get(callee)
+            calls[callee] = argv if prev is None else [_join(x, y) for x, y in zip(prev, argv)]
+            stack.extend([None] * ret_arity.get(callee, 0))
+        elif name == "IF_BEGIN":
+            pop(); ifs.append([dict(state), None, len(stack), None if local is None else set(local)])
+        elif name == "IF_ELSE":
+            e = ifs[-1]; e[1] = (state, len(stack), local); state = dict(e[0]); del stack[e[2]:]
+            if local is not None: local = set(e[3])
+        elif name == "IF_END":
+            e = ifs.pop()
+            other, depth, other_local = e[1] if e[1] is not None else (e[0], e[2], e[3])
+            state = _join_states(state, other)
+            if local is not None: local &= other_local
+            stack.extend([None] * (depth - len(stack)))
+        elif name == "LOOP_HEAD":
+            L = {"at": i, "head": dict(state), "depth": len(stack), "pass": 0, "cont": [], "brk": [], "trips": None,
+                 "local": None if local is None else set(local)}
+            t = range_trips(region, i - 1, strings, writes)
+            if t is not None:
+                a, b, s, _ = region[i-2][2]; var = strings[region[i][2][0]]
+                L["trips"] = t; L["var"] = var
+                L["pin"] = (max(abs(x).bit_length() for x in (a, b, b + s, b - s)), -1)
+                state[var] = L["head"][var] = L["pin"]
+            loops.append(L)
+        elif name == "LOOP_BEGIN":
+            pop()
+        elif name == "LOOP_CONTINUE":
+            loops[-1]["cont"].append(dict(state))
+        elif name == "LOOP_BREAK":
+            loops[-1]["brk"].append(dict(state))
+        elif name == "LOOP_END":
+            L = loops[-1]; head = L["head"]
+            if len(stack) != L["depth"]: raise _Unbounded()   # the body leaks stack slots
+            back = _join_states(state, *L["cont"])
+            done = False
+            if L["trips"] is None:
+                new = _join_states(head, back)
+                if L["pass"] >= 3:   # still growing: widen
+                    new = {k: v if head.get(k) == v else None for k, v in new.items()}
+                if L["pass"] > 6: raise _Unbounded()
+                done = new == head
+            else:
+                back[L["var"]] = L["pin"]
+                if L["pass"] == 0:
+                    new = _join_states(head, back)
+                elif L["pass"] == 1:
+                    if set(back) != set(head) or any(back[k] is None or head[k] is None or (back[k][0] < 0) != (head[k][0] < 0)
+                           or (back[k][1] < 0) != (head[k][1] < 0) for k in back):
+                        raise _Unbounded()
+                    L["d"] = {k: (max(0, back[k][0] - h[0]), max(0, back[k][1] - h[1])) for k, h in head.items()}
+                    t = L["trips"]
+                    new = {k: (h[0] + t * L["d"][k][0] if h[0] >= 0 else -1, h[1] + t * L["d"][k][1] if h[1] >= 0 else -1)
+                           for k, h in head.items()}
+                    done = new == head
+                else:
+                    for k, h in head.items():
+                        v = back.get(k); dk = L["d"][k]
+                        if v is None or v[0] > max(-1, h[0] + dk[0]) or v[1] > max(-1, h[1] + dk[1]):
+                            raise _Unbounded()
+                    done = True; new = head
+            if L["local"] is not None: local = set(L["local"])   # the body may not have run
+            if done:
+                state = _join_states(new, *L["brk"]); loops.pop()
+            else:
+                L["head"] = new; L["pass"] += 1; L["cont"] = []; L["brk"] = []
+                state = dict(new); del stack[L["depth"]:]; i = L["at"]
+        elif name == "RET":
+            arity = max(arity, len(stack))
+        elif name in ("JMP", "JMP_IF_FALSE"):
+            raise _Unbounded()
+        max_depth = max(max_depth, len(stack))
+    return peak, max_depth, arity, calls
+
+def _cells(peak: Dict[str, Val]) -> Optional[int]:
+    total = 0
+    for v in peak.values():
+        if v is None: return None
+        total += CELL + _size(v)
+    return total
+
+def static_bound(insns, strings: List[str]) -> Optional[int]:
+    """Upper bound of what the VM charges for a program, given its decoded
+    instructions (verifier._decode), or None when it cannot be proven:
+    recursion, unstructured jumps, loops whose bindings grow or whose body
+    leaks stack slots, functions storing to captured cells or to bindings of
+    their callers, string repetition."""
+    main = []; fns: Dict[str, dict] = {}; cur = None
+    for ins in insns:
+        _, name, args = ins
+        if cur is None:
+            if name == "FN_LABEL":
+                fname = strings[args[0]]; pc = args[1]
+                cur = fns[fname] = {"params": [strings[x] for x in args[2:2+pc]],
+                                    "captures": [strings[x] for x in args[3+pc:]], "body": [], "sid": None, "closing": False}
+            else:
+                main.append(ins)
+            continue
+        cur["body"].append(ins)
+        if cur["closing"]: cur = None
+        elif cur["sid"] is None and name == "SCOPE_ENTER": cur["sid"] = args[0]
+        elif name == "SCOPE_EXIT" and args[0] == cur["sid"]: cur["closing"] = True
+    callees = {f: {strings[a[0]] for _, n, a in d["body"] if n == "CALL"} for f, d in fns.items()}
+    writes = stores({f: d["body"] for f, d in fns.items()}, {f: d["captures"] for f, d in fns.items()}, strings)
+    # callees before callers (return arity), refusing cycles
+    order: List[str] = []; mark: Dict[str, int] = {}
+    def visit(f):
+        if mark.get(f) == 1: raise _Unbounded()
+        if mark.get(f) == 2 or f not in fns: return
+        mark[f] = 1
+        for g in callees[f]: visit(g)
+        mark[f] = 2; order.append(f)
+    try:
+        for f in fns: visit(f)
+        ret_arity: Dict[str, int] = {}
+        for f in order:
+            ret_arity[f] = _region(fns[f]["body"], strings, {p: None for p in fns[f]["params"]}, ret_arity, writes)[2]
+        peak, depth, _, calls = _region(main, strings, {}, ret_arity, writes)
+        total = _cells(peak)
+        if total is None: return None
+        total += depth * VALUE
+        # callers before callees: parameter bounds join over every call site
+        args: Dict[str, List[Val]] = dict(calls); cost: Dict[str, int] = {}
+        for f in reversed(order):
+            d = fns[f]; argv = args.get(f, [None] * len(d["params"]))
+            state = dict(zip(d["params"], argv))
+            for c in d["captures"]: state[c] = peak.get(c)
+            fpeak, fdepth, _, fcalls = _region(d["body"], strings, state, ret_arity, writes, frozenset(d["captures"]),
+                                               set(d["params"]) | set(d["captures"]))
+            for p, v in zip(d["params"], argv): fpeak[p] = _join(fpeak[p], v) if p in fpeak else v
+            cells = _cells({k: v for k, v in fpeak.items() if k not in d["captures"]})
+            if cells is None: return None
+            cost[f] = FRAME + cells + CELL * len(d["captures"]) + fdepth * VALUE
+            for g, gv in fcalls.items():
+                args[g] = gv if g not in args else [_join(x, y) for x, y in zip(args[g], gv)]
+    except _Unbounded:
+        return None
+    deep: Dict[str, int] = {}
+    for f in order:   # callees first
+        deep[f] = cost[f] + max((deep[g] for g in callees[f] if g in deep), default=0)
+    return total + max((deep[g] for g in calls if g in deep), default=0)
@@ -0,0 +1,79 @@
+
+"""Opcode numbering as static constants.
+
+Codes are stable (they are the on-disk format). `NAMES[code]` gives the
+mnemonic for every code 0..255 (`RES_n` reserved, `UNK_n` outside the
+table) and `CODES` maps mnemonics back to codes; `base12.UCIO_REG` is built
+from these.
+"""
+
+# Core
+NOP = 0
+SCOPE_ENTER = 1
+SCOPE_EXIT = 2
+BIND_CONST = 3
+BIND_MUT = 4
+LOAD = 5
+STORE = 6
+LITERAL_I64 = 7
+LITERAL_STR = 8
+PRINT = 9
+IF_BEGIN = 10
+IF_ELSE = 11
+IF_END = 12
+CMP_GT = 13
+CMP_GE = 14
+CMP_LT = 15
+CMP_LE = 16
+CMP_EQ = 17
+CMP_NE = 18
+JMP_IF_FALSE = 19
+JMP = 20
+ADD = 21
+SUB = 22
+MUL = 23
+DIV = 24
+MOD = 25
+HALT = 26
+
+# Hooks & ranges
+HOOK_PRE_RULE = 27
+HOOK_POST_RULE = 28
+RANGE_BEGIN = 29
+RANGE_END = 30
+
+# Tracing
+TRACE_START = 31
+TRACE_MARK = 32
+TRACE_END = 33
+
+# Functions & Loops
+CALL = 34            # function name (str), argc (int)
+RET = 35
+FN_LABEL = 36        # name (str), param_count, params..., capture_count, captures...
+LOOP_BEGIN = 37      # expects cond on stack; skip body if false
+LOOP_END = 38        # jump back to the matching LOOP_HEAD
+LOOP_CONTINUE = 39
+LOOP_BREAK = 40
+
+# Hints for verifier (ignored by VM)
+FOR_HINT = 41        # a(int), b(int), step(int), inclusive(0/1)
+
+# Loop head: LOOP_END/LOOP_CONTINUE jump back here to re-evaluate the condition
+LOOP_HEAD = 42
+
+TABLE_SIZE = 144     # codes 43..143 are reserved so existing codes stay stable
+
+NAMES = (
+    "NOP", "SCOPE_ENTER", "SCOPE_EXIT", "BIND_CONST", "BIND_MUT",
+    "LOAD", "STORE", "LITERAL_I64", "LITERAL_STR", "PRINT",
+    "IF_BEGIN", "IF_ELSE", "IF_END", "CMP_GT", "CMP_GE",
+    "CMP_LT", "CMP_LE", "CMP_EQ", "CMP_NE", "JMP_IF_FALSE",
+    "JMP", "ADD", "SUB", "MUL", "DIV",
+    "MOD", "HALT", "HOOK_PRE_RULE", "HOOK_POST_RULE", "RANGE_BEGIN",
+    "RANGE_END", "TRACE_START", "TRACE_MARK", "TRACE_END", "CALL",
+    "RET", "FN_LABEL", "LOOP_BEGIN", "LOOP_END", "LOOP_CONTINUE",
+    "LOOP_BREAK", "FOR_HINT", "LOOP_HEAD",
+) + tuple(f"RES_{i}" for i in range(43, TABLE_SIZE)) + tuple(f"UNK_{i}" for i in range(TABLE_SIZE, 256))
+
+CODES = {name: code for code, name in enumerate(NAMES[:TABLE_SIZE])}
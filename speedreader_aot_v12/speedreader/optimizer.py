@@ -2,10 +2,16 @@
 from __future__ import annotations
 from typing import List, Tuple
 from .base12 import UCIO_REG
-from .emitter import _load_blob
-import json
+from .emitter import _load_blob, load_sections, pack_blob
+from .debuginfo import LINES, decode_lines, encode_lines, remap
+from .wide import to_compact
 
-def optimize(blob: bytes, strip_trace=True, strip_hooks=True) -> bytes:
+def optimize(blob: bytes, strip_trace=True, strip_hooks=True, profile=None) -> bytes:
+    if profile is not None:
+        # Profiles are recorded on the optimized blob (see pgo.py)
+        from .pgo import apply_profile
+        return apply_profile(optimize(blob, strip_trace, strip_hooks), profile)
+    blob = to_compact(blob)   # rewrites work on compact code
     meta, code = _load_blob(blob)
     code = bytearray(code)
 
@@ -40,76 +46,84 @@ def optimize(blob: bytes, strip_trace=True, strip_hooks=True) -> bytes:
         if strip_hooks and name in {"HOOK_PRE_RULE","HOOK_POST_RULE"}: return True
         return False
 
-    # Pass 1: strip trivials and copy
-    i = 0
-    out = bytearray()
-    while i < len(code):
-        op = code[i]; i += 1
-        if is_strip(op):
-            # skip possible immediates
-            if i < len(code) and code[i] == 254:
-                i += 1
-                while i < len(code):
-                    b = code[i]; i += 1
-                    if b < 128: break
-            elif i < len(code) and (code[i] & 0x80 or code[i] < 128):
-                while i < len(code):
-                    b = code[i]; i += 1
-                    if b < 128: break
-            continue
-        out.append(op)
-        name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
-        if name in {"FOR_HINT"}:
-            for _ in range(4):
+    # Pass 1: strip trivials and copy. Each pass records old instruction
+    # start -> new offset so the debug line table can follow the rewrite.
+    # Blobs parsed with instrument=False have nothing to strip (the parser
+    # never emits NOP), so the pass is skipped.
+    rewrites = []
+    if meta.get("instrumented") is not False:
+        i = 0
+        out = bytearray()
+        moved1 = {}
+        while i < len(code):
+            moved1[i] = len(out)
+            op = code[i]; i += 1
+            if is_strip(op):
+                # NOP/TRACE_*/HOOK_* carry no immediates (see IR.emit)
+                continue
+            out.append(op)
+            name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
+            if name in {"FOR_HINT"}:
+                for _ in range(4):
+                    v, i = read_varint(code, i); out.extend(write_varint(v))
+            elif name in {"LITERAL_I64","SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}:
                 v, i = read_varint(code, i); out.extend(write_varint(v))
-        elif name in {"LITERAL_I64","SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}:
-            v, i = read_varint(code, i); out.extend(write_varint(v))
-        elif name in {"LITERAL_STR","BIND_CONST","BIND_MUT","LOAD","STORE","CALL","FN_LABEL"}:
-            if i < len(code) and code[i] == 254:
-                out.append(254); i += 1
-                v, i = read_varint(code, i)
-                out.extend(write_varint(v))
-                if name == "CALL":
-                    argc, i = read_varint(code, i); out.extend(write_varint(argc))
-                if name == "FN_LABEL":
-                    pc, i = read_varint(code, i); out.extend(write_varint(pc))
-                    for _ in range(pc):
-                        if code[i] == 254:
-                            out.append(254); i += 1
-                            pv, i = read_varint(code, i); out.extend(write_varint(pv))
-                    cc, i = read_varint(code, i); out.extend(write_varint(cc))
-                    for _ in range(cc):
-                        if code[i] == 254:
-                            out.append(254); i += 1
-                            cv, i = read_varint(code, i); out.extend(write_varint(cv))
-    code = out
+            elif name in {"LITERAL_STR","BIND_CONST","BIND_MUT","LOAD","STORE","CALL","FN_LABEL"}:
+                if i < len(code) and code[i] == 254:
+                    out.append(254); i += 1
+                    v, i = read_varint(code, i)
+                    out.extend(write_varint(v))
+                    if name == "CALL":
+                        argc, i = read_varint(code, i); out.extend(write_varint(argc))
+                    if name == "FN_LABEL":
+                        pc, i = read_varint(code, i); out.extend(write_varint(pc))
+                        for _ in range(pc):
+                            if code[i] == 254:
+                                out.append(254); i += 1
+                                pv, i = read_varint(code, i); out.extend(write_varint(pv))
+                        cc, i = read_varint(code, i); out.extend(write_varint(cc))
+                        for _ in range(cc):
+                            if code[i] == 254:
+                                out.append(254); i += 1
+                                cv, i = read_varint(code, i); out.extend(write_varint(cv))
+        code = out
+        rewrites.append((moved1, len(code)))
 
-    # Pass 2: fold arithmetic + compares
-    stack: List[Tuple[bool,int]] = []
+    # Pass 2: fold arithmetic + compares. Stack entries are (constant,
+    # value, old offset, new offset) of the literal pushing them; a fold
+    # replaces both operands' literals with one.
+    stack: List[Tuple[bool,int,int,int]] = []
     i = 0
     out = bytearray()
+    moved2 = {}
+    def fold(val: int):
+        b = stack.pop(); a = stack.pop()
+        del out[a[3]:]
+        for k in range(a[2], i):
+            if k in moved2: moved2[k] = a[3]
+        stack.append((True, val, a[2], a[3]))
+        out.append(UCIO_REG.emit("LITERAL_I64")); out.extend(write_varint(val))
     while i < len(code):
+        moved2[i] = len(out)
+        start = i
         op = code[i]; i += 1
         name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
         if name == "LITERAL_I64":
             val, i = read_varint(code, i)
-            stack.append((True, val))
+            stack.append((True, val, start, len(out)))
             out.append(op); out.extend(write_varint(val))
         elif name in {"ADD","SUB","MUL"} and len(stack) >= 2 and all(s[0] for s in stack[-2:]):
-            b = stack.pop()[1]; a = stack.pop()[1]
-            val = (a+b) if name=="ADD" else (a-b) if name=="SUB" else (a*b)
-            stack.append((True, val))
-            out.append(UCIO_REG.emit("LITERAL_I64")); out.extend(write_varint(val))
+            b = stack[-1][1]; a = stack[-2][1]
+            fold((a+b) if name=="ADD" else (a-b) if name=="SUB" else (a*b))
         elif name in {"CMP_GT","CMP_GE","CMP_LT","CMP_LE","CMP_EQ","CMP_NE"} and len(stack) >= 2 and all(s[0] for s in stack[-2:]):
-            b = stack.pop()[1]; a = stack.pop()[1]
+            b = stack[-1][1]; a = stack[-2][1]
             if name == "CMP_GT": val = 1 if a>b else 0
             elif name == "CMP_GE": val = 1 if a>=b else 0
             elif name == "CMP_LT": val = 1 if a<b else 0
             elif name == "CMP_LE": val = 1 if a<=b else 0
             elif name == "CMP_EQ": val = 1 if a==b else 0
             else: val = 1 if a!=b else 0
-            stack.append((True, val))
-            out.append(UCIO_REG.emit("LITERAL_I64")); out.extend(write_varint(val))
+            fold(val)
         else:
             stack.clear()
             out.append(op)
@@ -136,6 +150,10 @@ def optimize(blob: bytes, strip_trace=True, strip_hooks=True) -> bytes:
             elif name in {"SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}:
                 v, i = read_varint(code, i); out.extend(write_varint(v))
 
-    meta_bytes = json.dumps({"strings": meta.get("strings", [])}, ensure_ascii=False).encode("utf-8")
-    header = b"SRDG" + bytes([1]) + len(meta_bytes).to_bytes(4, "big")
-    return header + meta_bytes + bytes(out)
+    sections = load_sections(blob)
+    if LINES in sections:
+        entries = remap(decode_lines(sections[LINES]), *rewrites, (moved2, len(out)))
+        sections[LINES] = encode_lines(entries)
+    meta = {"strings": meta.get("strings", [])}
+    if strip_trace and strip_hooks: meta["instrumented"] = False
+    return pack_blob(meta, out, sections)
@@ -0,0 +1,265 @@
+
+"""Process-parallel execution of independent range-for iterations, merged
+in order (README, "Parallel loops"). The range-for lowering is described in
+`parser.Parser.stmt`.
+"""
+from __future__ import annotations
+import atexit
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .reductions import _trips
+from .cell import Cell, unwrap
+
+MIN_TRIPS = 1024   # below this the pool round trip costs more than it saves
+
+_CMP = {"CMP_LT", "CMP_LE", "CMP_GT", "CMP_GE"}
+_PLAIN = {"LITERAL_I64", "LITERAL_STR", "ADD", "SUB", "MUL", "DIV", "MOD", "CMP_EQ", "CMP_NE", "PRINT",
+          "SCOPE_ENTER", "SCOPE_EXIT", "RANGE_BEGIN", "RANGE_END", "FOR_HINT", "NOP",
+          "TRACE_START", "TRACE_MARK", "TRACE_END", "HOOK_PRE_RULE", "HOOK_POST_RULE"} | _CMP
+_REDUCE = {"ADD": "ADD", "SUB": "ADD", "MUL": "MUL"}   # update op -> how partials combine
+_FLIP = {"CMP_LT": "CMP_GT", "CMP_LE": "CMP_GE"}
+
+class ParallelLoop:
+    """One independent loop, keyed like a Reduction by the ip after its
+    LOOP_HEAD."""
+    __slots__ = ("var", "end", "step", "cmp", "signed", "reduce", "names", "head", "exit", "workers")
+
+    def __init__(self, var: str, end: str, step, cmp: str, reduce: Dict[str, str], names: List[str],
+                 head: int, exit: int, workers: int, signed: bool = False):
+        self.var = var; self.end = end
+        self.step = step   # int literal, or the hidden step binding's name
+        self.cmp = cmp
+        self.signed = signed   # compared by the step's sign (see parser.Parser.stmt)
+        self.reduce = reduce   # target -> "ADD" | "MUL"
+        self.names = names     # bound by the body
+        self.head = head       # ip after LOOP_HEAD
+        self.exit = exit       # ip after LOOP_END
+        self.workers = workers
+
+    def run(self, vm) -> bool:
+        """Run the whole loop on the pool; False (nothing changed) when it
+        must be interpreted instead."""
+        if vm.arena is not None or vm.fuel is not None: return False   # charges would be made in the workers
+        def cell(name):
+            for env, mut in zip(reversed(vm.env_stack), reversed(vm.mut_stack)):
+                if name in env:
+                    return env, unwrap(env[name]), mut.get(name, False)
+            return None, None, False
+        _, i0, var_mut = cell(self.var); _, end, _ = cell(self.end)
+        s = self.step if type(self.step) is int else cell(self.step)[1]
+        if not var_mut or type(i0) is not int or type(end) is not int or type(s) is not int:
+            return False
+        from .opcodes import CODES
+        cmp = self.cmp
+        if self.signed and s <= 0:
+            if not s: return False
+            cmp = _FLIP[cmp]
+        n = _trips(i0, end, s, CODES[cmp])
+        if n is None or n < MIN_TRIPS: return False
+        init = {}
+        for t, how in self.reduce.items():
+            env, x, mut = cell(t)
+            if env is None or not mut or type(x) not in (int, str) or (how == "MUL" and type(x) is not int): return False
+            init[t] = x
+        k = min(self.workers, n); size, extra = divmod(n, k)
+        tasks = []; start = i0
+        for c in range(k):
+            trips = size + (c < extra); last = start + (trips - 1) * s
+            # an end value that stops the chunk right after `last` under this compare
+            stop = last if cmp in ("CMP_LE", "CMP_GE") else last + (1 if s > 0 else -1)
+            tasks.append((vm.blob, self.head, self.exit, vm.env_stack, vm.mut_stack, self.var, self.end, start, stop,
+                          {t: (1 if how == "MUL" else type(init[t])()) for t, how in self.reduce.items()}, self.names))
+            start = last + s
+        try:
+            results = list(_pool(self.workers).map(_run_chunk, tasks))
+        except Exception:
+            return False   # rerun in order so the failure happens where it would have
+        out = vm.out
+        for printed, _, _ in results:
+            for v in printed: out(v)
+        for t, how in self.reduce.items():
+            x = init[t]
+            for _, partial, _ in results:
+                x = x * partial[t] if how == "MUL" else x + partial[t]
+            env = cell(t)[0]; env[t].value = x
+        env = cell(self.var)[0]; env[self.var].value = i0 + n * s
+        env = vm.env_stack[-1]; mut = vm.mut_stack[-1]
+        for _, _, bound in results:
+            for name, (v, m) in bound.items():
+                env[name] = Cell(v) if m else v; mut[name] = m
+        return True
+
+def _run_chunk(task) -> Tuple[List[Any], Dict[str, Any], Dict[str, Tuple[Any, bool]]]:
+    # Worker: run iterations start..stop of one loop on a fresh checked VM
+    # -> (PRINT values, partial reductions, the body's bindings it made).
+    blob, head, exit, env_stack, mut_stack, var, end, start, stop, identity, names = task
+    from .vm import VM, VMError
+    printed: List[Any] = []
+    vm = VM(blob, stdout=printed.append)
+    vm.env_stack = env_stack; vm.mut_stack = mut_stack   # unpickled copies
+    def frame(name):
+        for env in reversed(env_stack):
+            if name in env: return env
+    frame(var)[var].value = start; frame(end)[end] = stop
+    for t, v in identity.items(): frame(t)[t].value = v
+    top = env_stack[-1]; mut = mut_stack[-1]
+    for name in names:   # never read before the body binds them (see _match)
+        top.pop(name, None); mut.pop(name, None)
+    vm.ip = head; step = vm.step
+    while vm.ip != exit:
+        if not step(): raise VMError("Program halted inside a parallel loop")
+    return (printed, {t: unwrap(frame(t)[t]) for t in identity},
+            {name: (unwrap(top[name]), mut.get(name, False)) for name in names if name in top})
+
+_POOLS: Dict[int, Any] = {}
+
+def _pool(workers: int):
+    pool = _POOLS.get(workers)
+    if pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = _POOLS[workers] = ProcessPoolExecutor(workers)
+        if len(_POOLS) == 1: atexit.register(_shutdown)
+    return pool
+
+def _shutdown():
+    for pool in _POOLS.values(): pool.shutdown()
+    _POOLS.clear()
+
+# --- analysis ----------------------------------------------------------------
+
+def _pure_functions(insns, strings: List[str], fn_meta: Dict[str, dict]) -> Dict[str, set]:
+    # name -> every name the function (transitively) captures or loads, for
+    # the pure functions: no `return`, jumps or stores outside their own
+    # locals, and only pure callees. Impure ones are left out.
+    bodies = {}
+    for fname, m in fn_meta.items():
+        if "end" not in m: continue
+        bodies[fname] = [(n, a) for at, n, a in insns if m["ip"] < at <= m["end"]]
+    direct: Dict[str, Optional[Tuple[set, set]]] = {}
+    for fname, body in bodies.items():
+        local = set(); calls = set(); reads = set(fn_meta[fname]["captures"]); ok = True
+        for k, (n, a) in enumerate(body):
+            if n in ("BIND_CONST", "BIND_MUT"): local.add(strings[a[0]])
+            elif n == "STORE" and strings[a[0]] not in local: ok = False
+            elif n == "LOAD": reads.add(strings[a[0]])
+            elif n == "CALL": calls.add(strings[a[0]])
+            elif n == "RET" and k != len(body) - 1: ok = False   # `return`
+            elif n in ("JMP", "JMP_IF_FALSE", "HALT", "FN_LABEL"): ok = False
+        direct[fname] = (calls, reads) if ok else None
+    pure: Dict[str, set] = {}
+    changed = True
+    # optimistic over recursion: drop functions until every callee is kept
+    live = {f for f, d in direct.items() if d is not None}
+    while changed:
+        changed = False
+        for f in list(live):
+            if not direct[f][0] <= live:
+                live.discard(f); changed = True
+    for f in live:
+        names = set(); seen = set(); todo = [f]
+        while todo:
+            g = todo.pop()
+            if g in seen: continue
+            seen.add(g); names |= direct[g][1]; todo.extend(direct[g][0])
+        pure[f] = names
+    return pure
+
+def _match(body, strings: List[str], pure: Dict[str, set], workers: int, head: int, exit: int) -> Optional[ParallelLoop]:
+    # Independent: the body binds its own names before reading them, stores
+    # elsewhere only through reductions `x = x + e`, `x - e` or `x * e`
+    # whose target nothing else reads, and calls only pure functions.
+    if len(body) < 15: return None
+    signed = body[0][0] == "LOAD" and body[2][0] == "SUB"
+    if signed:   # compared by the step's sign (see parser.Parser.stmt)
+        (o6, st0), (o7, _), (o8, zero), (cmp, _) = body[3:7]
+        if not (o6 == "LOAD" and strings[st0[0]] == f"__for_step_{strings[body[0][1][0]]}" and o7 == "MUL"
+                and o8 == "LITERAL_I64" and zero[0] == 0 and cmp in _FLIP):
+            return None
+        body = body[:2] + body[6:]
+    (o1, var), (o2, bound), (cmp, _), (o3, _) = body[:4]
+    if not (o1 == "LOAD" and o2 == "LOAD" and cmp in _CMP and o3 == "LOOP_BEGIN"): return None
+    var = strings[var[0]]; bound_name = strings[bound[0]]
+    if bound_name != f"__for_end_{var}": return None
+    (l1, v1), (l2, st), (a1, _), (s1, v2), (le, _) = body[-5:]
+    if not (l1 == "LOAD" and strings[v1[0]] == var and a1 == "ADD" and s1 == "STORE" and strings[v2[0]] == var and le == "LOOP_END"):
+        return None
+    if l2 == "LITERAL_I64": step = st[0]
+    elif l2 == "LOAD" and strings[st[0]] == f"__for_step_{var}": step = strings[st[0]]
+    else: return None
+    inner = body[4:-5]
+    bound = {strings[a[0]] for n, a in inner if n in ("BIND_CONST", "BIND_MUT")}
+    if var in bound: return None
+    defined = set(); reduce: Dict[str, str] = {}; loads: Dict[str, int] = {}; reads = set()
+    stack: List[Optional[Tuple[str, Optional[str]]]] = []   # per slot: (name, None) for LOAD name, (name, op) for `name op e`
+    depth = 0   # IF / nested loop nesting
+    for n, a in inner:
+        if n == "LOAD":
+            name = strings[a[0]]; loads[name] = loads.get(name, 0) + 1
+            if name in bound and name not in defined: return None   # may read an earlier iteration
+            stack.append((name, None))
+        elif n in ("BIND_CONST", "BIND_MUT"):
+            if depth == 0: defined.add(strings[a[0]])
+            if stack: stack.pop()
+        elif n == "STORE":
+            name = strings[a[0]]; top = stack.pop() if stack else None
+            if name in bound:
+                if name not in defined: return None
+                continue
+            if name == var or top is None or top[0] != name or top[1] is None: return None
+            if reduce.setdefault(name, _REDUCE[top[1]]) != _REDUCE[top[1]]: return None
+        elif n in ("ADD", "SUB", "MUL"):
+            if stack: stack.pop()
+            x = stack.pop() if stack else None
+            stack.append((x[0], n) if x is not None and x[1] is None else None)
+        elif n in ("DIV", "MOD") or n.startswith("CMP_"):
+            if stack: stack.pop()
+            if stack: stack.pop()
+            stack.append(None)
+        elif n in ("LITERAL_I64", "LITERAL_STR"):
+            stack.append(None)
+        elif n == "PRINT":
+            if stack: stack.pop()
+        elif n == "CALL":
+            callee = strings[a[0]]
+            if callee not in pure: return None
+            if any(r in bound and r not in defined for r in pure[callee]): return None
+            reads |= pure[callee]
+            for _ in range(a[1]):
+                if stack: stack.pop()
+        elif n in ("IF_BEGIN", "LOOP_BEGIN"):
+            if stack: stack.pop()
+            if n == "IF_BEGIN": depth += 1
+        elif n == "LOOP_HEAD":
+            depth += 1
+        elif n in ("IF_END", "LOOP_END"):
+            depth -= 1
+        elif n in ("LOOP_CONTINUE", "LOOP_BREAK"):
+            if depth == 0: return None
+        elif n not in _PLAIN and n != "IF_ELSE":
+            return None
+    if depth: return None
+    for t in reduce:
+        # each update reads its target once; nothing else may
+        stores = sum(1 for n, a in inner if n == "STORE" and strings[a[0]] == t)
+        if loads.get(t, 0) != stores or t in reads: return None
+    return ParallelLoop(var, bound_name, step, cmp, reduce, sorted(bound), head, exit, workers, signed)
+
+def find_parallel(vm, loops: Sequence[Tuple[int, int]], workers: int) -> Dict[int, ParallelLoop]:
+    """Recognise independent range-for loops among `loops`, given as (ip
+    after LOOP_HEAD, ip after LOOP_END) pairs of `vm`'s code."""
+    from .emitter import _load_blob
+    from .verifier import _decode
+    from .wide import to_compact
+    insns = _decode(_load_blob(to_compact(vm.blob))[1])
+    if vm.wide:   # same instructions in the same order; ips are indices
+        insns = [(k + 1, n, a) for k, (_, n, a) in enumerate(insns)]
+    strings = vm.strings
+    pure = _pure_functions(insns, strings, vm.fn_meta)
+    at = {p: k for k, (p, _, _) in enumerate(insns)}
+    found = {}
+    for head, end in loops:
+        if head not in at: continue
+        k = at[head] + 1; j = at.get(end)
+        if j is None: continue
+        r = _match([(n, a) for _, n, a in insns[k:j+1]], strings, pure, workers, head, end)
+        if r is not None: found[head] = r
+    return found
@@ -1,61 +1,112 @@
 
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Optional
-from .lexer import Tok, lex
+import json
+from collections import deque
+from typing import Deque, Iterator, List, Optional, TextIO, Union
+from .lexer import Tok, iter_lex
 from .ir import IR
 from .lineage import Lineage
-from .base12 import UCIO_REG
 from .grammar import FIRST_TABLE, HOOKS
 
-@dataclass
+from .opcodes import (SCOPE_ENTER, SCOPE_EXIT, RANGE_BEGIN, RANGE_END, LITERAL_I64, BIND_CONST, BIND_MUT,
+    LOAD, STORE, LITERAL_STR, CALL, FN_LABEL, FOR_HINT, PRINT, RET, HALT, IF_BEGIN, IF_ELSE, IF_END,
+    LOOP_HEAD, LOOP_BEGIN, LOOP_END, LOOP_BREAK, LOOP_CONTINUE, TRACE_START, TRACE_MARK, TRACE_END,
+    HOOK_PRE_RULE, HOOK_POST_RULE, ADD, SUB, MUL, DIV, MOD, CMP_GT, CMP_GE, CMP_LT, CMP_LE, CMP_EQ, CMP_NE)
+
+_ARITH = {"+": ADD, "-": SUB, "*": MUL, "/": DIV, "%": MOD}
+_CMP = {">": CMP_GT, ">=": CMP_GE, "<": CMP_LT, "<=": CMP_LE, "==": CMP_EQ, "!=": CMP_NE}
+
 class Scope:
-    id: int
+    __slots__ = ("id",)
+    def __init__(self, id: int):
+        self.id = id
+
+def _no_rule(name: str): pass
 
 class Parser:
     _scope_id = 0
-    def __init__(self, src: str, hooks: Optional[object]=None):
+    def __init__(self, src: Union[str, TextIO], hooks: Optional[object]=None, spill_threshold: Optional[int]=None, module: Optional[str]=None, instrument: bool=True):
         self.src = src
-        self.toks: List[Tok] = lex(src)
-        self.i = 0
-        self.ir = IR()
+        self._toks: Iterator[Tok] = iter_lex(src)
+        self._win: Deque[Tok] = deque()   # LL(2) lookahead window
+        self._eof: Optional[Tok] = None
+        self.ir = IR(spill_threshold)
         self.lineage = Lineage()
         self.scope_stack: List[Scope] = []
         self.hooks = hooks
         self.fn_defs: List[str] = []
+        self.imports: List[str] = []
+        self.module = module   # library name: top level may only declare functions
+        # With instrument=False no TRACE_*/HOOK_* opcodes are emitted at all
+        # (parse-time hooks still run). HOOKS is resolved once into
+        # rule -> callable (or None) tables instead of a getattr per rule
+        # entry; with nothing to emit or call, the rule methods are no-ops.
+        self.instrument = instrument
+        self._pre = {r: self._hook(pre) for r, (pre, _) in HOOKS.items() if pre}
+        self._post = {r: self._hook(post) for r, (_, post) in HOOKS.items() if post}
+        if not instrument:
+            self.ir.header["instrumented"] = False
+            if not any(self._pre.values()): self._rule_enter = _no_rule
+            if not any(self._post.values()): self._rule_exit = _no_rule
+
+    def _fill(self, n: int):
+        while len(self._win) < n:
+            t = next(self._toks, None)
+            if t is None: t = self._eof  # EOF repeats
+            elif t.kind == "EOF": self._eof = t
+            self._win.append(t)
 
-    def la(self) -> Tok: return self.toks[self.i]
-    def la2(self) -> Tok: return self.toks[self.i+1]
+    def la(self) -> Tok:
+        if not self._win: self._fill(1)
+        return self._win[0]
+    def la2(self) -> Tok:
+        if len(self._win) < 2: self._fill(2)
+        return self._win[1]
 
     def consume(self, kind: Optional[str]=None, text: Optional[str]=None) -> Tok:
         t = self.la()
         if kind and t.kind != kind: raise SyntaxError(f"Expected {kind} got {t.kind} at {t.start}")
         if text and t.text != text: raise SyntaxError(f"Expected {text} got {t.text} at {t.start}")
-        self.i += 1; return t
+        self._win.popleft(); return t
 
     def run_hook(self, name: str, *args):
+        fn = self._hook(name)
+        if fn is not None: fn(self, *args)
+
+    def _hook(self, name: str):
         fn = getattr(self.hooks, name, None) if self.hooks else None
-        if callable(fn): fn(self, *args)
+        return fn if callable(fn) else None
 
     def parse(self) -> IR:
-        self.ir.emit("TRACE_START")
+        if self.instrument: self.ir.op(TRACE_START)
         self.program()
-        self.ir.emit("TRACE_END")
-        self.ir.emit("HALT")
+        if self.instrument: self.ir.op(TRACE_END)
+        self.ir.op(HALT)
+        if self.module is not None or self.imports:
+            info = {"imports": self.imports}
+            if self.module is not None:
+                info["module"] = self.module; info["exports"] = self.fn_defs
+            self.ir.sections["link"] = json.dumps(info).encode("utf-8")   # linker.LINK
         return self.ir
 
     def program(self):
         self._rule_enter("program")
         while self.la().kind != "EOF":
-            if self.la().kind == "KW" and self.la().text == "fn":
+            t = self.la()
+            if t.kind == "KW" and t.text == "fn":
                 self.fn_decl()
+            elif t.kind == "KW" and t.text == "import":
+                self.consume("KW","import"); name = self.consume("ID").text
+                if name not in self.imports: self.imports.append(name)
+            elif self.module is not None:
+                raise SyntaxError(f"Library {self.module}: only fn and import are allowed at top level, got {t.text!r} at {t.start}")
             else:
                 self.stmt()
         self._rule_exit("program")
 
     def fn_decl(self):
-        self.consume("KW","fn")
-        name = self.consume("ID").text
+        t = self.consume("KW","fn")
+        name = self.consume("ID").text; self.fn_defs.append(name)
         params = []
         self.consume("OP","(")
         if not (self.la().kind == "OP" and self.la().text == ")"):
@@ -72,17 +123,17 @@ class Parser:
                     self.consume("OP",","); captures.append(self.consume("ID").text)
             self.consume("OP","]")
         self.consume("OP","{")
-        self.ir.emit("FN_LABEL", name, len(params), *params, len(captures), *captures)
+        self._at(t); self.ir.op_fn_label(FN_LABEL, name, params, captures)
         self.scope_enter()
         while not (self.la().kind == "OP" and self.la().text == "}"):
             self.stmt()
         self.consume("OP","}")
         self.scope_exit()
-        self.ir.emit("RET")
+        self._at(t); self.ir.op(RET)
 
     def stmt(self):
+        t = self.la(); self._at(t)
         self._rule_enter("stmt")
-        t = self.la()
         if t.kind == "KW" and t.text == "let":
             self.consume("KW","let")
             mut = False
@@ -90,96 +141,120 @@ class Parser:
                 self.consume("KW","mut"); mut = True
             name = self.consume("ID").text
             self.consume("OP","="); self.expr()
-            self.ir.emit("BIND_MUT" if mut else "BIND_CONST", name)
+            self._at(t); self.ir.op_str(BIND_MUT if mut else BIND_CONST, name)
         elif t.kind == "KW" and t.text == "print":
-            self.consume("KW","print"); self.expr(); self.ir.emit("PRINT")
+            self.consume("KW","print"); self.expr(); self._at(t); self.ir.op(PRINT)
         elif t.kind == "KW" and t.text == "return":
             self.consume("KW","return")
             if not (self.la().kind == "OP" and self.la().text == "}"):
                 self.expr()
-            self.ir.emit("RET")
+            self._at(t); self.ir.op(RET)
         elif t.kind == "KW" and t.text == "break":
-            self.consume("KW","break"); self.ir.emit("LOOP_BREAK")
+            self.consume("KW","break"); self._at(t); self.ir.op(LOOP_BREAK)
         elif t.kind == "KW" and t.text == "continue":
-            self.consume("KW","continue"); self.ir.emit("LOOP_CONTINUE")
+            self.consume("KW","continue"); self._at(t); self.ir.op(LOOP_CONTINUE)
         elif t.kind == "KW" and t.text == "if":
-            self.consume("KW","if"); self.expr(); self.ir.emit("IF_BEGIN")
+            self.consume("KW","if"); self.expr(); self._at(t); self.ir.op(IF_BEGIN)
             self.consume("OP","{"); self.scope_enter()
             while not (self.la().kind == "OP" and self.la().text == "}"):
                 self.stmt()
             self.consume("OP","}")
             if self.la().kind == "KW" and self.la().text == "else":
-                self.ir.emit("IF_ELSE")
+                self.ir.op(IF_ELSE)
                 self.consume("KW","else"); self.consume("OP","{"); self.scope_enter()
                 while not (self.la().kind == "OP" and self.la().text == "}"):
                     self.stmt()
                 self.consume("OP","}"); self.scope_exit()
-            self.ir.emit("IF_END"); self.scope_exit()
+            self.ir.op(IF_END); self.scope_exit()
         elif t.kind == "KW" and t.text == "while":
-            self.consume("KW","while"); self.expr(); self.ir.emit("LOOP_BEGIN")
+            self.consume("KW","while"); self.ir.op(LOOP_HEAD); self.expr(); self._at(t); self.ir.op(LOOP_BEGIN)
             self.consume("OP","{"); self.scope_enter()
             while not (self.la().kind == "OP" and self.la().text == "}"):
                 self.stmt()
-            self.consume("OP","}"); self.scope_exit(); self.ir.emit("LOOP_END")
+            self.consume("OP","}"); self.scope_exit(); self._at(t); self.ir.op(LOOP_END)
         elif t.kind == "KW" and t.text == "for":
             self.consume("KW","for"); self.consume("OP","(")
             if self.la().kind == "ID" and self.la2().kind == "KW" and self.la2().text == "in":
+                # Range-for lowering; loops, reductions, parallel and memory
+                # match this shape:
+                #   <a> <b> [<s> BIND_CONST __for_step_i]  BIND_CONST __for_end_i  BIND_MUT i
+                #   [FOR_HINT a b s inc]   if a, b and s are single integer literals
+                #   LOOP_HEAD  LOAD i  LOAD __for_end_i  CMP_*  LOOP_BEGIN
+                #   SCOPE_ENTER k  RANGE_BEGIN k  <body>  RANGE_END k  SCOPE_EXIT k
+                #   LOAD i  (LITERAL_I64 s | LOAD __for_step_i)  ADD  STORE i  LOOP_END
+                # CMP_* is CMP_LT (CMP_LE for `..=`) for a literal step >= 0 or
+                # none (s = 1), CMP_GT/CMP_GE for a negative one. A computed
+                # step is bound as __for_step_i and compared by its sign,
+                # `(i - end) * step < 0`: LOAD i  LOAD __for_end_i  SUB
+                # LOAD __for_step_i  MUL  LITERAL_I64 0  CMP_LT|CMP_LE. Trace
+                # and hook opcodes may sit among the bound expressions.
                 var = self.consume("ID").text; self.consume("KW","in")
-                a_tok = self.la(); self.expr()
+                a_tok = self._int_literal("..", "..="); self.expr()
                 inclusive = False
                 if self.la().kind == "OP" and self.la().text == "..=":
                     self.consume("OP","..="); inclusive = True
                 else:
                     self.consume("OP","..")
-                b_tok = self.la(); self.expr()
+                b_tok = self._int_literal(";", ")"); self.expr()
                 step_expr_present = False; s_tok = None
                 if self.la().kind == "OP" and self.la().text == ";":
-                    self.consume("OP",";"); self.consume("KW","step"); s_tok = self.la(); self.expr(); step_expr_present = True
-                # bind start->var, end->hidden
-                self.ir.emit("BIND_MUT", var)
+                    self.consume("OP",";"); self.consume("KW","step"); s_tok = self._int_literal(")")
+                    s_start = self.ir.mark(); self.expr(); step_expr_present = True
+                    if s_tok is not None: self.ir.cut(s_start)  # literal step is re-emitted inline below
+                    else: self.ir.unmark()
+                # bind hidden step/end, then start->var (popped in reverse push order)
+                step_marker = f"__for_step_{var}"; self._at(t)
+                if step_expr_present and s_tok is None:
+                    self.ir.op_str(BIND_CONST, step_marker)
                 end_marker = f"__for_end_{var}"
-                self.ir.emit("BIND_CONST", end_marker)
-                # FOR_HINT if literals
-                a_is_int = a_tok.kind == "INT"; b_is_int = b_tok.kind == "INT"; s_is_int = (not step_expr_present) or (s_tok.kind == "INT")
-                if a_is_int and b_is_int and s_is_int:
+                self.ir.op_str(BIND_CONST, end_marker)
+                self.ir.op_str(BIND_MUT, var)
+                # FOR_HINT if every bound is a single integer literal
+                s_is_int = (not step_expr_present) or s_tok is not None
+                if a_tok is not None and b_tok is not None and s_is_int:
                     aval = int(a_tok.text); bval = int(b_tok.text); sval = int(s_tok.text) if step_expr_present else 1
-                    self.ir.emit("FOR_HINT", aval, bval, sval, 1 if inclusive else 0)
+                    self.ir.op_for_hint(FOR_HINT, aval, bval, sval, 1 if inclusive else 0)
                 # cond
-                self.ir.emit("LOAD", var); self.ir.emit("LOAD", end_marker)
+                self.ir.op(LOOP_HEAD)
+                self.ir.op_str(LOAD, var); self.ir.op_str(LOAD, end_marker)
                 if not step_expr_present or (s_is_int and int(s_tok.text) >= 0):
-                    self.ir.emit("CMP_LE" if inclusive else "CMP_LT")
+                    self.ir.op(_CMP["<="] if inclusive else _CMP["<"])
+                elif s_is_int:
+                    self.ir.op(_CMP[">="] if inclusive else _CMP[">"])
                 else:
-                    self.ir.emit("CMP_GE" if inclusive else "CMP_GT")
-                self.ir.emit("LOOP_BEGIN")
+                    # the step's sign is known only at run time: (var - end) * step < 0
+                    self.ir.op(_ARITH["-"]); self.ir.op_str(LOAD, step_marker); self.ir.op(_ARITH["*"])
+                    self.ir.op_int(LITERAL_I64, 0); self.ir.op(_CMP["<="] if inclusive else _CMP["<"])
+                self.ir.op(LOOP_BEGIN)
                 self.consume("OP",")")
                 self.consume("OP","{"); self.scope_enter()
                 while not (self.la().kind == "OP" and self.la().text == "}"):
                     self.stmt()
                 self.consume("OP","}"); self.scope_exit()
                 # step
-                self.ir.emit("LOAD", var)
+                self._at(t); self.ir.op_str(LOAD, var)
                 if step_expr_present:
-                    if s_is_int: self.ir.emit("LITERAL_I64", int(s_tok.text))
-                    else: self.ir.emit("LITERAL_I64", 1)
+                    if s_is_int: self.ir.op_int(LITERAL_I64, int(s_tok.text))
+                    else: self.ir.op_str(LOAD, step_marker)
                 else:
-                    self.ir.emit("LITERAL_I64", 1)
-                self.ir.emit("ADD"); self.ir.emit("STORE", var)
-                self.ir.emit("LOOP_END")
+                    self.ir.op_int(LITERAL_I64, 1)
+                self.ir.op(_ARITH["+"]); self.ir.op_str(STORE, var)
+                self.ir.op(LOOP_END)
             else:
                 # classic
                 if not (self.la().kind == "OP" and self.la().text == ";"):
                     self.stmt_simple()
                 self.consume("OP",";")
-                self.expr(); self.ir.emit("LOOP_BEGIN")
+                self._at(t); self.ir.op(LOOP_HEAD); self.expr(); self._at(t); self.ir.op(LOOP_BEGIN)
                 self.consume("OP",";")
-                step_start = len(self.ir.code); self.stmt_simple()
-                step_ir = self.ir.code[step_start:]; del self.ir.code[step_start:]
+                step_start = self.ir.mark(); self.stmt_simple()
+                step_ir, step_lines = self.ir.cut(step_start)
                 self.consume("OP",")")
                 self.consume("OP","{"); self.scope_enter()
                 while not (self.la().kind == "OP" and self.la().text == "}"):
                     self.stmt()
                 self.consume("OP","}"); self.scope_exit()
-                self.ir.code.extend(step_ir); self.ir.emit("LOOP_END")
+                self.ir.extend(step_ir, step_lines); self._at(t); self.ir.op(LOOP_END)
         elif t.kind == "ID":
             if self.la2().kind == "OP" and self.la2().text == "(":
                 name = self.consume("ID").text; self.consume("OP","(")
@@ -188,22 +263,22 @@ class Parser:
                     args.append(self.expr_value())
                     while self.la().kind == "OP" and self.la().text == ",":
                         self.consume("OP",","); args.append(self.expr_value())
-                self.consume("OP",")"); self.ir.emit("CALL", name, len(args))
+                self.consume("OP",")"); self._at(t); self.ir.op_call(CALL, name, len(args))
             else:
-                name = self.consume("ID").text; self.consume("OP","="); self.expr(); self.ir.emit("STORE", name)
+                name = self.consume("ID").text; self.consume("OP","="); self.expr(); self._at(t); self.ir.op_str(STORE, name)
         else:
             raise SyntaxError(f"Invalid statement at {t.start}")
         self._rule_exit("stmt")
 
     def stmt_simple(self):
-        t = self.la()
+        t = self.la(); self._at(t)
         if t.kind == "KW" and t.text == "let":
             self.consume("KW","let")
             mut = False
             if self.la().kind == "KW" and self.la().text == "mut":
                 self.consume("KW","mut"); mut = True
             name = self.consume("ID").text; self.consume("OP","="); self.expr()
-            self.ir.emit("BIND_MUT" if mut else "BIND_CONST", name)
+            self._at(t); self.ir.op_str(BIND_MUT if mut else BIND_CONST, name)
         elif t.kind == "ID" and self.la2().kind == "OP" and self.la2().text == "(":
             name = self.consume("ID").text; self.consume("OP","(")
             args = []
@@ -211,57 +286,86 @@ class Parser:
                 args.append(self.expr_value())
                 while self.la().kind == "OP" and self.la().text == ",":
                     self.consume("OP",","); args.append(self.expr_value())
-            self.consume("OP",")"); self.ir.emit("CALL", name, len(args))
+            self.consume("OP",")"); self._at(t); self.ir.op_call(CALL, name, len(args))
         else:
-            name = self.consume("ID").text; self.consume("OP","="); self.expr(); self.ir.emit("STORE", name)
+            name = self.consume("ID").text; self.consume("OP","="); self.expr(); self._at(t); self.ir.op_str(STORE, name)
 
     def expr(self):
         self._rule_enter("expr")
-        self.term()
+        self.arith()
         if self.la().kind == "OP" and self.la().text in (">",">=","<","<=","==","!="):
-            op = self.consume("OP").text; self.term(); self._cmp_emit(op)
+            op = self.consume("OP").text; self.arith(); self._cmp_emit(op)
         self._rule_exit("expr")
 
+    def arith(self):
+        self.factor()
+        while self.la().kind == "OP" and self.la().text in ("+","-"):
+            op = self.consume("OP").text; self.factor(); self.ir.op(_ARITH[op])
+
+    def factor(self):
+        self.term()
+        while self.la().kind == "OP" and self.la().text in ("*","/","%"):
+            op = self.consume("OP").text; self.term(); self.ir.op(_ARITH[op])
+
     def expr_value(self): self.expr(); return True
 
     def term(self):
         t = self.la()
         if t.kind == "INT":
-            self.consume("INT"); self.ir.emit("LITERAL_I64", int(t.text), src_span=(t.start,t.end))
+            self.consume("INT"); self.ir.op_int(LITERAL_I64, int(t.text))
         elif t.kind == "STR":
-            self.consume("STR"); s = t.text[1:-1]; self.ir.emit("LITERAL_STR", s, src_span=(t.start,t.end))
+            self.consume("STR"); s = t.text[1:-1]; self.ir.op_str(LITERAL_STR, s)
         elif t.kind == "ID":
-            self.consume("ID"); self.ir.emit("LOAD", t.text, src_span=(t.start,t.end))
+            self.ir.loc(t.line, t.col); self.consume("ID"); self.ir.op_str(LOAD, t.text)
         elif t.kind == "OP" and t.text == "(":
             self.consume("OP","("); self.expr(); self.consume("OP",")")
         else:
             raise SyntaxError(f"Unexpected token {t.kind} {t.text!r} at {t.start}")
 
+    def _int_literal(self, *ends: str) -> Optional[Tok]:
+        # The INT token at la() if it is the whole expression, i.e. one of
+        # `ends` follows it; range bounds and steps are otherwise evaluated.
+        t = self.la(); nxt = self.la2()
+        return t if t.kind == "INT" and nxt.kind == "OP" and nxt.text in ends else None
+
+    def _at(self, t: Tok):
+        self.ir.loc(t.line, t.col)
+
     def _cmp_emit(self, op: str):
-        m = {">":"CMP_GT", ">=":"CMP_GE", "<":"CMP_LT", "<=":"CMP_LE", "==":"CMP_EQ", "!=":"CMP_NE"}[op]
-        self.ir.emit(m)
+        self.ir.op(_CMP[op])
 
     def scope_enter(self):
         Parser._scope_id += 1; sid = Parser._scope_id
         self.scope_stack.append(Scope(sid))
-        self.ir.emit("SCOPE_ENTER", sid); self.ir.emit("RANGE_BEGIN", sid)
+        self.ir.op_int(SCOPE_ENTER, sid); self.ir.op_int(RANGE_BEGIN, sid)
 
     def scope_exit(self):
         if not self.scope_stack: raise RuntimeError("scope underflow")
         sid = self.scope_stack.pop().id
-        self.ir.emit("RANGE_END", sid); self.ir.emit("SCOPE_EXIT", sid)
+        self.ir.op_int(RANGE_END, sid); self.ir.op_int(SCOPE_EXIT, sid)
 
     def _rule_enter(self, name: str):
-        start = self.la().start
-        pre, _ = HOOKS.get(name, (None,None))
-        if pre: self.ir.emit("HOOK_PRE_RULE"); self.run_hook(pre, name)
-        self.ir.emit("TRACE_MARK", name, start)
+        if name in self._pre:
+            if self.instrument: self.ir.op(HOOK_PRE_RULE)
+            fn = self._pre[name]
+            if fn is not None: fn(self, name)
+        if self.instrument: self.ir.op(TRACE_MARK)
 
     def _rule_exit(self, name: str):
-        _, post = HOOKS.get(name, (None,None))
-        if post: self.ir.emit("HOOK_POST_RULE"); self.run_hook(post, name)
+        if name in self._post:
+            if self.instrument: self.ir.op(HOOK_POST_RULE)
+            fn = self._post[name]
+            if fn is not None: fn(self, name)
 
-def compile_to_bytes(src: str, hooks=None) -> bytes:
-    p = Parser(src, hooks=hooks)
+def compile_to_bytes(src: str, hooks=None, module: Optional[str]=None, instrument: bool=True) -> bytes:
+    p = Parser(src, hooks=hooks, module=module, instrument=instrument)
     ir = p.parse()
     return ir.to_blob()
+
+def compile_file(src_path: str, out_path: str, hooks=None, spill_threshold: int = 1 << 20, module: Optional[str]=None, instrument: bool=True):
+    """Compile with bounded memory: the source is lexed in chunks, code spills
+    to a temp file past `spill_threshold` bytes and is streamed into the blob."""
+    with open(src_path, "r", encoding="utf-8") as f:
+        ir = Parser(f, hooks=hooks, spill_threshold=spill_threshold, module=module, instrument=instrument).parse()
+    with open(out_path, "wb") as out:
+        ir.write_blob(out)
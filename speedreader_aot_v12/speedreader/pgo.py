@@ -0,0 +1,190 @@
+
+"""Profile-guided optimization: `collect` records a profile of a run and
+`apply_profile` inlines hot leaf calls and lays out hot IF arms first
+(README, "Profile-guided optimization").
+"""
+from __future__ import annotations
+import json
+from typing import Dict, List, Optional, Tuple
+from .emitter import _load_blob, load_sections
+from .debuginfo import LINES, decode_lines
+from .ir import IR
+from .linker import _SCOPED, emit_insn, link_info
+from .opcodes import CODES, BIND_CONST
+
+HOT = 64          # executions before a call site or branch counts as hot
+INLINE_MAX = 48   # callee body instructions
+PAIRS = 32        # opcode pairs kept in a profile
+
+_NEGATE = {"CMP_GT": "CMP_LE", "CMP_LE": "CMP_GT", "CMP_GE": "CMP_LT", "CMP_LT": "CMP_GE", "CMP_EQ": "CMP_NE", "CMP_NE": "CMP_EQ"}
+_NOT_LEAF = {"CALL", "FN_LABEL", "RET", "JMP", "JMP_IF_FALSE", "HALT"}
+
+class ProfileError(Exception): pass
+
+def collect(profiler, vm) -> dict:
+    """The PGO profile of a finished `Profiler.run` over `vm`'s code."""
+    if vm.wide:
+        raise ProfileError("Profiles are recorded on compact code")
+    from .verifier import code_hash
+    pairs = sorted(profiler.pairs.items(), key=lambda kv: -kv[1])[:PAIRS]
+    return {
+        "code": code_hash(vm.strings, vm.code),
+        "calls": {str(ip): n for ip, n in profiler.call_sites.items()},
+        "loops": {str(ip - 1): n for ip, n in profiler.back_edges.items()},
+        "branches": {str(ip): list(tc) for ip, tc in profiler.branches.items()},
+        "pairs": {f"{a} {b}": n for (a, b), n in pairs},
+    }
+
+def load_profile(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _leaf(fname: str, params: List[str], body, strings: List[str]) -> Optional[Dict[str, str]]:
+    """Renaming of the leaf function's own names, or None if it cannot be inlined."""
+    if len(body) > INLINE_MAX or any(name in _NOT_LEAF for _, name, _ in body):
+        return None
+    bound = set(params)
+    bound.update(strings[args[0]] for _, name, args in body if name in ("BIND_CONST", "BIND_MUT"))
+    # Every use of a bound name must follow its binding in a region that is
+    # still open; regions are IF arms and loops.
+    live = {p: 0 for p in params}; regions = [0]; fresh = 1
+    for _, name, args in body:
+        if name in ("IF_BEGIN", "LOOP_HEAD"):
+            regions.append(fresh); fresh += 1
+        elif name == "IF_ELSE":
+            regions[-1] = fresh; fresh += 1
+        elif name in ("IF_END", "LOOP_END"):
+            regions.pop()
+        elif name in ("BIND_CONST", "BIND_MUT"):
+            live[strings[args[0]]] = regions[-1]
+        elif name in ("LOAD", "STORE"):
+            s = strings[args[0]]
+            if s in bound and live.get(s) not in regions:
+                return None
+    return {s: _mangle(fname, s) for s in bound}
+
+def _mangle(fname: str, name: str) -> str:
+    # A range-for's hidden bounds stay `__for_end_<var>` for the loop matchers.
+    for prefix in ("__for_end_", "__for_step_"):
+        if name.startswith(prefix):
+            return prefix + _mangle(fname, name[len(prefix):])
+    return f"{fname}${name}"
+
+def _functions(insns, strings: List[str]) -> Dict[str, tuple]:
+    """Inlinable functions: name -> (params, first body index, body length,
+    renaming); the body excludes the function scope's markers."""
+    out = {}
+    for j, (at, name, args) in enumerate(insns):
+        if name != "FN_LABEL": continue
+        pc = args[1]
+        if args[2 + pc] or j + 1 >= len(insns) or insns[j + 1][1] != "SCOPE_ENTER":
+            continue   # captures, or not a function body the parser emits
+        sid = insns[j + 1][2][0]
+        for k in range(j + 2, len(insns)):
+            if insns[k][1] == "SCOPE_EXIT" and insns[k][2][0] == sid: break
+        else:
+            continue
+        if k + 1 >= len(insns) or insns[k + 1][1] != "RET" or insns[j + 2][1] != "RANGE_BEGIN" or insns[k - 1][1] != "RANGE_END":
+            continue
+        fname = strings[args[0]]; params = [strings[x] for x in args[2:2 + pc]]
+        body = insns[j + 3:k - 1]
+        rename = _leaf(fname, params, body, strings)
+        if rename is not None:
+            out[fname] = (params, j + 3, len(body), rename)
+    return out
+
+def _framed(insns, j: int, mid: Optional[int], end: Optional[int]) -> bool:
+    """IF_BEGIN at j has an else arm and the parser's scope layout:
+    IF_BEGIN {enter a} then IF_ELSE {enter b} else {exit b} IF_END {exit a}."""
+    if mid is None or end is None: return False
+    names = lambda lo, hi: tuple(name for _, name, _ in insns[lo:hi])
+    return (names(j + 1, j + 3) == names(mid + 1, mid + 3) == ("SCOPE_ENTER", "RANGE_BEGIN")
+            and names(end - 2, end) == ("RANGE_END", "SCOPE_EXIT"))
+
+def apply_profile(blob: bytes, profile: dict) -> bytes:
+    """Inline hot leaf calls and lay out hot IF arms in `blob` (compact code
+    the profile was recorded on)."""
+    from .verifier import _decode, code_hash
+    meta, code = _load_blob(blob)
+    strings = meta.get("strings", [])
+    if profile.get("code") != code_hash(strings, code):
+        raise ProfileError("Profile was recorded on different code (record it with `profile --opt --pgo-out`)")
+    insns = _decode(code)
+    sections = load_sections(blob)
+    calls = {int(k): v for k, v in profile.get("calls", {}).items()}
+    branches = {int(k): v for k, v in profile.get("branches", {}).items()}
+    functions = _functions(insns, strings)
+
+    # Source position of every instruction, so inlined bodies keep theirs.
+    lines = decode_lines(sections[LINES]) if LINES in sections else []
+    locs: List[Optional[Tuple[int, int]]] = []; k = 0; cur = None
+    for at, _, _ in insns:
+        while k < len(lines) and lines[k][0] <= at - 1:
+            cur = lines[k][1:]; k += 1
+        locs.append(cur)
+    # Matching IF_ELSE / IF_END of every IF_BEGIN.
+    arms: Dict[int, list] = {}; open_ifs: List[int] = []
+    for j, (_, name, _) in enumerate(insns):
+        if name == "IF_BEGIN": arms[j] = [None, None]; open_ifs.append(j)
+        elif name == "IF_ELSE" and open_ifs: arms[open_ifs[-1]][0] = j
+        elif name == "IF_END" and open_ifs: arms[open_ifs.pop()][1] = j
+    top = max([args[0] for _, name, args in insns if CODES[name] in _SCOPED] or [0])
+    # Call sites to inline; functions left without callers are dropped
+    # (unless a library exports them).
+    inlined = set(); remaining: Dict[str, int] = {}
+    for j, (at, name, args) in enumerate(insns):
+        if name != "CALL": continue
+        fname = strings[args[0]]; target = functions.get(fname)
+        if calls.get(at - 1, 0) >= HOT and target is not None and len(target[0]) == args[1]:
+            inlined.add(j)
+        else:
+            remaining[fname] = remaining.get(fname, 0) + 1
+    exports = set(link_info(blob).get("exports", ()))
+    dead = {f for f in functions if not remaining.get(f) and f not in exports}
+
+    ir = IR()
+    ir.header.update((key, meta[key]) for key in ("instrumented",) if key in meta)
+    ir.sections.update((name, raw) for name, raw in sections.items() if name != LINES)
+
+    def emit(j: int, name: Optional[str] = None, rename: Dict[str, str] = {}, scopes: Optional[Dict[int, int]] = None):
+        at, op_name, args = insns[j]
+        if locs[j] is not None: ir.loc(*locs[j])
+        emit_insn(ir, CODES[name or op_name], args, strings, rename, scopes.__getitem__ if scopes is not None else None)
+
+    def inline(j: int, params: List[str], first: int, n: int, rename: Dict[str, str]):
+        # The VM ignores scope markers, so the copy leaves out the function
+        # scope's and renumbers the rest.
+        nonlocal top
+        scopes: Dict[int, int] = {}
+        for _, name, args in insns[first:first + n]:
+            if CODES[name] in _SCOPED and args[0] not in scopes:
+                top += 1; scopes[args[0]] = top
+        if locs[j] is not None: ir.loc(*locs[j])
+        for p in reversed(params):
+            ir.op_str(BIND_CONST, rename[p])
+        region(first, first + n, rename, scopes)
+
+    def region(lo: int, hi: int, rename: Dict[str, str] = {}, scopes: Optional[Dict[int, int]] = None):
+        j = lo
+        while j < hi:
+            at, name, args = insns[j]
+            if j in inlined:
+                inline(j, *functions[strings[args[0]]]); j += 1; continue
+            if name == "FN_LABEL" and strings[args[0]] in dead:
+                _, first, n, _ = functions[strings[args[0]]]
+                j = first + n + 3; continue   # past its RANGE_END, SCOPE_EXIT and RET
+            if name in _NEGATE and j + 1 < hi and insns[j + 1][1] == "IF_BEGIN":
+                then, other = branches.get(insns[j + 1][0] - 1, (0, 0))
+                mid, end = arms[j + 1]
+                if then > other and then + other >= HOT and _framed(insns, j + 1, mid, end):
+                    # Swap the statements; the scopes around them stay put.
+                    emit(j, _NEGATE[name], rename, scopes)
+                    for b in range(j + 1, j + 4): emit(b, None, rename, scopes)
+                    region(mid + 3, end - 2, rename, scopes)
+                    for b in range(mid, mid + 3): emit(b, None, rename, scopes)
+                    region(j + 4, mid, rename, scopes)
+                    j = end - 2; continue
+            emit(j, None, rename, scopes); j += 1
+
+    region(0, len(insns))
+    return ir.to_blob()
@@ -0,0 +1,129 @@
+
+from __future__ import annotations
+import time
+from typing import Dict, List, Tuple
+from .opcodes import NAMES
+
+MAIN_FRAME = "<main>"
+
+class Profiler:
+    """Per-opcode, per-function and loop back-edge statistics for one VM run.
+
+    Attach with `VM(blob, profiler=Profiler())`; the VM then drives execution
+    through `Profiler.run`, timing each `VM.step`. Without a profiler the VM's
+    loop is untouched, so disabled profiling costs nothing.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.op_counts: Dict[str,int] = {}
+        self.op_time: Dict[str,float] = {}
+        self.fn_calls: Dict[str,int] = {MAIN_FRAME: 1}
+        self.fn_incl: Dict[str,float] = {}
+        self.fn_excl: Dict[str,float] = {}
+        self.back_edges: Dict[int,int] = {}   # loop head ip -> taken back-edges
+        self.stacks: Dict[Tuple[str,...],float] = {}
+        self.line_counts: Dict[int,int] = {}   # source line -> executed instructions
+        self.line_time: Dict[int,float] = {}
+        self.loop_lines: Dict[int,int] = {}     # loop head ip -> source line
+        # For profile-guided optimization (see pgo.py)
+        self.call_sites: Dict[int,int] = {}     # CALL ip -> calls
+        self.branches: Dict[int,List[int]] = {}  # IF_BEGIN ip -> [then taken, else taken]
+        self.pairs: Dict[Tuple[str,str],int] = {}   # (opcode, next opcode) -> count
+
+    def run(self, vm):
+        code = vm.ops; n = len(code); clock = self.clock; step = vm.step
+        opname = NAMES
+        entries = {m["ip"]: f for f, m in vm.fn_meta.items()}
+        counts = self.op_counts; times = self.op_time; stacks = self.stacks
+        ip_counts: Dict[int,int] = {}; ip_time: Dict[int,float] = {}
+        frames: List[list] = [[MAIN_FRAME, 0.0, 0.0]]   # name, own time, children time
+        path: Tuple[str,...] = (MAIN_FRAME,)
+        branches = self.branches; pairs = self.pairs; prev = None
+        while vm.ip < n:
+            ip = vm.ip; name = opname[code[ip]]; depth = len(vm.callstack)
+            t0 = clock(); more = step(); dt = clock() - t0
+            ip_counts[ip] = ip_counts.get(ip, 0) + 1
+            ip_time[ip] = ip_time.get(ip, 0.0) + dt
+            counts[name] = counts.get(name, 0) + 1
+            times[name] = times.get(name, 0.0) + dt
+            stacks[path] = stacks.get(path, 0.0) + dt
+            frames[-1][1] += dt
+            if prev is not None:
+                pair = (prev, name); pairs[pair] = pairs.get(pair, 0) + 1
+            prev = name
+            if name == "IF_BEGIN":
+                b = branches.get(ip)
+                if b is None: b = branches[ip] = [0, 0]
+                b[vm.ip != ip + 1] += 1
+            if len(vm.callstack) > depth:
+                self.call_sites[ip] = self.call_sites.get(ip, 0) + 1
+                fname = entries.get(vm.ip, "?")
+                self.fn_calls[fname] = self.fn_calls.get(fname, 0) + 1
+                frames.append([fname, 0.0, 0.0]); path = path + (fname,)
+            elif len(vm.callstack) < depth:
+                self._close(frames.pop(), frames); path = path[:-1]
+            elif name == "LOOP_END" or name == "LOOP_CONTINUE":
+                self.back_edges[vm.ip] = self.back_edges.get(vm.ip, 0) + 1
+            if not more:
+                break
+        while frames:
+            self._close(frames.pop(), frames)
+        # Attribute per-instruction totals to source lines via the blob's line table.
+        for ip, c in ip_counts.items():
+            pos = vm.source_pos(ip)
+            if pos is None: continue
+            self.line_counts[pos[0]] = self.line_counts.get(pos[0], 0) + c
+            self.line_time[pos[0]] = self.line_time.get(pos[0], 0.0) + ip_time[ip]
+        for ip in self.back_edges:
+            pos = vm.source_pos(ip - 1)
+            if pos is not None: self.loop_lines[ip] = pos[0]
+
+    def _close(self, frame, parents):
+        fname, own, child = frame
+        self.fn_incl[fname] = self.fn_incl.get(fname, 0.0) + own + child
+        self.fn_excl[fname] = self.fn_excl.get(fname, 0.0) + own
+        if parents:
+            parents[-1][2] += own + child
+
+    def to_dict(self) -> dict:
+        return {
+            "opcodes": {k: {"count": self.op_counts[k], "time": self.op_time[k]} for k in self.op_counts},
+            "functions": {k: {"calls": self.fn_calls.get(k, 0), "incl": self.fn_incl[k], "excl": self.fn_excl[k]} for k in self.fn_incl},
+            "loops": {str(k): v for k, v in self.back_edges.items()},
+            "lines": {str(k): {"count": self.line_counts[k], "time": self.line_time[k]} for k in sorted(self.line_counts)},
+        }
+
+    def report(self) -> str:
+        out = [f"{'opcode':<16}{'count':>12}{'total ms':>12}{'avg ns':>10}"]
+        for name in sorted(self.op_counts, key=lambda k: -self.op_time[k]):
+            c = self.op_counts[name]; t = self.op_time[name]
+            out.append(f"{name:<16}{c:>12}{t*1e3:>12.3f}{t/c*1e9:>10.0f}")
+        out.append("")
+        out.append(f"{'function':<16}{'calls':>12}{'incl ms':>12}{'excl ms':>10}")
+        for name in sorted(self.fn_incl, key=lambda k: -self.fn_incl[k]):
+            out.append(f"{name:<16}{self.fn_calls.get(name, 0):>12}{self.fn_incl[name]*1e3:>12.3f}{self.fn_excl[name]*1e3:>10.3f}")
+        if self.back_edges:
+            out.append("")
+            out.append(f"{'loop head ip':<16}{'back-edges':>12}{'line':>12}")
+            for ip, c in sorted(self.back_edges.items(), key=lambda kv: -kv[1]):
+                out.append(f"{ip:<16}{c:>12}{self.loop_lines.get(ip, '?'):>12}")
+        if self.pairs:
+            out.append("")
+            out.append(f"{'opcode pair':<32}{'count':>12}")
+            for (a, b), c in sorted(self.pairs.items(), key=lambda kv: -kv[1])[:16]:
+                out.append(f"{a + ' ' + b:<32}{c:>12}")
+        if self.line_time:
+            out.append("")
+            out.append(f"{'line':<16}{'count':>12}{'total ms':>12}")
+            for line in sorted(self.line_time, key=lambda k: -self.line_time[k]):
+                out.append(f"{line:<16}{self.line_counts[line]:>12}{self.line_time[line]*1e3:>12.3f}")
+        return "\n".join(out)
+
+    def collapsed(self) -> str:
+        """Collapsed stacks (`main;f;g <microseconds>`) for flame graph tools."""
+        lines = []
+        for path, t in sorted(self.stacks.items()):
+            us = int(round(t * 1e6))
+            if us:
+                lines.append(f"{';'.join(path)} {us}")
+        return "\n".join(lines) + ("\n" if lines else "")
@@ -0,0 +1,272 @@
+
+"""Closed-form execution of integer reduction loops over a counted range,
+where every target evolves as `x' = A*x + B` (README, "Loop folding"). The
+range-for lowering is described in `parser.Parser.stmt`.
+"""
+from __future__ import annotations
+from math import comb, prod
+from typing import Dict, List, Optional, Sequence, Tuple
+from .memory import size_of
+from .cell import Cell
+from .opcodes import (LOAD, STORE, LITERAL_I64, ADD, SUB, MUL, CMP_LT, CMP_LE, CMP_GT, CMP_GE,
+    LOOP_BEGIN, LOOP_END, SCOPE_ENTER, SCOPE_EXIT, RANGE_BEGIN, RANGE_END,
+    NOP, TRACE_START, TRACE_MARK, TRACE_END, HOOK_PRE_RULE, HOOK_POST_RULE)
+
+# Polynomials are {monomial: coeff}; a monomial is a sorted tuple of names.
+Poly = Dict[Tuple[str, ...], int]
+
+_SKIP = {NOP, TRACE_START, TRACE_MARK, TRACE_END, HOOK_PRE_RULE, HOOK_POST_RULE}
+_VARINT = {LITERAL_I64, SCOPE_ENTER, SCOPE_EXIT, RANGE_BEGIN, RANGE_END}
+_NAMED = {LOAD, STORE}
+_BARE = {ADD, SUB, MUL, CMP_LT, CMP_LE, CMP_GT, CMP_GE, LOOP_BEGIN, LOOP_END}
+_FLIP = {CMP_LT: CMP_GT, CMP_LE: CMP_GE}
+
+def _decode(code: bytes, strings: List[str], i: int, end: int) -> Optional[List[tuple]]:
+    # (op, immediate) for [i, end), or None at the first opcode a reduction
+    # cannot contain.
+    out = []
+    def rd():
+        nonlocal i
+        shift = result = 0
+        while True:
+            b = code[i]; i += 1
+            result |= (b & 0x7F) << shift; shift += 7
+            if b < 128: break
+        return result - (1 << shift) if b & 0x40 else result
+    while i < end:
+        op = code[i]; i += 1
+        if op in _SKIP: continue
+        if op in _BARE: out.append((op, None))
+        elif op in _VARINT: out.append((op, rd()))
+        elif op in _NAMED:
+            if code[i] != 254: return None
+            i += 1; k = rd()
+            if not 0 <= k < len(strings): return None
+            out.append((op, strings[k]))
+        else:
+            return None
+    return out
+
+def _decode_wide(w, strings: List[str], i: int, end: int) -> Optional[List[tuple]]:
+    # _decode over wide code (see wide.py): i, end are instruction indices.
+    out = []
+    for k in range(i, end):
+        op = w[3*k]; a = w[3*k+1]
+        if op in _SKIP: continue
+        if op in _BARE: out.append((op, None))
+        elif op in _VARINT: out.append((op, a))
+        elif op in _NAMED:
+            if not 0 <= a < len(strings): return None
+            out.append((op, strings[a]))
+        else:
+            return None
+    return out
+
+def _add(p: Poly, q: Poly, sign: int = 1) -> Poly:
+    r = dict(p)
+    for m, c in q.items():
+        c = r.get(m, 0) + sign * c
+        if c: r[m] = c
+        else: r.pop(m, None)
+    return r
+
+def _mul(p: Poly, q: Poly) -> Poly:
+    r: Poly = {}
+    for m1, c1 in p.items():
+        for m2, c2 in q.items():
+            m = tuple(sorted(m1 + m2)); c = r.get(m, 0) + c1 * c2
+            if c: r[m] = c
+            else: r.pop(m, None)
+    return r
+
+def _split(p: Poly, x: str) -> Optional[Tuple[Poly, Poly]]:
+    # p = A*x + B with x in neither; None if x appears squared.
+    a: Poly = {}; b: Poly = {}
+    for m, c in p.items():
+        k = m.count(x)
+        if k > 1: return None
+        if k: a[tuple(s for s in m if s != x)] = c
+        else: b[m] = c
+    return a, b
+
+def _coeffs(p: Poly, var: str, vals: Dict[str, int]) -> List[int]:
+    # Univariate coefficients in `var`, other names substituted.
+    out: List[int] = []
+    for m, c in p.items():
+        d = 0
+        for s in m:
+            if s == var: d += 1
+            else: c *= vals[s]
+        out.extend([0] * (d + 1 - len(out)))
+        out[d] += c
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+def _horner(cs: List[int], x: int) -> int:
+    r = 0
+    for c in reversed(cs):
+        r = r * x + c
+    return r
+
+def _range_sum(cs: List[int], i0: int, s: int, n: int) -> int:
+    # sum(g(i0 + k*s) for k < n) for polynomial g: by forward differences of
+    # h(k) = g(i0 + k*s), sum = sum_j (delta^j h)(0) * C(n, j+1).
+    h = [_horner(cs, i0 + k * s) for k in range(len(cs))]
+    total = 0
+    for j in range(len(h)):
+        total += h[0] * comb(n, j + 1)
+        h = [h[k+1] - h[k] for k in range(len(h) - 1)]
+    return total
+
+def _trips(i0: int, end: int, s: int, cmp: int) -> Optional[int]:
+    """Iterations of `i = i0; while i <cmp> end: i += s`, None if unbounded."""
+    if cmp == CMP_LT:
+        if i0 >= end: return 0
+        return (end - i0 + s - 1) // s if s > 0 else None
+    if cmp == CMP_LE:
+        if i0 > end: return 0
+        return (end - i0) // s + 1 if s > 0 else None
+    if cmp == CMP_GT:
+        if i0 <= end: return 0
+        return (i0 - end - s - 1) // -s if s < 0 else None
+    if i0 < end: return 0
+    return (i0 - end) // -s + 1 if s < 0 else None
+
+class Reduction:
+    """One recognised loop, keyed by the ip after its LOOP_HEAD."""
+    __slots__ = ("var", "end", "step", "cmp", "signed", "updates", "names", "exit")
+
+    def __init__(self, var: str, end: str, step, cmp: int, updates: List[Tuple[str, Poly, Poly]], exit: int, signed: bool = False):
+        self.var = var; self.end = end
+        self.step = step   # int literal, or the hidden step binding's name
+        self.cmp = cmp
+        self.signed = signed   # compared by the step's sign: cmp holds for a positive step
+        self.updates = updates   # (target, A, B) with target' = A*target + B
+        names = {var, end} | ({step} if isinstance(step, str) else set())
+        for t, a, b in updates:
+            names.add(t)
+            for p in (a, b):
+                for m in p: names.update(m)
+        self.names = names
+        self.exit = exit   # ip after LOOP_END
+
+    def run(self, vm) -> bool:
+        """Apply the whole loop to `vm`'s variables; False (nothing changed)
+        when it must be interpreted instead."""
+        env_stack = vm.env_stack; mut_stack = vm.mut_stack
+        vals: Dict[str, int] = {}; cells = {}
+        for name in self.names:
+            for k in range(len(env_stack) - 1, -1, -1):
+                env = env_stack[k]
+                if name in env:
+                    v = env[name]; cells[name] = (env, mut_stack[k].get(name, False))
+                    if type(v) is Cell: v = v.value
+                    if type(v) is not int: return False
+                    vals[name] = v; break
+            else:
+                return False
+        if not (cells[self.var][1] and all(cells[t][1] for t, _, _ in self.updates)):
+            return False
+        var = self.var; i0 = vals[var]
+        s = self.step if type(self.step) is int else vals[self.step]
+        if self.signed and s <= 0:
+            if not s: return False
+            n = _trips(i0, vals[self.end], s, _FLIP[self.cmp])
+        else:
+            n = _trips(i0, vals[self.end], s, self.cmp)
+        if n is None or (vm.fuel is not None and vm.fuel < n):
+            return False
+        old = dict(vals)
+        if n:
+            for t, a, b in self.updates:
+                vals[t] = self._final(vals[t], a, b, i0, s, n, vals)
+        vals[var] = i0 + n * s
+        targets = [u[0] for u in self.updates] + [var]
+        if vm.arena is not None and not vm.arena.alloc(sum(size_of(vals[t]) - size_of(old[t]) for t in targets)):
+            return False   # interpreted, so the budget fails at the right statement
+        if vm.fuel is not None: vm.fuel -= n
+        for t in targets:
+            env = cells[t][0]; v = env[t]
+            if type(v) is Cell: v.value = vals[t]
+            else: env[t] = vals[t]
+        return True
+
+    def _final(self, x: int, a: Poly, b: Poly, i0: int, s: int, n: int, vals: Dict[str, int]) -> int:
+        # x after n trips: a map (A = 0), sum (A = 1), affine (A = c, B const)
+        # or product (B = 0) in closed form, else one pass over the range.
+        var = self.var
+        ca = _coeffs(a, var, vals); cb = _coeffs(b, var, vals)
+        if not any(ca):
+            return _horner(cb, i0 + (n - 1) * s)
+        if len(ca) == 1:
+            c = ca[0]
+            if c == 1:
+                return x + _range_sum(cb, i0, s, n)
+            if len(cb) <= 1:
+                b0 = cb[0] if cb else 0; cn = c ** n
+                return cn * x + b0 * (cn - 1) // (c - 1)
+        elif not any(cb):
+            if ca == [ca[0], 1]:   # A = i + c0: product of a range
+                return x * prod(range(i0 + ca[0], i0 + ca[0] + n * s, s))
+            return x * prod(_horner(ca, i0 + k * s) for k in range(n))
+        for k in range(n):
+            i = i0 + k * s
+            x = _horner(ca, i) * x + _horner(cb, i)
+        return x
+
+def _match(code, strings: List[str], head: int, end: int, wide: bool = False) -> Optional[Reduction]:
+    # A body of `x = <expr>` over ADD/SUB/MUL, literals and names, each
+    # target stored once and read only by its own statement.
+    ins = (_decode_wide if wide else _decode)(code, strings, head, end)
+    if ins is None or len(ins) < 15: return None
+    signed = ins[2][0] == SUB
+    if signed:   # LOAD i  LOAD end  SUB  LOAD step  MUL  LITERAL_I64 0  CMP_LT|CMP_LE
+        (o6, st0), (o7, _), (o8, zero), (cmp, _) = ins[3:7]
+        if not (o6 == LOAD and st0 == f"__for_step_{ins[0][1]}" and o7 == MUL and o8 == LITERAL_I64 and zero == 0 and cmp in _FLIP):
+            return None
+        del ins[2:6]
+    (o1, var), (o2, bound), (cmp, _), (o3, _), (o4, sid), (o5, sid2) = ins[:6]
+    if not (o1 == LOAD and o2 == LOAD and bound == f"__for_end_{var}" and cmp in (CMP_LT, CMP_LE, CMP_GT, CMP_GE)
+            and o3 == LOOP_BEGIN and o4 == SCOPE_ENTER and o5 == RANGE_BEGIN and sid == sid2):
+        return None
+    (r1, x1), (r2, x2), (l1, v1), (l2, st), (a1, _), (s1, v2), (le, _) = ins[-7:]
+    if not (r1 == RANGE_END and r2 == SCOPE_EXIT and x1 == x2 == sid and l1 == LOAD and v1 == var
+            and a1 == ADD and s1 == STORE and v2 == var and le == LOOP_END):
+        return None
+    if l2 == LITERAL_I64: step = st
+    elif l2 == LOAD and st == f"__for_step_{var}": step = st
+    else: return None
+    stack: List[Poly] = []; updates = []; stored = set()
+    for op, arg in ins[6:-7]:
+        if op == LITERAL_I64:
+            stack.append({(): arg} if arg else {})
+        elif op == LOAD:
+            stack.append({(arg,): 1})
+        elif op in (ADD, SUB, MUL) and len(stack) >= 2:
+            q = stack.pop(); p = stack.pop()
+            stack.append(_mul(p, q) if op == MUL else _add(p, q, 1 if op == ADD else -1))
+        elif op == STORE and len(stack) == 1 and arg != var and arg not in stored and not arg.startswith("__for_"):
+            stored.add(arg); updates.append((arg, stack.pop()))
+        else:
+            return None
+    if stack or not updates:
+        return None
+    out = []
+    for t, p in updates:
+        # each target may be read only by its own statement
+        if any(o != t and o in m for o in stored for m in p):
+            return None
+        ab = _split(p, t)
+        if ab is None: return None
+        out.append((t, ab[0], ab[1]))
+    return Reduction(var, bound, step, cmp, out, end, signed)
+
+def find_reductions(code, strings: List[str], loops: Sequence[Tuple[int, int]], wide: bool = False) -> Dict[int, Reduction]:
+    """Recognise reduction loops among `loops`, given as (ip after
+    LOOP_HEAD, ip after LOOP_END) pairs, in compact or wide code."""
+    found = {}
+    for head, end in loops:
+        r = _match(code, strings, head, end, wide)
+        if r is not None: found[head] = r
+    return found
@@ -0,0 +1,34 @@
+
+from __future__ import annotations
+import asyncio, heapq
+from typing import List, Optional, Sequence
+from .vm import VM
+
+async def run_many(vms: Sequence[VM], budget: int = 1000) -> List[Optional[BaseException]]:
+    """Run many VMs on the current event loop from a single task.
+
+    Each turn gives `budget` instructions to the VM with the fewest
+    instructions executed so far (round-robin for equal budgets), awaits its
+    sink's `drain()` if it has one, then yields to the loop. Returns one entry
+    per VM: None on success, else the exception it raised (or CancelledError
+    after `vm.cancel()`). Cancelling the calling task stops every VM.
+    """
+    results: List[Optional[BaseException]] = [None] * len(vms)
+    heap = [(vm.instructions, i) for i, vm in enumerate(vms)]
+    heapq.heapify(heap)
+    try:
+        while heap:
+            _, i = heapq.heappop(heap); vm = vms[i]
+            if vm.cancelled:
+                results[i] = asyncio.CancelledError(); continue
+            try:
+                more = vm.run_for(budget)
+            except Exception as e:
+                results[i] = e; more = False
+            drain = getattr(vm.out, "drain", None)
+            if drain is not None: await drain()
+            if more: heapq.heappush(heap, (vm.instructions, i))
+            await asyncio.sleep(0)
+    finally:
+        for vm in vms: vm.flush()
+    return results
@@ -0,0 +1,146 @@
+
+"""Long-lived JSON Lines server: one request per line in, one response per line out.
+
+Request fields (all optional except one of `source`/`blob`):
+    {"id": 7, "source": "print 1", "blob": "<base64 SRDG blob>",
+     "opt": false, "verify": false, "trusted": false,
+     "budgets": {"PRINT": ..., "MUTATE": ..., "LOOP_FUEL": ..., "MEMORY": ..., "INSTRUCTIONS": ...},
+     "max_instructions": 1000000}
+Response:
+    {"id": 7, "ok": true, "output": "1\\n", "cached": false,
+     "instructions": 5, "timings": {"compile": 0.0001, "run": 0.00002}}
+or {"id": 7, "ok": false, "error": "VMError: ...", ...}.
+"""
+from __future__ import annotations
+import base64, hashlib, json, os, signal, socketserver, sys, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from .parser import Parser, compile_to_bytes
+from .optimizer import optimize
+from .verifier import verify, certify, Certificate
+from .wide import to_compact
+from .sinks import ListSink
+from .vm import VM, VMError
+
+DEFAULT_BUDGETS = {"PRINT": 1_000_000, "MUTATE": 1_000_000, "LOOP_FUEL": 1_000_000, "MEMORY": 64 << 20,
+                   "INSTRUCTIONS": 1_000_000_000}
+
+# The socket server runs each connection on its own thread, and the parser's
+# scope ids are process-wide: compiles and cache updates take this lock.
+_LOCK = threading.Lock()
+
+class CompileCache:
+    """LRU of compiled blobs keyed by source hash and compile options."""
+    def __init__(self, size: int = 256):
+        self.size = size
+        self._blobs: "OrderedDict[Tuple[str,bool,bool], Tuple[bytes, Optional[Certificate]]]" = OrderedDict()
+
+    def get(self, src: str, opt: bool, trusted: bool) -> Tuple[bytes, Optional[Certificate], bool]:
+        key = (hashlib.sha256(src.encode("utf-8")).hexdigest(), opt, trusted)
+        with _LOCK:
+            hit = self._blobs.get(key)
+            if hit is not None:
+                self._blobs.move_to_end(key)
+                return hit[0], hit[1], True
+            Parser._scope_id = 0   # identical sources give identical blobs
+            blob = compile_to_bytes(src, instrument=not opt)   # optimize would strip it anyway
+            if opt:
+                blob = optimize(blob)
+            cert = certify(blob, DEFAULT_BUDGETS) if trusted else None
+            self._blobs[key] = (blob, cert)
+            if len(self._blobs) > self.size:
+                self._blobs.popitem(last=False)
+            return blob, cert, False
+
+_CACHE = CompileCache()
+
+def handle(req: Dict[str, Any], cache: CompileCache = _CACHE) -> Dict[str, Any]:
+    resp: Dict[str, Any] = {"id": req.get("id")}
+    timings = resp["timings"] = {}
+    try:
+        t0 = time.perf_counter()
+        trusted = bool(req.get("trusted"))
+        if "source" in req:
+            blob, cert, resp["cached"] = cache.get(req["source"], bool(req.get("opt")), trusted)
+        else:
+            blob = base64.b64decode(req["blob"]); cert = None; resp["cached"] = False
+            if req.get("opt"): blob = optimize(blob)
+            if trusted: blob = to_compact(blob); cert = certify(blob, DEFAULT_BUDGETS)
+        if req.get("verify"):
+            verify(blob, req.get("budgets") or DEFAULT_BUDGETS)
+        timings["compile"] = time.perf_counter() - t0
+        out = ListSink(); limit = req.get("max_instructions")
+        memory = (req.get("budgets") or DEFAULT_BUDGETS).get("MEMORY", DEFAULT_BUDGETS["MEMORY"])
+        t0 = time.perf_counter()
+        if limit is not None and not (cert is not None and cert.cost is not None and cert.cost.instructions <= int(limit)):
+            # Budgeted runs go through the sliced (checked) interpreter unless
+            # the certificate proves the program fits the budget.
+            vm = VM(blob, stdout=out, memory=memory)
+            if vm.run_for(int(limit)):
+                raise VMError(f"Instruction budget exceeded: {limit}")
+            resp["instructions"] = vm.instructions
+        else:
+            VM(blob, stdout=out, trusted=trusted, certificate=cert, memory=memory).run()
+        timings["run"] = time.perf_counter() - t0
+        resp["ok"] = True; resp["output"] = out.text()
+    except Exception as e:   # one bad script must not take the server down
+        resp["ok"] = False; resp["error"] = f"{type(e).__name__}: {e}"
+        if "out" in locals(): resp["output"] = out.text()
+    return resp
+
+def handle_line(line: str) -> str:
+    try:
+        req = json.loads(line)
+        if not isinstance(req, dict): raise ValueError("request must be a JSON object")
+    except ValueError as e:
+        return json.dumps({"id": None, "ok": False, "error": f"BadRequest: {e}"})
+    return json.dumps(handle(req))
+
+def _warm():
+    # Worker initializer: touch the compile/verify/run path once.
+    handle({"source": "let mut x = 1\nx = x + 1\nprint x\n", "trusted": True}, CompileCache(1))
+
+def _responses(lines: Iterable[str], pool) -> Iterator[str]:
+    lines = (l for l in lines if l.strip())
+    if pool is None:
+        return map(handle_line, lines)
+    return pool.imap(handle_line, lines)   # ordered, workers run ahead
+
+def serve_stream(inp, out, pool=None):
+    for resp in _responses(inp, pool):
+        out.write(resp + "\n"); out.flush()
+
+def serve_unix(path: str, pool=None):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = (raw.decode("utf-8") for raw in self.rfile)
+            for resp in _responses(lines, pool):
+                self.wfile.write(resp.encode("utf-8") + b"\n"); self.wfile.flush()
+    if os.path.exists(path):
+        os.unlink(path)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))   # so the socket file is removed
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as srv:
+        srv.daemon_threads = True
+        try:
+            srv.serve_forever()
+        finally:
+            os.unlink(path)
+
+def serve(socket_path: Optional[str] = None, workers: int = 0, cache_size: int = 256):
+    """Serve on stdin/stdout, or on a Unix socket. With `workers`, requests
+    are fanned out to that many pre-forked, pre-warmed processes (each with
+    its own compile cache); responses keep request order per connection."""
+    _CACHE.size = cache_size
+    _warm()
+    pool = None
+    if workers > 0:
+        import multiprocessing
+        pool = multiprocessing.get_context("fork").Pool(workers, initializer=_warm)
+    try:
+        if socket_path:
+            serve_unix(socket_path, pool)
+        else:
+            serve_stream(sys.stdin, sys.stdout, pool)
+    finally:
+        if pool is not None:
+            pool.terminate()
@@ -0,0 +1,85 @@
+
+from __future__ import annotations
+import io, sys
+from typing import Any, List, Optional
+
+class BufferedSink:
+    """PRINT sink that renders values like `print` but writes in large chunks.
+
+    Values are rendered with `str` and joined with newlines; once `threshold`
+    characters are pending they are written to `stream` in one call. The VM
+    flushes on HALT and when `run` exits, including on errors.
+    """
+    def __init__(self, stream=None, threshold: int = 1 << 16, encoding: str = "utf-8"):
+        if stream is None:
+            stream = getattr(sys.stdout, "buffer", sys.stdout)
+        self.stream = stream
+        self.threshold = threshold
+        self.encoding = encoding
+        self._binary = not isinstance(stream, io.TextIOBase)
+        self._parts: List[str] = []
+        self._size = 0
+
+    def __call__(self, v: Any):
+        s = str(v)
+        self._parts.append(s); self._size += len(s) + 1
+        if self._size >= self.threshold:
+            self._write()
+
+    def _write(self):
+        if not self._parts:
+            return
+        data = "\n".join(self._parts) + "\n"
+        self._parts = []; self._size = 0
+        self.stream.write(data.encode(self.encoding) if self._binary else data)
+
+    def flush(self):
+        self._write()
+        flush = getattr(self.stream, "flush", None)
+        if flush is not None:
+            flush()
+
+class ListSink:
+    """Capture PRINTed values (unrendered) for embedding and tests."""
+    def __init__(self, values: Optional[List[Any]] = None):
+        self.values: List[Any] = values if values is not None else []
+
+    def __call__(self, v: Any):
+        self.values.append(v)
+
+    def flush(self):
+        pass
+
+    def text(self) -> str:
+        return "".join(f"{v}\n" for v in self.values)
+
+class AsyncSink:
+    """PRINT sink for asyncio embedding.
+
+    Values are rendered into a buffer synchronously; `drain()` writes them
+    with one awaited call. `writer` is either an `asyncio.StreamWriter`-like
+    object (sync `write(bytes)` plus async `drain()`) or an async callable
+    taking the text. The VM awaits `drain()` between execution slices, so a
+    slow consumer applies backpressure to the script rather than the loop.
+    """
+    def __init__(self, writer, encoding: str = "utf-8"):
+        self.writer = writer
+        self.encoding = encoding
+        self._parts: List[str] = []
+
+    def __call__(self, v: Any):
+        self._parts.append(str(v))
+
+    async def drain(self):
+        if not self._parts:
+            return
+        data = "\n".join(self._parts) + "\n"
+        self._parts = []
+        if hasattr(self.writer, "drain"):
+            self.writer.write(data.encode(self.encoding))
+            await self.writer.drain()
+        else:
+            await self.writer(data)
+
+    def flush(self):
+        pass   # output leaves only through drain()
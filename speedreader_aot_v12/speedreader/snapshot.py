@@ -0,0 +1,65 @@
+
+from __future__ import annotations
+import json, zlib
+from typing import Any, Dict, Iterable, List
+from .verifier import code_hash
+from .vm import VM, VMError
+from .cell import Cell
+
+SNAP_MAGIC = b"SRSN"
+
+def take_snapshot(vm: VM) -> bytes:
+    """Serialise a paused checked-mode VM: ip, operand stack, env/mut frames,
+    call stack and counters. Mutable cells are written once to a cell table
+    and referenced by index, so cells shared through captures stay shared
+    after restore. PRINT output already emitted is not part of the state."""
+    cells: List[Any] = []; cell_ids: Dict[int, int] = {}
+    def enc(v):
+        if type(v) is Cell:
+            k = cell_ids.get(id(v))
+            if k is None:
+                k = cell_ids[id(v)] = len(cells); cells.append(v.value)
+            return {"c": k}
+        return v
+    state = {
+        "hash": code_hash(vm.strings, vm.code),
+        "ip": vm.ip, "stack": vm.stack, "callstack": vm.callstack,
+        "env": [{k: enc(v) for k, v in frame.items()} for frame in vm.env_stack],
+        "mut": vm.mut_stack, "cells": cells,
+        "instructions": vm.instructions, "halted": vm.halted,
+    }
+    return SNAP_MAGIC + bytes([1]) + zlib.compress(json.dumps(state, separators=(",", ":")).encode("utf-8"))
+
+def restore_snapshot(blob: bytes, snap: bytes, **vm_kwargs) -> VM:
+    """Build a VM for `blob` positioned at the snapshot's state. Extra keyword
+    arguments go to `VM` (stdout, trace, profiler); trusted mode and MEMORY
+    accounting cannot resume mid-program."""
+    if not snap.startswith(SNAP_MAGIC):
+        raise VMError("Bad snapshot magic")
+    if vm_kwargs.get("trusted"):
+        raise VMError("Trusted mode cannot resume from a snapshot")
+    if vm_kwargs.get("memory") is not None:
+        raise VMError("MEMORY accounting cannot resume from a snapshot")
+    state = json.loads(zlib.decompress(snap[5:]))
+    vm = VM(blob, **vm_kwargs)
+    if state["hash"] != code_hash(vm.strings, vm.code):
+        raise VMError("Snapshot does not match code")
+    cells = [Cell(v) for v in state["cells"]]
+    def dec(v):
+        return cells[v["c"]] if isinstance(v, dict) else v
+    vm.ip = state["ip"]; vm.stack = state["stack"]; vm.callstack = state["callstack"]
+    vm.env_stack = [{k: dec(v) for k, v in frame.items()} for frame in state["env"]]
+    vm.mut_stack = state["mut"]
+    vm.instructions = state["instructions"]; vm.halted = state["halted"]
+    return vm
+
+def run_to(vm: VM, stops: Iterable[int]) -> bool:
+    """Step until the next instruction is at one of the `stops` offsets;
+    False if the program halted first."""
+    stops = set(stops); step = vm.step
+    vm.reductions = {}   # a stop may lie inside a loop that would be folded
+    while vm.ip not in stops:
+        vm.instructions += 1
+        if not step():
+            vm.halted = True; vm.flush(); return False
+    return True
@@ -0,0 +1,224 @@
+
+from __future__ import annotations
+import json
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO, Tuple
+from .opcodes import NAMES
+from .debuginfo import LINES, LineTable, decode_lines
+from .emitter import load_sections
+from .cell import unwrap
+
+TRACE_MAGIC = b"SRTR"
+MAIN_FRAME = "<main>"
+
+_FN_ENTER = 0xF0
+_FN_EXIT = 0xF1
+_SNAPSHOT = 0xF2
+_LINES = 0xF3
+
+_OPNAME = NAMES
+
+def _view_env(env: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: unwrap(v) for k, v in env.items()}
+
+class ListTracer:
+    """Legacy in-memory trace: full stack/env copies per instruction."""
+    def __init__(self, log: List[dict]):
+        self.log = log
+        self._before: List[Any] = []
+
+    def start(self, vm):
+        self._before = list(vm.stack)
+
+    def record(self, vm, ip: int, op: int):
+        self.log.append({"ip": vm.ip, "op": _OPNAME[op], "stack_before": self._before, "env": _view_env(vm.env), "stack_after": list(vm.stack)})
+        self._before = list(vm.stack)
+
+    def flush(self):
+        pass
+
+class _DeltaTracer:
+    # Keeps a mirror of the operand stack so each record carries only what
+    # the instruction popped and pushed, plus a full snapshot every N records.
+    def __init__(self, snapshot_every: int = 1024):
+        self.snapshot_every = snapshot_every
+        self._mirror: List[Any] = []
+        self._fns: List[str] = [MAIN_FRAME]
+        self._entries: Dict[int, str] = {}
+        self._n = 0
+
+    def start(self, vm):
+        self._entries = {m["ip"]: f for f, m in vm.fn_meta.items()}
+        self._mirror = list(vm.stack)
+        raw = load_sections(vm.blob).get(LINES)
+        if raw is not None:
+            self._line_table(raw)
+        self._snapshot(vm, vm.ip)
+
+    def record(self, vm, ip: int, op: int):
+        a = self._mirror; b = vm.stack
+        p = min(len(a), len(b))
+        while p and a[p-1] != b[p-1]:
+            p -= 1
+        pushed = b[p:]
+        self._insn(op, ip, len(a) - p, pushed)
+        del a[p:]; a.extend(pushed)
+        depth = len(vm.callstack) + 1
+        if depth > len(self._fns):
+            self._fns.append(self._entries.get(vm.ip, "?")); self._fn_enter(self._fns[-1])
+        elif depth < len(self._fns):
+            self._fns.pop(); self._fn_exit()
+        self._n += 1
+        if self.snapshot_every and self._n % self.snapshot_every == 0:
+            self._snapshot(vm, vm.ip)
+
+    def _snapshot(self, vm, ip: int):
+        self._snap({"ip": ip, "fn": self._fns[-1], "stack": list(vm.stack), "env": _view_env(vm.env)})
+
+class JsonlTraceWriter(_DeltaTracer):
+    """One JSON object per line: {"ip","op","fn","pop","push"} and periodic {"snapshot": ...}."""
+    def __init__(self, stream: TextIO, snapshot_every: int = 1024):
+        super().__init__(snapshot_every)
+        self.stream = stream
+
+    def _insn(self, op, ip, pops, pushed):
+        self.stream.write(json.dumps({"ip": ip, "op": _OPNAME[op], "fn": self._fns[-1], "pop": pops, "push": pushed}, default=repr) + "\n")
+
+    def _fn_enter(self, name): pass
+    def _fn_exit(self): pass
+
+    def _line_table(self, raw):
+        self.stream.write(json.dumps({"lines": decode_lines(raw)}) + "\n")
+
+    def _snap(self, state):
+        self.stream.write(json.dumps({"snapshot": state}, default=repr) + "\n")
+
+    def flush(self):
+        self.stream.flush()
+
+def _uvarint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F; n >>= 7
+        if n: out.append(b | 0x80)
+        else: out.append(b); return bytes(out)
+
+def _zigzag(n: int) -> bytes:
+    return _uvarint(n << 1 if n >= 0 else ((-n) << 1) - 1)
+
+class BinaryTraceWriter(_DeltaTracer):
+    """Compact binary trace.
+
+    After the `SRTR` magic and a version byte, each record starts with a tag
+    byte: an opcode (< 144) is an instruction record `ip pops npush values...`
+    (uvarints), 0xF0/0xF1 mark function entry (with name) and exit, 0xF2
+    carries a JSON snapshot and 0xF3 the blob's encoded line table. Values are
+    tagged: 0 int, 1 str, 2 none, 3 JSON.
+    """
+    def __init__(self, stream: BinaryIO, snapshot_every: int = 1024):
+        super().__init__(snapshot_every)
+        self.stream = stream
+        stream.write(TRACE_MAGIC + bytes([1]))
+
+    def _value(self, v) -> bytes:
+        if isinstance(v, int):
+            return b"\x00" + _zigzag(v)
+        if isinstance(v, str):
+            raw = v.encode("utf-8"); return b"\x01" + _uvarint(len(raw)) + raw
+        if v is None:
+            return b"\x02"
+        raw = json.dumps(v, default=repr).encode("utf-8")
+        return b"\x03" + _uvarint(len(raw)) + raw
+
+    def _insn(self, op, ip, pops, pushed):
+        self.stream.write(bytes([op]) + _uvarint(ip) + _uvarint(pops) + _uvarint(len(pushed)) + b"".join(self._value(v) for v in pushed))
+
+    def _fn_enter(self, name):
+        raw = name.encode("utf-8")
+        self.stream.write(bytes([_FN_ENTER]) + _uvarint(len(raw)) + raw)
+
+    def _fn_exit(self):
+        self.stream.write(bytes([_FN_EXIT]))
+
+    def _line_table(self, raw):
+        self.stream.write(bytes([_LINES]) + _uvarint(len(raw)) + raw)
+
+    def _snap(self, state):
+        raw = json.dumps(state, default=repr).encode("utf-8")
+        self.stream.write(bytes([_SNAPSHOT]) + _uvarint(len(raw)) + raw)
+
+    def flush(self):
+        self.stream.flush()
+
+def _iter_binary(f: BinaryIO) -> Iterator[dict]:
+    read = f.read
+    def uv() -> int:
+        shift = result = 0
+        while True:
+            b = read(1)[0]
+            result |= (b & 0x7F) << shift; shift += 7
+            if b < 128: return result
+    def value():
+        tag = read(1)[0]
+        if tag == 0:
+            z = uv(); return (z >> 1) ^ -(z & 1)
+        if tag == 2:
+            return None
+        raw = read(uv())
+        return raw.decode("utf-8") if tag == 1 else json.loads(raw)
+    if read(5)[:4] != TRACE_MAGIC:
+        raise ValueError("Bad trace magic")
+    fns = [MAIN_FRAME]
+    while True:
+        t = read(1)
+        if not t: return
+        tag = t[0]
+        if tag == _FN_ENTER:
+            fns.append(read(uv()).decode("utf-8"))
+        elif tag == _FN_EXIT:
+            fns.pop()
+        elif tag == _SNAPSHOT:
+            yield {"snapshot": json.loads(read(uv()))}
+        elif tag == _LINES:
+            yield {"lines": decode_lines(read(uv()))}
+        else:
+            ip = uv(); pops = uv(); npush = uv()
+            yield {"ip": ip, "op": _OPNAME[tag], "fn": fns[-1], "pop": pops, "push": [value() for _ in range(npush)]}
+
+def read_trace(path: str, ip_range: Optional[Tuple[int,int]] = None, fn: Optional[str] = None, full: bool = False, line: Optional[int] = None) -> Iterator[dict]:
+    """Decode a JSONL or binary trace, optionally filtered by ip range
+    (inclusive), function and source line. Records carry `line`/`col` when the
+    traced blob had a line table; with `full`, also the reconstructed `stack`
+    after the instruction."""
+    with open(path, "rb") as f:
+        binary = f.read(4) == TRACE_MAGIC
+    if binary:
+        f = open(path, "rb"); records = _iter_binary(f)
+    else:
+        f = open(path, "r", encoding="utf-8"); records = (json.loads(line) for line in f if line.strip())
+    stack: List[Any] = []
+    lines: Optional[LineTable] = None
+    try:
+        for rec in records:
+            if "snapshot" in rec:
+                stack = list(rec["snapshot"]["stack"])
+                continue
+            if "lines" in rec:
+                lines = LineTable([tuple(e) for e in rec["lines"]])
+                continue
+            if full:
+                if rec["pop"]: del stack[-rec["pop"]:]
+                stack.extend(rec["push"])
+            if ip_range is not None and not (ip_range[0] <= rec["ip"] <= ip_range[1]):
+                continue
+            if fn is not None and rec["fn"] != fn:
+                continue
+            if lines is not None:
+                pos = lines.lookup(rec["ip"])
+                if pos is not None: rec["line"], rec["col"] = pos
+            if line is not None and rec.get("line") != line:
+                continue
+            if full:
+                rec["stack"] = list(stack)
+            yield rec
+    finally:
+        f.close()
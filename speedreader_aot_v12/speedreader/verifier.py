@@ -1,14 +1,19 @@
 
 from __future__ import annotations
-from typing import Dict, Tuple, List
-from .emitter import _load_blob
+from dataclasses import dataclass, field
+from typing import Dict, Tuple, List, Optional
+import json
+from .emitter import _load_blob, load_sections, pack_blob
 from .base12 import UCIO_REG
+from .wide import to_compact
+from .memory import static_bound
+from .loops import range_trips, stores
 
 class VerifyError(Exception): pass
 
 def verify(blob: bytes, budgets: Dict[str,int] = None) -> None:
     budgets = budgets or {"PRINT": 1000, "MUTATE": 1000, "LOOP_FUEL": 10000}
-    meta, code = _load_blob(blob)
+    meta, code = _load_blob(to_compact(blob))
 
     scope_depth = range_depth = if_depth = loop_depth = 0
     prints = mutations = 0
@@ -129,3 +134,384 @@ def verify(blob: bytes, budgets: Dict[str,int] = None) -> None:
         raise VerifyError(f"Mutation budget exceeded: {mutations} > {budgets['MUTATE']}")
     if loops_unknown > 0 and budgets.get("LOOP_FUEL", 0) <= 0:
         raise VerifyError(f"Loop termination requires fuel bound; set LOOP_FUEL >= {loops_unknown}")
+    if "INSTRUCTIONS" in budgets:
+        # admission by worst-case cost: proven bounds must fit INSTRUCTIONS,
+        # PRINT and MUTATE; unbounded programs are left to the VM's limits
+        total = _cost(_decode(code), meta.get("strings", [])).program
+        if total is not None:
+            for key, v in (("INSTRUCTIONS", total.instructions), ("PRINT", total.prints), ("MUTATE", total.mutations)):
+                if v > budgets.get(key, 1e18):
+                    raise VerifyError(f"Worst-case {key} exceeds budget: {v} > {budgets[key]}")
+    if "MEMORY" in budgets:
+        # only provable bounds can be rejected here; the VM enforces the rest
+        bound = static_bound(_decode(code), meta.get("strings", []))
+        if bound is not None and bound > budgets["MEMORY"]:
+            raise VerifyError(f"MEMORY budget exceeded: needs up to {bound} bytes > {budgets['MEMORY']}")
+
+MAIN = "<main>"
+
+@dataclass
+class Certificate:
+    code_hash: str
+    max_stack: Dict[str,int]
+    ret_arity: Dict[str,int]
+    bindings: Dict[str,List[str]] = field(default_factory=dict)
+    memory: Optional[int] = None   # bytes the VM can charge (memory.static_bound), if provable
+    cost: Optional[Cost] = None    # the program's worst-case cost, if provable
+
+    def to_dict(self) -> dict:
+        return {"code_hash": self.code_hash, "max_stack": self.max_stack,
+                "ret_arity": self.ret_arity, "bindings": self.bindings, "memory": self.memory,
+                "cost": self.cost.to_dict() if self.cost is not None else None}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Certificate":
+        cost = Cost(**d["cost"]) if d.get("cost") else None
+        return cls(d["code_hash"], dict(d["max_stack"]), dict(d["ret_arity"]), dict(d.get("bindings", {})), d.get("memory"), cost)
+
+def code_hash(strings: List[str], code: bytes) -> str:
+    import hashlib
+    h = hashlib.sha256(json.dumps(strings, ensure_ascii=False).encode("utf-8"))
+    h.update(bytes(code))
+    return h.hexdigest()
+
+def _decode(code: bytes) -> List[Tuple[int,str,List[int]]]:
+    # (ip after opcode, name, immediates); string immediates are string-table indices
+    out = []
+    i = 0
+    def read_varint():
+        nonlocal i
+        shift=result=0
+        last=0
+        while True:
+            b = code[i]; i+=1
+            last=b
+            result |= ((b & 0x7F) << shift); shift += 7
+            if b<128: break
+        if (last & 0x40) and shift < 64:
+            result |= - (1<<shift)
+        return result
+    def read_str():
+        nonlocal i
+        if code[i] != 254: raise VerifyError(f"String immediate missing marker at {i}")
+        i += 1; return read_varint()
+    while i < len(code):
+        op = code[i]; i += 1; at = i
+        name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
+        if not name or name.startswith("RES_"):
+            raise VerifyError(f"Unknown opcode {op} at {at-1}")
+        if name in {"LITERAL_I64","SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}:
+            args = [read_varint()]
+        elif name == "FOR_HINT":
+            args = [read_varint() for _ in range(4)]
+        elif name in {"LITERAL_STR","BIND_CONST","BIND_MUT","LOAD","STORE"}:
+            args = [read_str()]
+        elif name == "CALL":
+            args = [read_str(), read_varint()]
+        elif name == "FN_LABEL":
+            args = [read_str()]
+            pc = read_varint(); args.append(pc); args.extend(read_str() for _ in range(pc))
+            cc = read_varint(); args.append(cc); args.extend(read_str() for _ in range(cc))
+        else:
+            args = []
+        out.append((at, name, args))
+    return out
+
+_STACK_EFFECT = {
+    "LITERAL_I64": (0,1), "LITERAL_STR": (0,1), "LOAD": (0,1),
+    "STORE": (1,0), "BIND_CONST": (1,0), "BIND_MUT": (1,0), "PRINT": (1,0),
+    "ADD": (2,1), "SUB": (2,1), "MUL": (2,1), "DIV": (2,1), "MOD": (2,1),
+    "CMP_GT": (2,1), "CMP_GE": (2,1), "CMP_LT": (2,1), "CMP_LE": (2,1), "CMP_EQ": (2,1), "CMP_NE": (2,1),
+    "IF_BEGIN": (1,0), "LOOP_BEGIN": (1,0),
+}
+
+def certify(blob: bytes, budgets: Dict[str,int] = None) -> Certificate:
+    """Verify `blob` and prove the facts the VM's trusted mode relies on.
+
+    The certificate records the maximum operand-stack depth of the main
+    program and of every function, each function's return arity, and the
+    names each region resolves, and the program's memory bound and
+    worst-case cost when they can be proven. Certification fails (VerifyError) for
+    programs that verify but whose stack use or name bindings cannot be
+    proven, e.g. a loop body that leaks a value on every iteration.
+    """
+    blob = to_compact(blob)   # certificates are bound to compact code
+    verify(blob, budgets)
+    meta, code = _load_blob(blob)
+    strings = meta.get("strings", [])
+    def s(idx: int) -> str:
+        if not 0 <= idx < len(strings): raise VerifyError(f"String index {idx} out of range")
+        return strings[idx]
+    insns = _decode(code)
+
+    # Split into function regions (FN_LABEL .. matching SCOPE_EXIT, RET) and main code
+    fns: Dict[str,dict] = {}
+    main: List[Tuple[int,str,List[int]]] = []
+    cur = None
+    for at, name, args in insns:
+        if cur is None:
+            if name == "FN_LABEL":
+                fname = s(args[0]); pc = args[1]
+                params = [s(x) for x in args[2:2+pc]]
+                captures = [s(x) for x in args[3+pc:]]
+                if fname in fns: raise VerifyError(f"Duplicate function {fname}")
+                cur = fns[fname] = {"params": params, "captures": captures, "body": [], "sid": None, "closing": False}
+            else:
+                main.append((at, name, args))
+            continue
+        if cur["closing"]:
+            if name != "RET": raise VerifyError("Function body must end with RET")
+            cur["body"].append((at, name, args)); cur = None
+            continue
+        if name == "FN_LABEL": raise VerifyError("Nested FN_LABEL")
+        if cur["sid"] is None:
+            if name != "SCOPE_ENTER": raise VerifyError("Function body must open a scope")
+            cur["sid"] = args[0]
+        elif name == "SCOPE_EXIT" and args[0] == cur["sid"]:
+            cur["closing"] = True
+        cur["body"].append((at, name, args))
+    if cur is not None:
+        raise VerifyError("Unterminated function body")
+
+    # Lookups are dynamic: a function's store to a name it did not bind
+    # reaches the frames of whatever called it, so it must not hit a
+    # parameter (bound bare, never mutable) of any function that can call it.
+    calls = {f: {s(a[0]) for _, n, a in d["body"] if n == "CALL"} for f, d in fns.items()}
+    outer_params: Dict[str, set] = {f: set() for f in fns}
+    for f, d in fns.items():
+        seen = set(); todo = list(calls[f])
+        while todo:
+            g = todo.pop()
+            if g in seen or g not in fns: continue
+            seen.add(g); outer_params[g] |= set(d["params"]); todo.extend(calls[g])
+    consts = set(); muts = set()
+    for at, name, args in insns:
+        if name == "BIND_CONST": consts.add(s(args[0]))
+        elif name == "BIND_MUT": muts.add(s(args[0]))
+
+    def analyze(region, fname, bound, ret_arity, globals_seen):
+        # Abstract interpretation over structured code: (depth, dead, definitely-bound names)
+        depth = 0; max_depth = 0; dead = False
+        entry = set(bound); bound = set(bound); used = set()
+        structs: List[dict] = []
+        head = None
+        ret = None
+        visible = (lambda n: n in bound or n in globals_seen[0]) if fname != MAIN else (lambda n: n in bound)
+        for at, name, args in region:
+            if name in {"JMP","JMP_IF_FALSE"}:
+                raise VerifyError(f"Unstructured {name} at {at-1} cannot be certified")
+            if name == "CALL":
+                callee = s(args[0]); argc = args[1]
+                f = fns.get(callee)
+                if f is None: raise VerifyError(f"Call to unknown function {callee}")
+                if argc != len(f["params"]):
+                    raise VerifyError(f"Arity mismatch calling {callee}: expected {len(f['params'])} got {argc}")
+                # Functions may only rely on globals bound at every call from
+                # the main program (every call chain starts at one).
+                if fname == MAIN:
+                    globals_seen[0] = set(bound) if globals_seen[0] is None else globals_seen[0] & bound
+                for c in f["captures"]:
+                    if c not in (bound if fname == MAIN else globals_seen[0]):
+                        raise VerifyError(f"Capture '{c}' of {callee} is not a bound global at every call")
+                if depth < argc: raise VerifyError(f"Operand stack underflow at {at-1}")
+                depth += ret_arity.get(callee, 0) - argc
+            elif name in _STACK_EFFECT:
+                pops, pushes = _STACK_EFFECT[name]
+                if depth < pops: raise VerifyError(f"Operand stack underflow at {at-1}")
+                depth += pushes - pops
+            max_depth = max(max_depth, depth)
+
+            if name in {"LOAD","STORE"}:
+                n = s(args[0])
+                if not visible(n): raise VerifyError(f"Unresolved name {n} in {fname}")
+                if name == "STORE" and (n not in muts or n in consts or (fname != MAIN and (
+                        n in fns[fname]["params"] or (n not in bound - entry and n in outer_params[fname])))):
+                    raise VerifyError(f"Store to non-mutable {n} in {fname}")
+                used.add(n)
+            elif name in {"BIND_CONST","BIND_MUT"}:
+                bound.add(s(args[0]))
+            elif name == "IF_BEGIN":
+                structs.append({"kind": "IF", "depth": depth, "bound": set(bound), "then": None})
+            elif name in {"IF_ELSE","IF_END"} and (not structs or structs[-1]["kind"] != "IF"):
+                raise VerifyError(f"{name} at {at-1} does not close an IF")
+            elif name == "IF_ELSE":
+                e = structs[-1]
+                e["then"] = (depth, dead, bound)
+                depth = e["depth"]; dead = False; bound = set(e["bound"])
+            elif name == "IF_END":
+                e = structs.pop()
+                a = e["then"] if e["then"] is not None else (depth, dead, bound)
+                b = (depth, dead, bound) if e["then"] is not None else (e["depth"], False, e["bound"])
+                if a[1] and b[1]: depth, dead, bound = e["depth"], True, a[2] & b[2]
+                elif a[1]: depth, dead, bound = b
+                elif b[1]: depth, dead, bound = a
+                elif a[0] != b[0]:
+                    raise VerifyError(f"Operand stack depth differs between IF branches at {at-1}")
+                else: depth, dead, bound = a[0], False, a[2] & b[2]
+            elif name == "LOOP_HEAD":
+                head = depth
+            elif name == "LOOP_BEGIN":
+                if head is None or head != depth:
+                    raise VerifyError(f"LOOP_BEGIN at {at-1} without matching LOOP_HEAD")
+                structs.append({"kind": "LOOP", "depth": depth, "bound": set(bound)}); head = None
+            elif name in {"LOOP_BREAK","LOOP_CONTINUE","LOOP_END"}:
+                loops = [e for e in structs if e["kind"] == "LOOP"]
+                if not loops: raise VerifyError(f"{name} outside of a loop at {at-1}")
+                if not dead and depth != loops[-1]["depth"]:
+                    raise VerifyError(f"Operand stack not balanced at loop back-edge at {at-1}")
+                if name == "LOOP_END":
+                    if structs[-1]["kind"] != "LOOP": raise VerifyError(f"LOOP_END at {at-1} does not close a loop")
+                    e = structs.pop()
+                    depth, dead, bound = e["depth"], False, e["bound"]
+                else:
+                    dead = True
+            elif name == "RET":
+                if not dead and fname != MAIN:
+                    if depth > 1: raise VerifyError(f"{fname} returns {depth} values")
+                    if ret is not None and ret != depth:
+                        raise VerifyError(f"{fname} has inconsistent return arity")
+                    ret = depth
+                dead = True
+            elif name == "HALT":
+                dead = True
+        return max_depth, (ret or 0), sorted(used)
+
+    ret_arity: Dict[str,int] = {f: 0 for f in fns}
+    for _ in range(len(fns) + 2):
+        globals_seen = [None]
+        max_stack: Dict[str,int] = {}; bindings: Dict[str,List[str]] = {}
+        max_stack[MAIN], _, bindings[MAIN] = analyze(main, MAIN, set(), ret_arity, globals_seen)
+        if globals_seen[0] is None: globals_seen[0] = set()
+        new_arity = {}
+        for fname, f in fns.items():
+            entry = set(f["params"]) | set(f["captures"])
+            max_stack[fname], new_arity[fname], bindings[fname] = analyze(f["body"], fname, entry, ret_arity, globals_seen)
+        if new_arity == ret_arity:
+            break
+        ret_arity = new_arity
+    else:
+        raise VerifyError("Return arities did not converge")
+
+    return Certificate(code_hash(strings, code), max_stack, ret_arity, bindings, static_bound(insns, strings),
+                       _cost(insns, strings).program)
+
+def attach_certificate(blob: bytes, cert: Certificate) -> bytes:
+    blob = to_compact(blob)
+    meta, code = _load_blob(blob)
+    meta["cert"] = cert.to_dict()
+    return pack_blob(meta, code, load_sections(blob))
+
+# --- worst-case cost ---------------------------------------------------------
+
+@dataclass
+class Cost:
+    """Worst-case dynamic counts for one run of a region: executed
+    instructions, PRINTs, mutations (BIND_MUT and STORE) and fuel (loop
+    back-edges plus calls, what the VM's fuel counts)."""
+    instructions: int
+    prints: int
+    mutations: int
+    fuel: int
+
+    def to_dict(self) -> dict:
+        return {"instructions": self.instructions, "prints": self.prints, "mutations": self.mutations, "fuel": self.fuel}
+
+@dataclass
+class CostReport:
+    program: Optional[Cost]   # None: unbounded
+    functions: Dict[str, Optional[Cost]]   # one call, callees included
+    recursive: List[str] = field(default_factory=list)
+    unbounded_loops: int = 0   # loops without a provable trip count
+
+    def format(self) -> str:
+        def row(name, c):
+            if c is None: return f"{name:<24} unbounded"
+            return f"{name:<24} {c.instructions:>14} {c.prints:>10} {c.mutations:>10} {c.fuel:>10}"
+        lines = [f"{'region':<24} {'instructions':>14} {'prints':>10} {'mutations':>10} {'fuel':>10}", row(MAIN, self.program)]
+        lines += [row(f, c) for f, c in sorted(self.functions.items())]
+        if self.recursive: lines.append("recursive: " + ", ".join(sorted(self.recursive)))
+        if self.unbounded_loops: lines.append(f"loops without a trip count: {self.unbounded_loops}")
+        return "\n".join(lines)
+
+def _cost(insns, strings: List[str]) -> CostReport:
+    # Each region is costed in one pass over its structured code; IF takes
+    # the costlier branch, a loop costs trips * (condition + body) plus the
+    # final condition, a call the callee's cost. Recursion, unstructured
+    # jumps and loops without a proven trip count (loops.range_trips) are
+    # unbounded (None).
+    main = []; fns: Dict[str, dict] = {}; cur = None
+    for ins in insns:
+        _, name, args = ins
+        if cur is None:
+            if name == "FN_LABEL":
+                pc = args[1]
+                cur = fns[strings[args[0]]] = {"body": [], "sid": None, "closing": False,
+                                               "captures": [strings[x] for x in args[3+pc:]]}
+            main.append(ins)
+            continue
+        cur["body"].append(ins)
+        if cur["closing"]: cur = None
+        elif cur["sid"] is None and name == "SCOPE_ENTER": cur["sid"] = args[0]
+        elif name == "SCOPE_EXIT" and args[0] == cur["sid"]: cur["closing"] = True
+    report = CostReport(None, {})
+    writes = stores({f: d["body"] for f, d in fns.items()}, {f: d["captures"] for f, d in fns.items()}, strings)
+    Z = (0, 0, 0, 0)
+    def add(x, y):
+        return None if x is None or y is None else tuple(a + b for a, b in zip(x, y))
+    def scale(x, n):
+        return None if x is None else tuple(a * n for a in x)
+    def join(x, y):
+        return None if x is None or y is None else tuple(max(a, b) for a, b in zip(x, y))
+    done: Dict[str, Optional[tuple]] = {}; active: List[str] = []
+    def function(f: str):
+        if f in done: return done[f]
+        if f in active:   # recursion: every function on the cycle is unbounded
+            for g in active[active.index(f):]:
+                if g not in report.recursive: report.recursive.append(g)
+            return None
+        if f not in fns: return None
+        active.append(f); c = region(fns[f]["body"]); active.pop()
+        if f in report.recursive: c = None
+        done[f] = c
+        return c
+    def region(body):
+        frames: List[dict] = [{"at": "acc", "acc": Z}]   # "at": the part being charged
+        def charge(c):
+            fr = frames[-1]; fr[fr["at"]] = add(fr[fr["at"]], c)
+        for k, (_, name, args) in enumerate(body):
+            if name == "IF_BEGIN":
+                charge((1, 0, 0, 0)); frames.append({"at": "then", "then": Z, "else": Z})
+            elif name == "IF_ELSE":
+                charge((1, 0, 0, 0)); frames[-1]["at"] = "else"
+            elif name == "IF_END":
+                fr = frames.pop(); charge(add(join(fr["then"], fr["else"]), (1, 0, 0, 0)))
+            elif name == "LOOP_HEAD":
+                t = range_trips(body, k, strings, writes)
+                if t is None: report.unbounded_loops += 1
+                frames.append({"at": "cond", "cond": (1, 0, 0, 0), "body": Z, "trips": t})
+            elif name == "LOOP_BEGIN":
+                charge((1, 0, 0, 0)); frames[-1]["at"] = "body"
+            elif name == "LOOP_END":
+                charge((1, 0, 0, 1)); fr = frames.pop(); t = fr["trips"]
+                charge(None if t is None else add(scale(add(fr["cond"], fr["body"]), t), fr["cond"]))
+            elif name in ("JMP", "JMP_IF_FALSE"):
+                charge(None)
+            elif name == "CALL":
+                charge(add((1, 0, 0, 1), function(strings[args[0]])))
+            elif name == "PRINT":
+                charge((1, 1, 0, 0))
+            elif name in ("STORE", "BIND_MUT"):
+                charge((1, 0, 1, 0))
+            else:
+                charge((1, 0, 0, 0))
+        return frames[0]["acc"]
+    def cost(c): return None if c is None else Cost(*c)
+    for f in fns: report.functions[f] = cost(function(f))
+    report.program = cost(region(main))
+    return report
+
+def cost_report(blob: bytes) -> CostReport:
+    """Interprocedural worst-case cost of `blob`: per function (one call,
+    callees included) and for the whole program."""
+    meta, code = _load_blob(to_compact(blob))
+    return _cost(_decode(code), meta.get("strings", []))
@@ -1,16 +1,35 @@
 
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 from .emitter import load_dgm
-from .base12 import UCIO_REG
+from .opcodes import CODES, NAMES, TABLE_SIZE
+from .sinks import BufferedSink
+from .trace import ListTracer
+from .debuginfo import LineTable
+from .memory import Arena, size_of, VALUE, CELL, FRAME
+from .cell import Cell, MUT, CONST, unwrap, bind_kind
+if TYPE_CHECKING:
+    from .verifier import Certificate
 
 class VMError(Exception): pass
 
-def _is_box(v): return isinstance(v, list) and len(v) == 1
+_OP = CODES
 
 class VM:
-    def __init__(self, blob: bytes, stdout=None, trace: bool=False):
+    def __init__(self, blob: bytes, stdout=None, trace=False, trusted: bool=False, certificate: Optional[Certificate]=None, profiler=None, fold_loops: bool=True, memory: Optional[int]=None, parallel: int=0, fuel: Optional[int]=None):
         meta, code = load_dgm(blob)
+        self.blob = blob
+        # Wide blobs (see wide.py) run on an int64 word array with ip as an
+        # instruction index; `ops` is the opcode at each ip in either form.
+        self.wide = meta.get("encoding") == "wide"
+        if self.wide:
+            if trusted: raise VMError("Trusted mode requires the compact encoding")
+            from .wide import words, WIDTH
+            code = words(code)
+            self.ops = code[0:WIDTH * meta["insns"]:WIDTH]
+            self.step = self._step_wide
+        else:
+            self.ops = code
         self.code = code
         self.strings = meta.get("strings", [])
         self.ip = 0
@@ -18,10 +37,61 @@ class VM:
         self.env_stack: List[Dict[str, Any]] = [{}]
         self.mut_stack: List[Dict[str, bool]] = [{}]
         self.callstack: List[int] = []
+        self.jumps: Dict[int, int] = {}
+        self.fn_skip: Dict[int, int] = {}
+        self._loops: List[tuple] = []   # (ip after LOOP_HEAD, ip after LOOP_END) without breaks
+        self.kinds: Dict[str, Optional[bool]] = {}   # name -> MUT, CONST or None when bound both ways (see cell.py)
         self.fn_meta = self._index_labels()
-        self.out = stdout if stdout is not None else print
-        self.trace_enabled = trace
+        self.out = stdout if stdout is not None else BufferedSink()
+        # trace=True keeps the legacy in-memory list; a tracer object (see
+        # trace.py) streams records instead.
         self.trace_log: List[Dict[str, Any]] = []
+        self.tracer = ListTracer(self.trace_log) if trace is True else (trace or None)
+        self.trace_enabled = self.tracer is not None
+        self.profiler = profiler
+        self.cert: Optional[Certificate] = None
+        self._lines: Optional[LineTable] = None
+        # Counted integer loops evaluated in closed form at LOOP_HEAD (see
+        # reductions.py); off whenever every instruction must be observed.
+        self.reductions: Dict[int, Any] = {}
+        if fold_loops and self._loops and self.tracer is None and profiler is None:
+            from .reductions import find_reductions
+            self.reductions = find_reductions(code, self.strings, self._loops, self.wide)
+        # With `parallel` worker processes, independent range-for loops run
+        # across a pool (see parallel.py); same entry point as a reduction.
+        if parallel > 1 and self._loops and self.tracer is None and profiler is None:
+            from .parallel import find_parallel
+            for head, p in find_parallel(self, self._loops, parallel).items():
+                self.reductions.setdefault(head, p)
+        # Sliced execution (run_for / run_async): instructions executed so far,
+        # for fair scheduling; plain run() does not count.
+        self.instructions = 0
+        self.halted = False
+        self.cancelled = False
+        if trusted:
+            from .verifier import Certificate, code_hash, MAIN   # only trusted runs pay for hashlib
+            if certificate is None and "cert" in meta:
+                certificate = Certificate.from_dict(meta["cert"])
+            if certificate is None:
+                raise VMError("Trusted mode requires a verifier certificate")
+            if certificate.code_hash != code_hash(self.strings, code):
+                raise VMError("Certificate does not match code")
+            if trace or profiler is not None:
+                raise VMError("Tracing and profiling are not available in trusted mode")
+            self.cert = certificate
+        # MEMORY budget in bytes (see memory.py); a certificate proving the
+        # program stays within it makes the accounting unnecessary.
+        self.arena: Optional[Arena] = None
+        if memory is not None and not (self.cert is not None and self.cert.memory is not None and self.cert.memory <= memory):
+            self.arena = Arena(memory)
+            self._borrowed: List[set] = [set()]   # per frame: captured names whose cells another frame owns
+            self._frame_cost: List[int] = []
+            if self.cert is not None: self._alloc(self.cert.max_stack[MAIN] * VALUE)
+        # Fuel: loop back-edges plus calls left before the run is stopped;
+        # None when unlimited or the certificate proves the program fits.
+        self.fuel = fuel
+        if fuel is not None and self.cert is not None and self.cert.cost is not None and self.cert.cost.fuel <= fuel:
+            self.fuel = None
 
     @property
     def env(self) -> Dict[str,Any]:
@@ -32,47 +102,118 @@ class VM:
         return self.mut_stack[-1]
 
     def _index_labels(self):
+        # One forward pass: function labels, function extents (so fall-through
+        # skips bodies), binding kinds and the structural jump table keyed by
+        # ip after opcode.
         labels = {}
+        structs: List[list] = []
+        head = None
+        fn_open = None   # [skip key, label dict, body scope id, closing]
+        for at, name, v in (self._scan_wide() if self.wide else self._scan()):
+            if fn_open is not None and fn_open[3]:
+                if name == "RET":
+                    self.fn_skip[fn_open[0]] = at; fn_open[1]["end"] = at
+                fn_open = None
+            if name == "IF_BEGIN":
+                structs.append(["IF", at, None])
+            elif name == "IF_ELSE":
+                if structs and structs[-1][0] == "IF":
+                    structs[-1][2] = at; self.jumps[structs[-1][1]] = at
+            elif name == "IF_END":
+                if structs and structs[-1][0] == "IF":
+                    e = structs.pop(); self.jumps[e[2] if e[2] is not None else e[1]] = at
+            elif name == "LOOP_HEAD":
+                head = at
+            elif name == "LOOP_BEGIN":
+                structs.append(["LOOP", at, head, []]); head = None
+            elif name in {"LOOP_CONTINUE","LOOP_BREAK"}:
+                loops = [e for e in structs if e[0] == "LOOP"]
+                if loops:
+                    if name == "LOOP_BREAK": loops[-1][3].append(at)
+                    elif loops[-1][2] is not None: self.jumps[at] = loops[-1][2]
+            elif name == "LOOP_END":
+                if structs and structs[-1][0] == "LOOP":
+                    e = structs.pop(); self.jumps[e[1]] = at
+                    if e[2] is not None: self.jumps[at] = e[2]
+                    if e[2] is not None and not e[3]: self._loops.append((e[2], at))
+                    for b in e[3]: self.jumps[b] = at
+            elif name == "BIND_CONST" or name == "BIND_MUT":
+                bind_kind(self.kinds, v, name == "BIND_MUT")
+            elif name == "FN_LABEL":
+                fname, params, captures, body = v
+                labels[fname] = {"ip": body, "params": params, "captures": captures}
+                fn_open = [at, labels[fname], None, False]
+                for p in params: bind_kind(self.kinds, p, CONST)
+            elif fn_open is not None:
+                if name == "SCOPE_ENTER" and fn_open[2] is None: fn_open[2] = v
+                elif name == "SCOPE_EXIT" and v == fn_open[2]: fn_open[3] = True
+        return labels
+
+    def _scan(self):
+        # (ip after opcode, name, operand) over compact code; the operand is
+        # the scope id for SCOPE_ENTER/EXIT, the name for BIND_* and (name,
+        # params, captures, body ip) for FN_LABEL.
+        code = self.code; n = len(code)
         i = 0
         def read_varint():
             nonlocal i
             shift=result=0; last=0
             while True:
-                b = self.code[i]; i+=1; last=b
+                b = code[i]; i+=1; last=b
                 result |= ((b & 0x7F) << shift); shift += 7
                 if b<128: break
             if (last & 0x40) and shift < 64:
                 result |= - (1<<shift)
             return result
-        while i < len(self.code):
-            op = self.code[i]; i += 1
-            name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
+        while i < n:
+            op = code[i]; i += 1; at = i
+            name = NAMES[op] if op < TABLE_SIZE else ""
+            v = None
             if name == "FN_LABEL":
-                if self.code[i] != 254: raise VMError("FN_LABEL missing name marker")
+                if code[i] != 254: raise VMError("FN_LABEL missing name marker")
                 i += 1
                 name_idx = read_varint()
                 fname = self.strings[name_idx] if 0 <= name_idx < len(self.strings) else f"<str#{name_idx}>"
                 param_count = read_varint()
                 params = []
                 for _ in range(param_count):
-                    if self.code[i] != 254: raise VMError("FN_LABEL param missing marker")
+                    if code[i] != 254: raise VMError("FN_LABEL param missing marker")
                     i += 1; pidx = read_varint(); params.append(self.strings[pidx])
                 capture_count = read_varint()
                 captures = []
                 for _ in range(capture_count):
-                    if self.code[i] != 254: raise VMError("FN_LABEL capture missing marker")
+                    if code[i] != 254: raise VMError("FN_LABEL capture missing marker")
                     i += 1; cidx = read_varint(); captures.append(self.strings[cidx])
-                labels[fname] = {"ip": i, "params": params, "captures": captures}
+                v = (fname, params, captures, i)
             elif name in {"LITERAL_I64","SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE","FOR_HINT"}:
-                _ = read_varint()
+                v = read_varint()
                 if name == "FOR_HINT":
                     _ = read_varint(); _ = read_varint(); _ = read_varint()
             elif name in {"LITERAL_STR","BIND_CONST","BIND_MUT","LOAD","STORE","CALL"}:
-                if i < len(self.code) and self.code[i] == 254:
-                    i += 1; _ = read_varint()
+                if i < n and code[i] == 254:
+                    i += 1; idx = read_varint()
                     if name == "CALL":
                         _ = read_varint()
-        return labels
+                    elif name == "BIND_CONST" or name == "BIND_MUT":
+                        v = self._string(idx)
+            yield at, name, v
+
+    def _scan_wide(self):
+        # _scan over wide code: every instruction is at a fixed index.
+        from .wide import instruction
+        ops = self.ops; w = self.code; strings = self.strings
+        for k in range(len(ops)):
+            op = ops[k]
+            name = NAMES[op] if 0 <= op < TABLE_SIZE else ""
+            v = None
+            if name == "FN_LABEL":
+                fname, params, captures = instruction(w, strings, k)[1]
+                v = (fname, params, captures, k + 1)
+            elif name in {"SCOPE_ENTER","SCOPE_EXIT"}:
+                v = w[3*k+1]
+            elif name == "BIND_CONST" or name == "BIND_MUT":
+                v = self._string(w[3*k+1])
+            yield k + 1, name, v
 
     def _read_svarint(self) -> int:
         shift = 0; result = 0; last = 0
@@ -85,205 +226,489 @@ class VM:
         return result
 
     def _read_str(self) -> str:
-        idx = self._read_svarint()
+        return self._string(self._read_svarint())
+
+    def _string(self, idx: int) -> str:
         if 0 <= idx < len(self.strings):
             return self.strings[idx]
         return f"<str#{idx}>"
 
-    def _log(self, opname: str, pre_stack, pre_env):
-        if not self.trace_enabled: return
-        view_env = {k:(v[0] if _is_box(v) else v) for k,v in self.env.items()}
-        self.trace_log.append({"ip": self.ip, "op": opname, "stack_before": list(pre_stack), "env": view_env, "stack_after": list(self.stack)})
-
     def _resolve_load(self, name: str):
+        kind = self.kinds.get(name)
         for env in reversed(self.env_stack):
             if name in env:
-                v = env[name]; return v[0] if _is_box(v) else v
+                v = env[name]
+                return v if kind is CONST else v.value if kind is MUT else unwrap(v)
         raise VMError(f"Unknown variable {name}")
 
     def _resolve_store(self, name: str, val: Any):
         for env, mut in zip(reversed(self.env_stack), reversed(self.mut_stack)):
             if name in env:
                 if not mut.get(name, False): raise VMError(f"Variable {name} is const")
-                v = env[name]
-                if _is_box(v): v[0] = val
-                else: env[name] = val
+                cell = env[name]   # mutable bindings are always cells
+                if self.arena is not None: self._alloc(size_of(val) - size_of(cell.value))
+                cell.value = val
                 return
         raise VMError(f"Unknown variable {name}")
 
+    def _alloc(self, n: int):
+        if not self.arena.alloc(n):
+            raise VMError(f"MEMORY budget exceeded: {self.arena.used} + {n} > {self.arena.cap} bytes")
+
+    def _charge_bind(self, name: str, val: Any):
+        # before `name` is (re)bound in the current frame
+        env = self.env_stack[-1]; borrowed = self._borrowed[-1]
+        if name in borrowed:
+            borrowed.discard(name); self._alloc(size_of(val))   # the frame keeps the capture's CELL
+        elif name in env:
+            self._alloc(size_of(val) - size_of(unwrap(env[name])))
+        else:
+            self._alloc(CELL + size_of(val))
+
+    def _charge_call(self, frame: Dict[str, Any], params: List[str], slots: int = 0):
+        n = FRAME + slots * VALUE
+        self._alloc(n + sum(CELL + size_of(frame[p]) for p in params) + CELL * (len(frame) - len(params)))
+        self._frame_cost.append(n)
+        self._borrowed.append(set(frame) - set(params))
+
+    def _release_frame(self):
+        # before the current call frame is popped
+        borrowed = self._borrowed.pop(); n = self._frame_cost.pop()
+        for name, v in self.env_stack[-1].items():
+            n += CELL if name in borrowed else CELL + size_of(unwrap(v))
+        self.arena.free(n)
+
+    def _burn(self):
+        self.fuel -= 1
+        if self.fuel < 0: raise VMError("Fuel exhausted (loop iterations and calls)")
+
+    def _check_stack(self):
+        # the checked interpreter's operand stack, at loop back-edges
+        if not self.arena.fits(len(self.stack) * VALUE):
+            raise VMError(f"MEMORY budget exceeded: {self.arena.used} + {len(self.stack) * VALUE} > {self.arena.cap} bytes")
+
     def run(self) -> Optional[List[dict]]:
-        while self.ip < len(self.code):
-            op = self.code[self.ip]; self.ip += 1
-            name = UCIO_REG[op].name if op in UCIO_REG.by_code else f"UNK_{op}"
-            pre_stack = list(self.stack); pre_env = dict(self.env)
-            if name == "HALT":
-                self._log(name, pre_stack, pre_env); break
-            elif name == "RET":
-                self._log(name, pre_stack, pre_env)
-                if not self.callstack: break
-                self.env_stack.pop(); self.mut_stack.pop(); self.ip = self.callstack.pop(); continue
-            elif name == "CALL":
-                if self.code[self.ip] != 254: raise VMError("CALL missing name marker")
-                self.ip += 1; fname = self._read_str(); argc = self._read_svarint()
-                meta = self.fn_meta.get(fname)
-                if meta is None: raise VMError(f"Unknown function {fname}")
-                params = meta["params"]; caps = meta["captures"]
-                if argc != len(params): raise VMError(f"Arg mismatch: expected {len(params)} got {argc}")
+        try:
+            if self.cert is not None:
+                self._run_trusted(); return None
+            if self.profiler is not None:
+                self.profiler.run(self); return None
+            if self.tracer is not None:
+                self._run_traced()
+                return self.trace_log if isinstance(self.tracer, ListTracer) else None
+            step = self.step
+            while step():
+                pass
+            return None
+        except VMError as e:
+            if self.cert is None: self._locate(e)
+            raise
+        finally:
+            self.flush()
+
+    def _locate(self, e: VMError):
+        # self.ip is inside (or just past) the failing instruction.
+        pos = self.source_pos(self.ip - 1) if e.args else None
+        if pos is not None:
+            e.line, e.col = pos
+            e.args = (f"{e.args[0]} (line {pos[0]}, col {pos[1]})",) + e.args[1:]
+
+    def run_for(self, budget: int) -> bool:
+        """Execute up to `budget` instructions; True while the program has not
+        halted. Sliced runs always use the checked interpreter (trusted and
+        traced/profiled modes need the whole run)."""
+        if self.halted: return False
+        if self.tracer is not None or self.profiler is not None:
+            raise VMError("Tracing and profiling are not available in sliced runs")
+        step = self.step; n = 0
+        try:
+            for n in range(1, budget + 1):
+                if not step():
+                    self.halted = True; break
+        except VMError as e:
+            self.halted = True; self._locate(e); self.flush()
+            raise
+        finally:
+            self.instructions += n
+        if self.halted: self.flush()
+        return not self.halted
+
+    async def run_async(self, budget: int = 1000):
+        """Run cooperatively: `budget` instructions per slice, then yield to
+        the event loop. An output sink with an async `drain()` (see
+        sinks.AsyncSink) is awaited between slices; task cancellation or
+        `cancel()` stops the program at the next slice boundary."""
+        import asyncio
+        drain = getattr(self.out, "drain", None)
+        try:
+            while True:
+                if self.cancelled: raise asyncio.CancelledError()
+                more = self.run_for(budget)
+                if drain is not None: await drain()
+                if not more: return
+                await asyncio.sleep(0)
+        finally:
+            self.flush()
+
+    def cancel(self):
+        """Ask a sliced run to stop at its next slice boundary."""
+        self.cancelled = True
+
+    def source_pos(self, ip: int):
+        """(line, col) for the instruction at or before code offset `ip`, from
+        the blob's debug line table; None if the blob has none."""
+        if self._lines is None:
+            self._lines = LineTable.from_blob(self.blob) or LineTable([])
+        return self._lines.lookup(ip)
+
+    def _run_traced(self):
+        tracer = self.tracer; ops = self.ops; step = self.step
+        tracer.start(self)
+        try:
+            while self.ip < len(ops):
+                ip = self.ip; op = ops[ip]
+                more = step()
+                tracer.record(self, ip, op)
+                if not more: break
+        finally:
+            tracer.flush()
+
+    def flush(self):
+        """Flush buffered PRINT output (no-op for plain callables like `print`)."""
+        flush = getattr(self.out, "flush", None)
+        if flush is not None: flush()
+
+    def step(self) -> bool:
+        """Execute one instruction; False once the program has halted."""
+        if self.ip >= len(self.code):
+            return False
+        op = self.code[self.ip]; self.ip += 1
+        name = NAMES[op]
+        if name == "HALT":
+            self.flush(); return False
+        elif name == "RET":
+            if not self.callstack: self.flush(); return False
+            if self.arena is not None: self._release_frame()
+            self.env_stack.pop(); self.mut_stack.pop(); self.ip = self.callstack.pop(); return True
+        elif name == "CALL":
+            if self.code[self.ip] != 254: raise VMError("CALL missing name marker")
+            self.ip += 1; fname = self._read_str(); argc = self._read_svarint()
+            self._call(fname, argc); return True
+        elif name == "LITERAL_I64":
+            self.stack.append(self._read_svarint())
+        elif name == "LITERAL_STR":
+            if self.code[self.ip] != 254: raise VMError("STR missing marker")
+            self.ip += 1; self.stack.append(self._read_str())
+        elif name == "BIND_CONST":
+            if self.code[self.ip] != 254: raise VMError("BIND name missing")
+            self.ip += 1; namev = self._read_str(); val = self.stack.pop()
+            if self.arena is not None: self._charge_bind(namev, val)
+            self.env[namev] = val; self.mut[namev] = False
+        elif name == "BIND_MUT":
+            if self.code[self.ip] != 254: raise VMError("BIND name missing")
+            self.ip += 1; namev = self._read_str(); val = self.stack.pop()
+            if self.arena is not None: self._charge_bind(namev, val)
+            self.env[namev] = Cell(val); self.mut[namev] = True
+        elif name == "LOAD":
+            if self.code[self.ip] != 254: raise VMError("LOAD name missing")
+            self.ip += 1; namev = self._read_str(); self.stack.append(self._resolve_load(namev))
+        elif name == "STORE":
+            if self.code[self.ip] != 254: raise VMError("STORE name missing")
+            self.ip += 1; namev = self._read_str(); val = self.stack.pop(); self._resolve_store(namev, val)
+        elif name == "PRINT":
+            v = self.stack.pop(); self.out(v)
+        elif name == "ADD":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a+b)
+        elif name == "SUB":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a-b)
+        elif name == "MUL":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a*b)
+        elif name == "DIV":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a//b)
+        elif name == "MOD":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a%b)
+        elif name == "CMP_GT":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a>b else 0)
+        elif name == "CMP_GE":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a>=b else 0)
+        elif name == "CMP_LT":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a<b else 0)
+        elif name == "CMP_LE":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a<=b else 0)
+        elif name == "CMP_EQ":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a==b else 0)
+        elif name == "CMP_NE":
+            b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a!=b else 0)
+        elif name == "FN_LABEL":
+            # reached by fall-through: bodies only run via CALL
+            if self.ip not in self.fn_skip: raise VMError("FN_LABEL without function end")
+            self.ip = self.fn_skip[self.ip]
+        elif name == "LOOP_HEAD":
+            r = self.reductions.get(self.ip)
+            if r is not None and r.run(self): self.ip = r.exit
+        elif name in {"SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","TRACE_START","TRACE_MARK","TRACE_END","HOOK_PRE_RULE","HOOK_POST_RULE","NOP","FOR_HINT"}:
+            if name in {"SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END"}:
+                _ = self._read_svarint()
+            elif name == "FOR_HINT":
+                _ = self._read_svarint(); _ = self._read_svarint(); _ = self._read_svarint(); _ = self._read_svarint()
+        elif name == "IF_BEGIN":
+            cond = self.stack.pop()
+            if not cond: self._jump("IF_END")
+        elif name == "IF_ELSE":
+            self._jump("IF_END")
+        elif name == "IF_END":
+            pass
+        elif name == "LOOP_BEGIN":
+            cond = self.stack.pop()
+            if not cond: self._jump("LOOP_END")
+        elif name in {"LOOP_END","LOOP_CONTINUE"}:
+            if self.arena is not None: self._check_stack()
+            if self.fuel is not None: self._burn()
+            self._jump("LOOP_HEAD")
+        elif name == "LOOP_BREAK":
+            self._jump("LOOP_END")
+        elif name == "JMP":
+            self.ip = self._read_svarint()
+        elif name == "JMP_IF_FALSE":
+            target = self._read_svarint(); cond = self.stack.pop()
+            if not cond: self.ip = target
+        else:
+            raise VMError(f"Unsupported opcode {name}")
+        return True
+
+    def _call(self, fname: str, argc: int):
+        meta = self.fn_meta.get(fname)
+        if meta is None: raise VMError(f"Unknown function {fname}")
+        params = meta["params"]; caps = meta["captures"]
+        if argc != len(params): raise VMError(f"Arg mismatch: expected {len(params)} got {argc}")
+        if self.fuel is not None: self._burn()
+        frame = {}; mframe = {}
+        for pname in reversed(params):
+            val = self.stack.pop(); frame[pname] = val; mframe[pname] = False
+        # bind captures
+        for cname in caps:
+            found = False
+            for env, mut in zip(reversed(self.env_stack), reversed(self.mut_stack)):
+                if cname in env:
+                    v = env[cname]; frame[cname] = v; mframe[cname] = mut.get(cname, False); found = True; break
+            if not found: raise VMError(f"Capture '{cname}' not found")
+        if self.arena is not None: self._charge_call(frame, params)
+        self.env_stack.append(frame); self.mut_stack.append(mframe)
+        self.callstack.append(self.ip); self.ip = meta["ip"]
+
+    def _step_wide(self) -> bool:
+        """step() for wide code: operands are read in place from the
+        instruction's words and ip counts instructions."""
+        k = self.ip
+        if k >= len(self.ops):
+            return False
+        w = self.code; j = 3 * k; op = w[j]; a = w[j+1]; self.ip = k + 1
+        name = NAMES[op] if 0 <= op < TABLE_SIZE else ""
+        stack = self.stack
+        if name == "HALT":
+            self.flush(); return False
+        elif name == "RET":
+            if not self.callstack: self.flush(); return False
+            if self.arena is not None: self._release_frame()
+            self.env_stack.pop(); self.mut_stack.pop(); self.ip = self.callstack.pop()
+        elif name == "CALL":
+            self._call(self._string(a), w[j+2])
+        elif name == "LITERAL_I64":
+            stack.append(a)
+        elif name == "LITERAL_STR":
+            stack.append(self._string(a))
+        elif name == "BIND_CONST":
+            namev = self._string(a); val = stack.pop()
+            if self.arena is not None: self._charge_bind(namev, val)
+            self.env[namev] = val; self.mut[namev] = False
+        elif name == "BIND_MUT":
+            namev = self._string(a); val = stack.pop()
+            if self.arena is not None: self._charge_bind(namev, val)
+            self.env[namev] = Cell(val); self.mut[namev] = True
+        elif name == "LOAD":
+            stack.append(self._resolve_load(self._string(a)))
+        elif name == "STORE":
+            self._resolve_store(self._string(a), stack.pop())
+        elif name == "PRINT":
+            self.out(stack.pop())
+        elif name in {"ADD","SUB","MUL","DIV","MOD","CMP_GT","CMP_GE","CMP_LT","CMP_LE","CMP_EQ","CMP_NE"}:
+            y, x = stack.pop(), stack.pop()
+            if name == "ADD": stack.append(x+y)
+            elif name == "SUB": stack.append(x-y)
+            elif name == "MUL": stack.append(x*y)
+            elif name == "DIV": stack.append(x//y)
+            elif name == "MOD": stack.append(x%y)
+            elif name == "CMP_GT": stack.append(1 if x>y else 0)
+            elif name == "CMP_GE": stack.append(1 if x>=y else 0)
+            elif name == "CMP_LT": stack.append(1 if x<y else 0)
+            elif name == "CMP_LE": stack.append(1 if x<=y else 0)
+            elif name == "CMP_EQ": stack.append(1 if x==y else 0)
+            else: stack.append(1 if x!=y else 0)
+        elif name == "FN_LABEL":
+            if self.ip not in self.fn_skip: raise VMError("FN_LABEL without function end")
+            self.ip = self.fn_skip[self.ip]
+        elif name == "LOOP_HEAD":
+            r = self.reductions.get(self.ip)
+            if r is not None and r.run(self): self.ip = r.exit
+        elif name in {"SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","TRACE_START","TRACE_MARK","TRACE_END","HOOK_PRE_RULE","HOOK_POST_RULE","NOP","FOR_HINT","IF_END"}:
+            pass
+        elif name == "IF_BEGIN" or name == "LOOP_BEGIN":
+            if not stack.pop(): self._jump("IF_END" if name == "IF_BEGIN" else "LOOP_END")
+        elif name == "IF_ELSE":
+            self._jump("IF_END")
+        elif name in {"LOOP_END","LOOP_CONTINUE"}:
+            if self.arena is not None: self._check_stack()
+            if self.fuel is not None: self._burn()
+            self._jump("LOOP_HEAD")
+        elif name == "LOOP_BREAK":
+            self._jump("LOOP_END")
+        elif name == "JMP":
+            self.ip = a
+        elif name == "JMP_IF_FALSE":
+            if not stack.pop(): self.ip = a
+        else:
+            raise VMError(f"Unsupported opcode {name or op}")
+        return True
+
+    def _jump(self, target: str):
+        if self.ip not in self.jumps: raise VMError(f"Matching {target} not found")
+        self.ip = self.jumps[self.ip]
+
+    def _run_trusted(self):
+        # Fast path for certified code: the certificate proves string markers,
+        # arity, name resolution and stack depth, so none of it is re-checked
+        # here and each frame gets a preallocated operand stack of proven size.
+        from .verifier import MAIN
+        code = self.code; strings = self.strings; jumps = self.jumps
+        fn_meta = self.fn_meta; fn_skip = self.fn_skip; max_stack = self.cert.max_stack
+        env_stack = self.env_stack; mut_stack = self.mut_stack; out = self.out
+        frames = []   # (return ip, caller stack, caller sp)
+        stack = [None] * max_stack[MAIN]; sp = 0
+        n = len(code); ip = self.ip
+
+        def rd(ip):
+            shift = 0; result = 0
+            while True:
+                b = code[ip]; ip += 1
+                result |= ((b & 0x7F) << shift); shift += 7
+                if b < 128: break
+            if (b & 0x40) and shift < 64:
+                result |= - (1 << shift)
+            return result, ip
+
+        LOAD, STORE, LIT_I, LIT_S = _OP["LOAD"], _OP["STORE"], _OP["LITERAL_I64"], _OP["LITERAL_STR"]
+        BIND_C, BIND_M, PRINT, CALL, RET = _OP["BIND_CONST"], _OP["BIND_MUT"], _OP["PRINT"], _OP["CALL"], _OP["RET"]
+        ADD, SUB, MUL, DIV, MOD = _OP["ADD"], _OP["SUB"], _OP["MUL"], _OP["DIV"], _OP["MOD"]
+        GT, GE, LT, LE, EQ, NE = _OP["CMP_GT"], _OP["CMP_GE"], _OP["CMP_LT"], _OP["CMP_LE"], _OP["CMP_EQ"], _OP["CMP_NE"]
+        IF_B, IF_E, LOOP_B, LOOP_E = _OP["IF_BEGIN"], _OP["IF_ELSE"], _OP["LOOP_BEGIN"], _OP["LOOP_END"]
+        LOOP_C, LOOP_X, FN, HALT, HINT = _OP["LOOP_CONTINUE"], _OP["LOOP_BREAK"], _OP["FN_LABEL"], _OP["HALT"], _OP["FOR_HINT"]
+        HEAD = _OP["LOOP_HEAD"]; reductions = self.reductions; arena = self.arena; kinds = self.kinds
+        ONE_VARINT = {_OP[k] for k in ("SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END")}
+
+        while ip < n:
+            op = code[ip]; ip += 1
+            if op == LOAD:
+                b = code[ip+1]
+                if b < 64: name = strings[b]; ip += 2
+                else: idx, ip = rd(ip+1); name = strings[idx]
+                kind = kinds.get(name)
+                for env in reversed(env_stack):
+                    if name in env:
+                        v = env[name]; stack[sp] = v if kind is CONST else v.value if kind is MUT else unwrap(v); break
+                else:
+                    raise VMError(f"Unknown variable {name}")
+                sp += 1
+            elif op == LIT_I:
+                b = code[ip]
+                if b < 64: stack[sp] = b; ip += 1
+                elif b < 128: stack[sp] = b - 128; ip += 1
+                else: stack[sp], ip = rd(ip)
+                sp += 1
+            elif op == STORE:
+                idx, ip = rd(ip+1); name = strings[idx]; sp -= 1; val = stack[sp]
+                for env in reversed(env_stack):
+                    if name in env:
+                        cell = env[name]   # certified: STORE targets are only ever bound mutable
+                        if arena is not None: self._alloc(size_of(val) - size_of(cell.value))
+                        cell.value = val
+                        break
+                else:
+                    raise VMError(f"Unknown variable {name}")
+            elif op == ADD:
+                sp -= 1; stack[sp-1] = stack[sp-1] + stack[sp]
+            elif op == SUB:
+                sp -= 1; stack[sp-1] = stack[sp-1] - stack[sp]
+            elif op == MUL:
+                sp -= 1; stack[sp-1] = stack[sp-1] * stack[sp]
+            elif op == DIV:
+                sp -= 1; stack[sp-1] = stack[sp-1] // stack[sp]
+            elif op == MOD:
+                sp -= 1; stack[sp-1] = stack[sp-1] % stack[sp]
+            elif op == LT:
+                sp -= 1; stack[sp-1] = 1 if stack[sp-1] < stack[sp] else 0
+            elif op == LE:
+                sp -= 1; stack[sp-1] = 1 if stack[sp-1] <= stack[sp] else 0
+            elif op == GT:
+                sp -= 1; stack[sp-1] = 1 if stack[sp-1] > stack[sp] else 0
+            elif op == GE:
+                sp -= 1; stack[sp-1] = 1 if stack[sp-1] >= stack[sp] else 0
+            elif op == EQ:
+                sp -= 1; stack[sp-1] = 1 if stack[sp-1] == stack[sp] else 0
+            elif op == NE:
+                sp -= 1; stack[sp-1] = 1 if stack[sp-1] != stack[sp] else 0
+            elif op == LOOP_B:
+                sp -= 1
+                if not stack[sp]: ip = jumps[ip]
+            elif op == LOOP_E or op == LOOP_C:
+                if self.fuel is not None: self._burn()
+                ip = jumps[ip]
+            elif op == IF_B:
+                sp -= 1
+                if not stack[sp]: ip = jumps[ip]
+            elif op == IF_E or op == LOOP_X:
+                ip = jumps[ip]
+            elif op in ONE_VARINT:
+                while code[ip] >= 128: ip += 1
+                ip += 1
+            elif op == PRINT:
+                sp -= 1; out(stack[sp])
+            elif op == BIND_C or op == BIND_M:
+                idx, ip = rd(ip+1); name = strings[idx]; sp -= 1
+                if arena is not None: self._charge_bind(name, stack[sp])
+                env_stack[-1][name] = Cell(stack[sp]) if op == BIND_M else stack[sp]
+                mut_stack[-1][name] = op == BIND_M
+            elif op == LIT_S:
+                idx, ip = rd(ip+1); stack[sp] = strings[idx]; sp += 1
+            elif op == CALL:
+                idx, ip = rd(ip+1); fname = strings[idx]; _, ip = rd(ip)
+                meta = fn_meta[fname]
+                if self.fuel is not None: self._burn()
                 frame = {}; mframe = {}
-                for pname in reversed(params):
-                    val = self.stack.pop(); frame[pname] = val; mframe[pname] = False
-                # bind captures
-                for cname in caps:
-                    found = False
-                    for env, mut in zip(reversed(self.env_stack), reversed(self.mut_stack)):
+                for pname in reversed(meta["params"]):
+                    sp -= 1; frame[pname] = stack[sp]; mframe[pname] = False
+                for cname in meta["captures"]:
+                    for env, mut in zip(reversed(env_stack), reversed(mut_stack)):
                         if cname in env:
-                            v = env[cname]; frame[cname] = v; mframe[cname] = mut.get(cname, False); found = True; break
-                    if not found: raise VMError(f"Capture '{cname}' not found")
-                self.env_stack.append(frame); self.mut_stack.append(mframe)
-                self.callstack.append(self.ip); self.ip = meta["ip"]; self._log(name, pre_stack, pre_env); continue
-            elif name == "LITERAL_I64":
-                self.stack.append(self._read_svarint())
-            elif name == "LITERAL_STR":
-                if self.code[self.ip] != 254: raise VMError("STR missing marker")
-                self.ip += 1; self.stack.append(self._read_str())
-            elif name == "BIND_CONST":
-                if self.code[self.ip] != 254: raise VMError("BIND name missing")
-                self.ip += 1; namev = self._read_str(); val = self.stack.pop(); self.env[namev] = val; self.mut[namev] = False
-            elif name == "BIND_MUT":
-                if self.code[self.ip] != 254: raise VMError("BIND name missing")
-                self.ip += 1; namev = self._read_str(); val = self.stack.pop(); self.env[namev] = [val]; self.mut[namev] = True
-            elif name == "LOAD":
-                if self.code[self.ip] != 254: raise VMError("LOAD name missing")
-                self.ip += 1; namev = self._read_str(); self.stack.append(self._resolve_load(namev))
-            elif name == "STORE":
-                if self.code[self.ip] != 254: raise VMError("STORE name missing")
-                self.ip += 1; namev = self._read_str(); val = self.stack.pop(); self._resolve_store(namev, val)
-            elif name == "PRINT":
-                v = self.stack.pop(); self.out(v)
-            elif name == "ADD":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a+b)
-            elif name == "SUB":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a-b)
-            elif name == "MUL":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a*b)
-            elif name == "DIV":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a//b)
-            elif name == "MOD":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(a%b)
-            elif name == "CMP_GT":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a>b else 0)
-            elif name == "CMP_GE":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a>=b else 0)
-            elif name == "CMP_LT":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a<b else 0)
-            elif name == "CMP_LE":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a<=b else 0)
-            elif name == "CMP_EQ":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a==b else 0)
-            elif name == "CMP_NE":
-                b,a = self.stack.pop(), self.stack.pop(); self.stack.append(1 if a!=b else 0)
-            elif name in {"SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","TRACE_START","TRACE_MARK","TRACE_END","HOOK_PRE_RULE","HOOK_POST_RULE","FN_LABEL","NOP","FOR_HINT"}:
-                if name in {"SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END"}:
-                    _ = self._read_svarint()
-                elif name == "FN_LABEL":
-                    if self.code[self.ip] != 254: raise VMError("FN_LABEL inline read")
-                    self.ip += 1; _ = self._read_svarint()
-                    pc = self._read_svarint()
-                    for _ in range(pc):
-                        if self.code[self.ip] != 254: raise VMError("FN_LABEL param inline read")
-                        self.ip += 1; _ = self._read_svarint()
-                    cc = self._read_svarint()
-                    for _ in range(cc):
-                        if self.code[self.ip] != 254: raise VMError("FN_LABEL capture inline read")
-                        self.ip += 1; _ = self._read_svarint()
-                elif name == "FOR_HINT":
-                    _ = self._read_svarint(); _ = self._read_svarint(); _ = self._read_svarint(); _ = self._read_svarint()
-            elif name == "IF_BEGIN":
-                cond = self.stack.pop()
-                if not cond: self._skip_to_else_or_end()
-            elif name == "IF_ELSE":
-                self._skip_to_end()
-            elif name == "IF_END":
-                pass
-            elif name == "LOOP_BEGIN":
-                cond = self.stack.pop()
-                if not cond: self._skip_to_loop_end()
-            elif name == "LOOP_END":
-                self._jump_back_to_loop_begin()
-            elif name == "LOOP_CONTINUE":
-                self._jump_back_to_loop_begin(consume=False)
-            elif name == "LOOP_BREAK":
-                self._skip_to_loop_end()
-            elif name == "JMP":
-                self.ip = self._read_svarint()
-            elif name == "JMP_IF_FALSE":
-                target = self._read_svarint(); cond = self.stack.pop()
-                if not cond: self.ip = target
-            else:
-                raise VMError(f"Unsupported opcode {name}")
-            self._log(name, pre_stack, pre_env)
-        return self.trace_log if self.trace_enabled else None
-
-    def _skip_to_else_or_end(self):
-        depth = 1
-        while self.ip < len(self.code):
-            op = self.code[self.ip]; self.ip += 1
-            name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
-            if name == "IF_BEGIN": depth += 1
-            elif name == "IF_END":
-                depth -= 1
-                if depth == 0: return
-            elif name == "IF_ELSE" and depth == 1:
-                return
-            self._consume_if_immediate(name)
-
-    def _skip_to_end(self):
-        depth = 1
-        while self.ip < len(self.code):
-            op = self.code[self.ip]; self.ip += 1
-            name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
-            if name == "IF_BEGIN": depth += 1
-            elif name == "IF_END":
-                depth -= 1
-                if depth == 0: return
-            self._consume_if_immediate(name)
-
-    def _skip_to_loop_end(self):
-        depth = 1
-        while self.ip < len(self.code):
-            op = self.code[self.ip]; self.ip += 1
-            name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
-            if name == "LOOP_BEGIN": depth += 1
-            elif name == "LOOP_END":
-                depth -= 1
-                if depth == 0: return
-            self._consume_if_immediate(name)
-
-    def _jump_back_to_loop_begin(self, consume=True):
-        depth = 1; j = self.ip - 2
-        while j >= 0:
-            op = self.code[j]; j -= 1
-            name = UCIO_REG[op].name if op in UCIO_REG.by_code else ""
-            if name == "LOOP_END": depth += 1
-            elif name == "LOOP_BEGIN":
-                depth -= 1
-                if depth == 0: self.ip = j+1; return
-        raise VMError("Matching LOOP_BEGIN not found")
-
-    def _consume_if_immediate(self, name: str):
-        if name in {"SCOPE_ENTER","SCOPE_EXIT","RANGE_BEGIN","RANGE_END","JMP","JMP_IF_FALSE"}:
-            _ = self._read_svarint()
-        elif name in {"LITERAL_STR","BIND_CONST","BIND_MUT","LOAD","STORE","CALL","FN_LABEL"}:
-            if self.code[self.ip] == 254:
-                self.ip += 1; _ = self._read_svarint()
-                if name == "CALL":
-                    _ = self._read_svarint()
-                elif name == "FN_LABEL":
-                    pc = self._read_svarint()
-                    for _ in range(pc):
-                        if self.code[self.ip] == 254:
-                            self.ip += 1; _ = self._read_svarint()
-                    cc = self._read_svarint()
-                    for _ in range(cc):
-                        if self.code[self.ip] == 254:
-                            self.ip += 1; _ = self._read_svarint()
+                            frame[cname] = env[cname]; mframe[cname] = mut.get(cname, False); break
+                if arena is not None: self._charge_call(frame, meta["params"], max_stack[fname])
+                env_stack.append(frame); mut_stack.append(mframe)
+                frames.append((ip, stack, sp))
+                stack = [None] * max_stack[fname]; sp = 0; ip = meta["ip"]
+            elif op == RET:
+                if not frames: break
+                if arena is not None: self._release_frame()
+                env_stack.pop(); mut_stack.pop()
+                ret = stack[sp-1] if sp else None; has_ret = sp > 0
+                ip, stack, sp = frames.pop()
+                if has_ret: stack[sp] = ret; sp += 1
+            elif op == FN:
+                ip = fn_skip[ip]
+            elif op == HINT:
+                for _ in range(4): _, ip = rd(ip)
+            elif op == HEAD:
+                r = reductions.get(ip)
+                if r is not None and r.run(self): ip = r.exit
+            elif op == HALT:
+                break
+            # remaining opcodes (TRACE_*, HOOK_*, NOP, IF_END) carry no immediates
+        self.ip = ip
@@ -0,0 +1,153 @@
+
+"""Fixed-width ("wide") code encoding.
+
+Compact code is opcode bytes followed by signed varints, with string
+immediates behind a 254 marker, so it can only be decoded front to back. In
+a wide blob (`meta["encoding"] == "wide"`) instruction k occupies int64 words
+3k..3k+2 of the code, little-endian:
+
+    op  a  b
+
+    LITERAL_I64, SCOPE_*, RANGE_*   a = value
+    LITERAL_STR, BIND_*, LOAD, STORE a = string index
+    CALL                             a = name index, b = argc
+    JMP, JMP_IF_FALSE                a = target instruction index
+    FOR_HINT                         a = aux offset of [a, b, s, inclusive]
+    FN_LABEL                         a = name index, b = aux offset of
+                                         [nparams, params..., ncaptures, captures...]
+
+`meta["insns"]` is the instruction count; the aux words follow the
+instruction words. Every code offset (ip, jump table, line table, trace
+records) is an instruction index. Certificates are dropped by conversion
+because they are bound to the compact code: certify and run trusted on the
+compact form.
+"""
+from __future__ import annotations
+import sys
+from array import array
+from typing import List, Tuple
+from .emitter import _load_blob, load_sections, pack_blob
+from .debuginfo import LINES, decode_lines, encode_lines
+from .ir import _STR_TAG, _SVARINT, _svarint
+from .opcodes import NAMES, CODES, TABLE_SIZE
+
+WIDE = "wide"
+WIDTH = 3   # words per instruction
+
+_INT_OPS = {"LITERAL_I64", "SCOPE_ENTER", "SCOPE_EXIT", "RANGE_BEGIN", "RANGE_END"}
+_STR_OPS = {"LITERAL_STR", "BIND_CONST", "BIND_MUT", "LOAD", "STORE"}
+_JMP_OPS = {"JMP", "JMP_IF_FALSE"}
+_I64 = (-(1 << 63), (1 << 63) - 1)
+
+def is_wide(blob: bytes) -> bool:
+    return _load_blob(blob)[0].get("encoding") == WIDE
+
+def words(code: bytes) -> array:
+    """The code region of a wide blob as an int64 array."""
+    w = array("q")
+    w.frombytes(code)
+    if sys.byteorder == "big": w.byteswap()
+    return w
+
+def _pack(w: array) -> bytes:
+    if sys.byteorder == "big":
+        w = array("q", w); w.byteswap()
+    return w.tobytes()
+
+def instruction(w: array, strings: List[str], k: int) -> Tuple[str, list]:
+    """Decode instruction `k` of a wide code array in O(1): (name, operands)
+    with string operands resolved."""
+    j = WIDTH * k; op = w[j]; a = w[j+1]; b = w[j+2]
+    name = NAMES[op] if 0 <= op < TABLE_SIZE else f"<op#{op}>"
+    def s(i): return strings[i] if 0 <= i < len(strings) else f"<str#{i}>"
+    if name in _INT_OPS or name in _JMP_OPS: return name, [a]
+    if name in _STR_OPS: return name, [s(a)]
+    if name == "CALL": return name, [s(a), b]
+    if name == "FOR_HINT": return name, list(w[a:a+4])
+    if name == "FN_LABEL":
+        pc = w[b]; cc = w[b+1+pc]
+        return name, [s(a), [s(x) for x in w[b+1:b+1+pc]], [s(x) for x in w[b+2+pc:b+2+pc+cc]]]
+    return name, []
+
+def to_wide(blob: bytes) -> bytes:
+    """Re-encode a compact blob with fixed-width instructions (a wide blob is
+    returned unchanged). Raises ValueError for immediates outside int64."""
+    meta, code = _load_blob(blob)
+    if meta.get("encoding") == WIDE:
+        return blob
+    from .verifier import _decode
+    insns = _decode(code)
+    index = {at - 1: k for k, (at, _, _) in enumerate(insns)}
+    w = array("q", [0]) * (WIDTH * len(insns)); aux: List[int] = []
+    for k, (at, name, args) in enumerate(insns):
+        a = b = 0
+        if name in _JMP_OPS:
+            if args[0] not in index: raise ValueError(f"Jump target {args[0]} at {at-1} is not an instruction")
+            a = index[args[0]]
+        elif name == "CALL":
+            a, b = args
+        elif name == "FOR_HINT":
+            a = len(aux); aux.extend(args)
+        elif name == "FN_LABEL":
+            a = args[0]; b = len(aux); aux.extend(args[1:])
+        elif args:
+            a = args[0]
+        for v in (a, b):
+            if not _I64[0] <= v <= _I64[1]: raise ValueError(f"Immediate {v} at {at-1} does not fit a wide operand word")
+        j = WIDTH * k; w[j] = CODES[name]; w[j+1] = a; w[j+2] = b
+    base = len(w)
+    for k, (_, name, _) in enumerate(insns):   # aux offsets are absolute word indices
+        if name == "FOR_HINT": w[WIDTH*k+1] += base
+        elif name == "FN_LABEL": w[WIDTH*k+2] += base
+    for v in aux:
+        if not _I64[0] <= v <= _I64[1]: raise ValueError(f"Immediate {v} does not fit a wide operand word")
+    w.extend(aux)
+    sections = load_sections(blob)
+    if LINES in sections:
+        # line entries sit on instruction starts; anything else moves to the next one
+        from bisect import bisect_left
+        starts = [at - 1 for at, _, _ in insns]
+        def move(p: int) -> int:
+            return index.get(p, bisect_left(starts, p))
+        sections[LINES] = encode_lines((move(p), l, c) for p, l, c in decode_lines(sections[LINES]))
+    meta = {k: v for k, v in meta.items() if k != "cert"}
+    meta["encoding"] = WIDE; meta["insns"] = len(insns)
+    return pack_blob(meta, _pack(w), sections)
+
+def to_compact(blob: bytes) -> bytes:
+    """Re-encode a wide blob in the compact varint form (a compact blob is
+    returned unchanged)."""
+    meta, code = _load_blob(blob)
+    if meta.get("encoding") != WIDE:
+        return blob
+    w = words(code); n = meta["insns"]
+    def sv(v): return _SVARINT.get(v) or _svarint(v)
+    def st(i): return bytes([_STR_TAG]) + sv(i)
+    def enc(k: int, pos: List[int]) -> bytes:
+        j = WIDTH * k; op = w[j]; a = w[j+1]; b = w[j+2]; name = NAMES[op]
+        head = bytes([op])
+        if name in _JMP_OPS: return head + sv(pos[a] if a < n else pos[n])
+        if name in _INT_OPS: return head + sv(a)
+        if name in _STR_OPS: return head + st(a)
+        if name == "CALL": return head + st(a) + sv(b)
+        if name == "FOR_HINT": return head + b"".join(sv(x) for x in w[a:a+4])
+        if name == "FN_LABEL":
+            pc = w[b]; cc = w[b+1+pc]
+            return (head + st(a) + sv(pc) + b"".join(st(x) for x in w[b+1:b+1+pc])
+                    + sv(cc) + b"".join(st(x) for x in w[b+2+pc:b+2+pc+cc]))
+        return head
+    # Jump immediates are byte offsets that depend on the sizes before them;
+    # iterate until the layout is stable (one pass without jumps).
+    jumps = any(NAMES[w[WIDTH*k]] in _JMP_OPS for k in range(n))
+    pos = [0] * (n + 1)
+    while True:
+        parts = [enc(k, pos) for k in range(n)]
+        new = [0] * (n + 1)
+        for k, p in enumerate(parts): new[k+1] = new[k] + len(p)
+        stable = new == pos or not jumps; pos = new
+        if stable: break
+    sections = load_sections(blob)
+    if LINES in sections:
+        sections[LINES] = encode_lines((pos[min(p, n)], l, c) for p, l, c in decode_lines(sections[LINES]))
+    meta = {k: v for k, v in meta.items() if k not in ("encoding", "insns", "cert")}
+    return pack_blob(meta, b"".join(parts), sections)
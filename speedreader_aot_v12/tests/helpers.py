@@ -0,0 +1,26 @@
+"""Compile sources and collect what a run prints."""
+from __future__ import annotations
+from typing import Any, List
+from speedreader.emitter import _load_blob
+from speedreader.parser import Parser, compile_to_bytes
+from speedreader.optimizer import optimize
+from speedreader.verifier import _decode, certify
+from speedreader.vm import VM
+
+BUDGETS = {"PRINT": 1_000_000, "MUTATE": 1_000_000, "LOOP_FUEL": 1_000_000}
+
+def compile_src(src: str, opt: bool = False) -> bytes:
+    Parser._scope_id = 0   # scope ids are global to the process
+    blob = compile_to_bytes(src)
+    return optimize(blob) if opt else blob
+
+def run(blob: bytes, **kw) -> List[Any]:
+    out: List[Any] = []
+    VM(blob, stdout=out.append, **kw).run()
+    return out
+
+def run_trusted(blob: bytes, budgets=None, **kw) -> List[Any]:
+    return run(blob, trusted=True, certificate=certify(blob, budgets or BUDGETS), **kw)
+
+def ops(blob: bytes) -> List[str]:
+    return [name for _, name, _ in _decode(_load_blob(blob)[1])]
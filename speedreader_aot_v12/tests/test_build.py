@@ -0,0 +1,110 @@
+import ast, json, os
+import pytest
+from speedreader import build as build_mod
+from speedreader.build import MANIFEST, _COMPILER, build
+from speedreader.linker import link_info
+
+SOURCES = {
+    "a.sr": "let mut s = 0\nfor (i in 0..4) {\n  s = s + i\n}\nprint s\n",
+    "sub/b.sr": "print 2 * 3\n",
+    "lib/util.sr": "fn twice(n) {\n  print n * 2\n}\n",
+}
+
+def _imports(mod: str, seen: set):
+    # Modules of the package `mod` imports, at any depth of the file.
+    if mod in seen: return
+    seen.add(mod)
+    with open(os.path.join(os.path.dirname(build_mod.__file__), mod + ".py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level == 1:
+            for name in [node.module] if node.module else [a.name for a in node.names]:
+                _imports(name.split(".")[0], seen)
+
+def test_compiler_fingerprint_covers_every_compiler_module():
+    seen = set()
+    for mod in ("parser", "optimizer", "verifier", "linker"):   # what _build_one runs
+        _imports(mod, seen)
+    assert sorted(_COMPILER) == sorted(seen)
+    assert len(set(_COMPILER)) == len(_COMPILER)
+
+@pytest.fixture
+def tree(tmp_path):
+    src = tmp_path / "src"
+    for rel, text in SOURCES.items():
+        (src / rel).parent.mkdir(parents=True, exist_ok=True)
+        (src / rel).write_text(text)
+    return src, tmp_path / "out"
+
+def manifest(out):
+    return json.loads((out / MANIFEST).read_text())
+
+def outputs(out):
+    return {rel: (out / rel).with_suffix(".srdg").read_bytes() for rel in SOURCES}
+
+def test_first_build_then_noop(tree):
+    src, out = tree
+    report = build(str(src), str(out), jobs=1, libs=["lib/*"])
+    assert sorted(report.built) == sorted(SOURCES) and not report.failed
+    before = (out / MANIFEST).read_bytes(); mtime = (out / MANIFEST).stat().st_mtime_ns
+    report = build(str(src), str(out), jobs=1, libs=["lib/*"])
+    assert report.total == 3 and report.built == [] and not report.failed
+    assert (out / MANIFEST).read_bytes() == before and (out / MANIFEST).stat().st_mtime_ns == mtime
+
+def test_touched_identical_source_only_refreshes_stamp(tree):
+    src, out = tree
+    build(str(src), str(out), jobs=1)
+    blob = out / "a.srdg"; blob_mtime = blob.stat().st_mtime_ns
+    old = manifest(out)["files"]["a.sr"]
+    st = (src / "a.sr").stat(); os.utime(src / "a.sr", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert build(str(src), str(out), jobs=1).built == []
+    new = manifest(out)["files"]["a.sr"]
+    assert new["key"] == old["key"] and new["stamp"] != old["stamp"]
+    assert blob.stat().st_mtime_ns == blob_mtime
+
+def test_changed_source_is_rebuilt(tree):
+    src, out = tree
+    build(str(src), str(out), jobs=1)
+    before = outputs(out); key = manifest(out)["files"]["sub/b.sr"]["key"]
+    (src / "sub/b.sr").write_text("print 2 * 3\nprint 4\n")
+    assert build(str(src), str(out), jobs=1).built == ["sub/b.sr"]
+    after = outputs(out)
+    assert after["sub/b.sr"] != before["sub/b.sr"] and after["a.sr"] == before["a.sr"]
+    assert manifest(out)["files"]["sub/b.sr"]["key"] != key
+
+def test_changed_option_rebuilds_everything(tree):
+    src, out = tree
+    build(str(src), str(out), jobs=1)
+    prefix = manifest(out)["prefix"]
+    assert sorted(build(str(src), str(out), jobs=1, opt=True).built) == sorted(SOURCES)
+    assert manifest(out)["prefix"] != prefix
+    assert build(str(src), str(out), jobs=1, opt=True).built == []
+
+def test_lib_glob_compiles_libraries(tree):
+    src, out = tree
+    build(str(src), str(out), jobs=1, verify=True, libs=["lib/*"])
+    assert link_info((out / "lib/util.srdg").read_bytes())["module"] == "util"
+    assert "module" not in link_info((out / "a.srdg").read_bytes())
+    # whether a file is a library is part of its stamp and key
+    assert build(str(src), str(out), jobs=1, verify=True).built == ["lib/util.sr"]
+    assert "module" not in link_info((out / "lib/util.srdg").read_bytes())
+
+def test_failed_file_stays_out_of_manifest(tree):
+    src, out = tree
+    (src / "bad.sr").write_text("print (\n")
+    report = build(str(src), str(out), jobs=1)
+    assert list(report.failed) == ["bad.sr"] and len(report.built) == 3
+    assert "bad.sr" not in manifest(out)["files"] and not (out / "bad.srdg").exists()
+    assert list(build(str(src), str(out), jobs=1).failed) == ["bad.sr"]   # retried
+    (src / "bad.sr").write_text("print 1\n")
+    assert build(str(src), str(out), jobs=1).built == ["bad.sr"]
+    assert "bad.sr" in manifest(out)["files"]
+
+def test_pool_matches_in_process_build(tree, tmp_path):
+    src, out = tree
+    one = build(str(src), str(out), jobs=1, opt=True, certify=True, libs=["lib/*"])
+    pool_out = tmp_path / "pool"
+    many = build(str(src), str(pool_out), jobs=2, opt=True, certify=True, libs=["lib/*"])
+    assert sorted(one.built) == sorted(many.built) == sorted(SOURCES)
+    assert outputs(out) == outputs(pool_out)
+    assert manifest(out) == manifest(pool_out)
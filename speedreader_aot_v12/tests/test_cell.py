@@ -0,0 +1,53 @@
+from speedreader.cell import CONST, MUT, Cell, bind_kind, unwrap
+from speedreader.snapshot import restore_snapshot, take_snapshot
+from speedreader.vm import VM
+from .helpers import compile_src, run, run_trusted
+
+SHARED = """let mut g = 1
+fn bump() capture[g] {
+  g = g + 10
+}
+fn show() capture[g] {
+  print g
+}
+bump()
+show()
+g = g + 1
+show()
+bump()
+print g
+"""
+
+def test_bind_kind():
+    kinds = {}
+    bind_kind(kinds, "a", MUT); bind_kind(kinds, "a", MUT)
+    bind_kind(kinds, "b", CONST)
+    bind_kind(kinds, "x", MUT); bind_kind(kinds, "x", CONST)
+    assert kinds == {"a": MUT, "b": CONST, "x": None}
+    assert unwrap(Cell(3)) == unwrap(3) == 3
+
+def test_kinds_come_from_the_code():
+    vm = VM(compile_src("let mut a = 1\nlet b = 2\nfn f(x) {\n  print x\n}\nlet mut x = 3\nf(a)\n"), stdout=lambda v: None)
+    assert (vm.kinds["a"], vm.kinds["b"], vm.kinds["x"]) == (MUT, CONST, None)
+
+def test_captures_share_the_cell():
+    for run_ in (lambda s: run(compile_src(s)), lambda s: run(compile_src(s, True)), lambda s: run_trusted(compile_src(s, True))):
+        assert run_(SHARED) == [11, 12, 22]
+
+def test_name_bound_both_ways():
+    src = "fn f(x) {\n  let y = x + 1\n  print y\n}\nlet mut y = 5\nf(y)\ny = y * 2\nf(y)\nprint y\n"
+    assert run(compile_src(src)) == run(compile_src(src, True)) == [6, 11, 10]
+    src = "fn f(x) {\n  print x + 1\n}\nlet mut x = 5\nf(x)\nx = x * 2\nf(x)\nprint x\n"
+    assert run(compile_src(src)) == run_trusted(compile_src(src, True)) == [6, 11, 10]
+
+def test_snapshot_keeps_captured_cells_shared():
+    blob = compile_src(SHARED)
+    out = []
+    vm = VM(blob, stdout=out.append); vm.reductions = {}
+    while len(vm.env_stack) < 2:   # stop inside the first call
+        assert vm.step()
+    rest = []
+    vm2 = restore_snapshot(blob, take_snapshot(vm), stdout=rest.append)
+    assert vm2.env_stack[0]["g"] is vm2.env_stack[1]["g"]
+    vm2.run()
+    assert out + rest == run(blob)
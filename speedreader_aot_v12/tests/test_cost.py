@@ -0,0 +1,77 @@
+import pytest
+from speedreader.verifier import VerifyError, certify, cost_report, verify
+from speedreader.vm import VM, VMError
+from .helpers import BUDGETS, compile_src, run, run_trusted
+
+NESTED = """fn show(x) {
+  print x
+}
+for (i in 0..10) {
+  for (j in 0..=4; step 2) {
+    show(i * j)
+  }
+}
+"""
+
+def test_nested_range_loops_and_calls():
+    blob = compile_src(NESTED)
+    c = cost_report(blob).program
+    assert (c.prints, c.fuel) == (30, 10 + 30 + 30)
+    assert cost_report(blob).functions["show"].prints == 1
+    assert len(run(blob, fuel=70)) == 30
+    with pytest.raises(VMError, match="Fuel exhausted"):
+        run(blob, fuel=69)
+
+def test_certified_cost_drops_fuel_check_only_when_it_fits():
+    blob = compile_src(NESTED, opt=True)
+    cert = certify(blob, BUDGETS)
+    assert cert.cost.fuel == 70
+    assert VM(blob, stdout=lambda v: None, trusted=True, certificate=cert, fuel=70).fuel is None
+    assert VM(blob, stdout=lambda v: None, trusted=True, certificate=cert, fuel=69).fuel == 69
+
+@pytest.mark.parametrize("src", [
+    # a callee rewinds the loop variable through a capture
+    "fn reset() capture[i] {\n  i = 0\n}\nfor (i in 0..3) {\n  print i\n  reset()\n}\n",
+    # ... or through dynamic lookup
+    "fn reset() {\n  i = 0\n}\nfor (i in 0..3) {\n  print i\n  reset()\n}\n",
+    # ... or through a callee's callee
+    "fn reset() capture[i] {\n  i = 0\n}\nfn go() {\n  reset()\n}\nfor (i in 0..3) {\n  print i\n  go()\n}\n",
+    # the body stores or rebinds it
+    "for (i in 0..3) {\n  print i\n  i = 0\n}\n",
+    "for (i in 0..3) {\n  print i\n  let mut i = 0\n}\n",
+])
+def test_loop_variable_written_outside_the_step_is_unbounded(src):
+    blob = compile_src(src)
+    assert cost_report(blob).program is None
+    with pytest.raises(VMError, match="Fuel exhausted"):
+        run(blob, fuel=20)
+    with pytest.raises(VMError, match="Fuel exhausted"):
+        run_trusted(compile_src(src, True), fuel=20)
+
+def test_continue_skips_the_step():
+    src = "let mut n = 0\nfor (i in 0..3) {\n  n = n + 1\n  if n < 5 { continue }\n}\nprint n\n"
+    blob = compile_src(src)
+    assert cost_report(blob).program is None
+    assert run(blob) == [7]
+
+def test_computed_bound_is_not_trusted():
+    blob = compile_src("for (i in 0..2 * 50) {\n  print i\n}\n")
+    c = cost_report(blob).program
+    assert c is None or c.fuel >= 100
+    with pytest.raises(VMError, match="Fuel exhausted"):
+        run(blob, fuel=10)
+    with pytest.raises(VMError, match="Fuel exhausted"):
+        run_trusted(compile_src("for (i in 0..2 * 50) {\n  print i\n}\n", True), fuel=10)
+
+def test_recursion_is_unbounded():
+    report = cost_report(compile_src("fn down(n) {\n  if n > 0 { down(n - 1) }\n}\ndown(3)\n"))
+    assert report.program is None and report.recursive == ["down"]
+
+def test_instruction_budget_admission():
+    blob = compile_src(NESTED)
+    total = cost_report(blob).program.instructions
+    verify(blob, dict(BUDGETS, INSTRUCTIONS=total))
+    with pytest.raises(VerifyError, match="Worst-case INSTRUCTIONS"):
+        verify(blob, dict(BUDGETS, INSTRUCTIONS=total - 1))
+    with pytest.raises(VerifyError, match="Worst-case PRINT"):
+        verify(blob, dict(BUDGETS, INSTRUCTIONS=10**9, PRINT=29))
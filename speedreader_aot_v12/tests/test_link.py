@@ -0,0 +1,67 @@
+import pytest
+from speedreader.debuginfo import LineTable
+from speedreader.emitter import _load_blob
+from speedreader.linker import LinkError, compile_library, link, link_info
+from speedreader.parser import Parser
+from speedreader.verifier import _decode
+from speedreader.vm import VMError
+from .helpers import compile_src, run, run_trusted
+
+MATHLIB = """fn tri(n) {
+  let mut s = 0
+  for (i in 0..=n) {
+    s = s + i
+  }
+  print s
+}
+"""
+MAIN = "import mathlib\nfor (j in 1..4) {\n  tri(j)\n}\n"
+
+def lib(src: str, module: str) -> bytes:
+    Parser._scope_id = 0
+    return compile_library(src, module)
+
+def scopes(blob: bytes):
+    return [args[0] for _, name, args in _decode(_load_blob(blob)[1]) if name == "SCOPE_ENTER"]
+
+def test_link_runs_checked_and_trusted():
+    blob = link(compile_src(MAIN), [lib(MATHLIB, "mathlib")])
+    assert link_info(blob) == {}
+    assert run(blob) == run_trusted(blob) == [1, 3, 6]
+
+def test_linked_library_keeps_module_and_exports():
+    blob = link(lib(MATHLIB, "mathlib"), [lib("fn two() {\n  print 2\n}\n", "two")])
+    assert link_info(blob) == {"imports": [], "module": "mathlib", "exports": ["tri", "two"]}
+
+@pytest.mark.parametrize("entry, libs, message", [
+    (MAIN, [("fn tri(n) {\n  print n\n}\n", "mathlib"), ("fn tri(n) {\n  print n\n}\n", "other")],
+     "Symbol clash: function tri is defined in mathlib and other"),
+    (MAIN, [(MATHLIB, "mathlib"), (MATHLIB, "mathlib")], "Module mathlib linked twice"),
+    (MAIN, [], "Unresolved import mathlib in <entry>"),
+    ("import mathlib\nmissing(1)\n", [(MATHLIB, "mathlib")], "Undefined function missing (called from <entry>)"),
+])
+def test_link_errors(entry, libs, message):
+    parts = [lib(src, module) for src, module in libs]
+    with pytest.raises(LinkError) as e:
+        link(compile_src(entry), parts)
+    assert str(e.value) == message
+
+def test_program_is_not_a_library():
+    with pytest.raises(LinkError, match="Blob 1 is not a library"):
+        link(compile_src(MAIN), [compile_src("print 1\n")])
+
+def test_scope_ids_are_renumbered_per_part():
+    prog = compile_src(MAIN); mathlib = lib(MATHLIB, "mathlib")
+    assert scopes(prog) == [1] and scopes(mathlib) == [1, 2]
+    assert scopes(link(prog, [mathlib])) == [1, 2, 3]
+
+def test_line_tables_are_carried_through():
+    bad = lib("fn boom() {\n  print 1\n  print nope\n}\n", "bad")
+    prog = compile_src("import bad\nprint 0\nboom()\n")
+    blob = link(prog, [bad])
+    with pytest.raises(VMError) as e:
+        run(blob)
+    assert e.value.line == 3   # the library's own line
+    base = len(_load_blob(prog)[1])   # library code follows the entry's
+    entries = LineTable.from_blob(blob).entries
+    assert entries == LineTable.from_blob(prog).entries + [(p + base, l, c) for p, l, c in LineTable.from_blob(bad).entries]
@@ -0,0 +1,62 @@
+import pytest
+from speedreader.emitter import _load_blob
+from speedreader.memory import Arena, static_bound
+from speedreader.verifier import VerifyError, _decode, certify, verify
+from speedreader.vm import VM, VMError
+from .helpers import BUDGETS, compile_src, run, run_trusted
+
+STRCAT = 'let mut s = ""\nfor (i in 0..1000) {\n  s = s + "ab"\n}\nprint 1\n'
+
+def bound(src: str):
+    meta, code = _load_blob(compile_src(src))
+    return static_bound(_decode(code), meta["strings"])
+
+def test_arena():
+    a = Arena(100)
+    assert a.alloc(60) and not a.alloc(41) and a.used == 60
+    a.free(60)
+    assert a.alloc(100) and a.peak == 100
+
+def test_range_loop_growth_is_extrapolated():
+    b = bound(STRCAT)
+    assert b is not None and b >= 2000
+    assert run(compile_src(STRCAT), memory=b) == [1]
+    with pytest.raises(VMError, match="MEMORY budget exceeded"):
+        run(compile_src(STRCAT), memory=b - 1000)
+
+@pytest.mark.parametrize("src", [
+    # a computed bound gives no FOR_HINT to extrapolate from
+    'let mut s = ""\nfor (i in 0..2 * 20000) {\n  s = s + "abcdefgh"\n}\nprint 1\n',
+    # a callee rewinds the loop variable
+    'let mut s = ""\nfn back() capture[i] {\n  i = 0\n}\nfor (i in 0..3) {\n  s = s + "ab"\n  back()\n}\n',
+    # a callee grows the caller's binding by dynamic lookup
+    'let mut s = ""\nfn grow() {\n  s = "abcdefghijklmnopqrstuvwxyz"\n}\ngrow()\nprint 1\n',
+    'let mut s = "a"\nfor (i in 0..3) {\n  s = s + s\n}\n',
+    "fn f(n) {\n  if n > 0 { f(n - 1) }\n}\nf(10)\n",
+])
+def test_unprovable_programs_have_no_bound(src):
+    assert bound(src) is None
+
+def test_trusted_runs_keep_the_arena_without_a_proven_bound():
+    src = 'let mut s = ""\nfor (i in 0..2 * 20000) {\n  s = s + "abcdefgh"\n}\nprint 1\n'
+    blob = compile_src(src, opt=True)
+    assert certify(blob, dict(BUDGETS, MEMORY=5000)).memory is None
+    with pytest.raises(VMError, match="MEMORY budget exceeded"):
+        run(blob, memory=5000)
+    with pytest.raises(VMError, match="MEMORY budget exceeded"):
+        run_trusted(blob, dict(BUDGETS, MEMORY=5000), memory=5000)
+
+def test_proven_bound_skips_accounting_and_rejects_at_verify():
+    blob = compile_src(STRCAT, opt=True)
+    cert = certify(blob, BUDGETS)
+    vm = VM(blob, stdout=lambda v: None, trusted=True, certificate=cert, memory=cert.memory)
+    assert vm.arena is None
+    vm.run()
+    with pytest.raises(VerifyError, match="MEMORY budget exceeded"):
+        verify(blob, dict(BUDGETS, MEMORY=cert.memory - 1))
+
+def test_frames_give_their_charges_back():
+    src = "fn f(a) {\n  let t = a + 1\n  print t\n}\nfor (i in 0..100) {\n  f(i)\n}\n"
+    vm = VM(compile_src(src), stdout=lambda v: None, memory=10_000)
+    vm.run()
+    assert vm.arena.used < 1000 and vm.arena.peak < 1000
@@ -0,0 +1,29 @@
+import pytest
+from speedreader.parallel import ParallelLoop
+from speedreader.vm import VM
+from .helpers import compile_src, run
+
+PROGRAMS = [
+    # bound under a condition in one early chunk only
+    "let y = 0 - 1\nfor (i in 0..2000) {\n  if i == 5 {\n    let y = i\n  }\n}\nprint y\n",
+    # ... in several chunks, the last write wins
+    "let y = 0\nfor (i in 0..4000) {\n  if i % 1500 == 7 {\n    let y = i\n  }\n}\nprint y\n",
+    "fn show(n) {\n  print n * 2\n}\nlet mut total = 0\nlet mut s = \"\"\nfor (i in 0..3000) {\n"
+    "  show(i)\n  let sq = i * i\n  if sq % 7 == 0 { total = total + sq } else { total = total - 1 }\n"
+    "  s = s + \"x\"\n}\nprint total\nprint sq\nprint s\n",
+    "let mut prod = 1\nfor (i in 1..=3000; step 1) {\n  prod = prod * (i % 5 + 1)\n}\nprint prod % 1000007\n",
+    "let k = 0 - 3\nlet mut t = 0\nfor (i in 6000..0; step k) {\n  t = t + i\n  print i % 4\n}\nprint t\n",
+]
+
+@pytest.mark.parametrize("src", PROGRAMS)
+def test_parallel_matches_sequential(src):
+    blob = compile_src(src)
+    vm = VM(blob, stdout=lambda v: None, parallel=4)
+    assert any(isinstance(r, ParallelLoop) for r in vm.reductions.values())
+    assert run(blob, parallel=4) == run(blob, fold_loops=False)
+
+def test_loops_reading_an_earlier_iteration_stay_sequential():
+    src = "let mut last = 0\nfor (i in 0..5000) {\n  last = i\n}\nprint last\n"
+    vm = VM(compile_src(src), stdout=lambda v: None, parallel=4)
+    assert not any(isinstance(r, ParallelLoop) for r in vm.reductions.values())
+    assert run(compile_src(src), parallel=4) == [4999]
@@ -0,0 +1,64 @@
+import pytest
+from speedreader.debuginfo import LineTable
+from speedreader.parser import Parser, compile_file
+from speedreader.vm import VMError
+from .helpers import compile_src, run, run_trusted, ops
+
+def test_binary_arithmetic_precedence():
+    src = "print 1 + 2 * 3\nprint (1 + 2) * 3\nprint 7 - 4 - 2\nprint 17 % 5 * 2\n"
+    for opt in (False, True):
+        assert run(compile_src(src, opt)) == [7, 9, 1, 4]
+
+def test_range_bounds_are_evaluated_unless_single_literals():
+    src = "let mut c = 0\nfor (i in 0..2 * 50) {\n  c = c + 1\n}\nprint c\n"
+    blob = compile_src(src)
+    assert "FOR_HINT" not in ops(blob)
+    assert run(blob) == [100]
+    assert "FOR_HINT" in ops(compile_src("for (i in 0..3) {\n  print i\n}\n"))
+
+def test_range_start_expression():
+    assert run(compile_src("for (i in 1 + 1..5) {\n  print i\n}\n")) == [2, 3, 4]
+
+def test_step_expression_with_leading_literal():
+    src = "for (i in 0..12; step 2 * 3) {\n  print i\n}\n"
+    assert "FOR_HINT" not in ops(compile_src(src))
+    for opt in (False, True):
+        assert run(compile_src(src, opt)) == [0, 6]
+
+@pytest.mark.parametrize("src, expected", [
+    ("let k = 4\nfor (i in 0..10; step k) {\n  print i\n}\n", [0, 4, 8]),
+    ("let k = 0 - 4\nfor (i in 10..0; step k) {\n  print i\n}\n", [10, 6, 2]),
+    ("let k = 0 - 5\nfor (i in 10..=0; step k) {\n  print i\n}\n", [10, 5, 0]),
+    ("let k = 5\nfor (i in 0..=10; step k) {\n  print i\n}\n", [0, 5, 10]),
+])
+def test_step_sign_known_only_at_run_time(src, expected):
+    for opt in (False, True):
+        blob = compile_src(src, opt)
+        assert run(blob) == expected
+        assert run(blob, fold_loops=False) == expected
+    assert run_trusted(compile_src(src, True)) == expected
+
+def test_literal_steps():
+    assert run(compile_src("for (i in 0..=6; step 3) {\n  print i\n}\n")) == [0, 3, 6]
+    assert run(compile_src("for (i in 0..7; step 3) {\n  print i\n}\n")) == [0, 3, 6]
+
+def test_constant_folding_replaces_operands():
+    blob = compile_src("print 2 * 3 + 1\nif 1 < 2 {\n  print 5\n}\n", opt=True)
+    assert ops(blob).count("LITERAL_I64") == 3
+    assert run(blob) == [7, 5]
+    assert run_trusted(blob) == [7, 5]
+
+def test_folded_code_keeps_line_numbers():
+    blob = compile_src("let x = 2 * 3 + 4\nprint y\n", opt=True)
+    with pytest.raises(VMError) as e:
+        run(blob)
+    assert e.value.line == 2
+
+def test_spilled_compile_matches_in_memory(tmp_path):
+    src = "let mut x = 0\n" + "".join(f"x = x + {k} * 3\nprint x\n" for k in range(2000))
+    (tmp_path / "a.sr").write_text(src)
+    Parser._scope_id = 0
+    compile_file(str(tmp_path / "a.sr"), str(tmp_path / "a.srbc"), spill_threshold=64)
+    blob = (tmp_path / "a.srbc").read_bytes()
+    assert blob == compile_src(src)
+    assert LineTable.from_blob(blob).offsets(4001)
@@ -0,0 +1,66 @@
+import pytest
+from speedreader.optimizer import optimize
+from speedreader.pgo import HOT, ProfileError, collect
+from speedreader.profiler import Profiler
+from speedreader.vm import VM
+from .helpers import compile_src, ops, run, run_trusted
+
+PROGRAM = """fn sq(x) {
+  let t = x * x
+  print t
+}
+fn late(a) {
+  print t
+  let t = a
+}
+let t = 7
+let mut i = 0
+while i < 200 {
+  if i < 150 { sq(i) } else { print "hi" }
+  late(i)
+  i = i + 1
+}
+let mut total = 0
+for (j in 0..2000) {
+  let q = j * 3
+  if q % 2 == 0 { total = total + q }
+  print q % 5
+}
+print total
+print t
+"""
+
+def profiled(src: str):
+    blob = compile_src(src, opt=True)
+    prof = Profiler(); vm = VM(blob, profiler=prof, stdout=lambda v: None); vm.run()
+    return collect(prof, vm)
+
+def test_profile_counts_hot_sites():
+    p = profiled(PROGRAM)
+    assert sorted(p["calls"].values()) == [150, 200]
+    assert any(tc == [150, 50] for tc in p["branches"].values())
+
+def test_hot_leaf_calls_are_inlined():
+    blob = optimize(compile_src(PROGRAM), profile=profiled(PROGRAM))
+    names = ops(blob)
+    assert names.count("CALL") == 1          # `late` reads t before binding it
+    assert names.count("FN_LABEL") == 1      # `sq` has no calls left
+
+def test_pgo_checked_trusted_parallel_parity():
+    expected = run(compile_src(PROGRAM))
+    blob = optimize(compile_src(PROGRAM), profile=profiled(PROGRAM))
+    assert run(blob) == expected
+    assert run(blob, fold_loops=False) == expected
+    assert run(blob, parallel=4) == expected
+    assert run_trusted(blob) == expected
+    assert run_trusted(compile_src(PROGRAM, True)) == expected
+
+def test_cold_sites_are_left_alone():
+    src = PROGRAM.replace("i < 200", f"i < {HOT // 2}")
+    blob = optimize(compile_src(src), profile=profiled(src))
+    assert ops(blob).count("CALL") == ops(compile_src(src, True)).count("CALL")
+    assert run(blob) == run(compile_src(src))
+
+def test_profile_of_other_code_is_rejected():
+    with pytest.raises(ProfileError, match="different code"):
+        optimize(compile_src("print 1\n"), profile=profiled(PROGRAM))
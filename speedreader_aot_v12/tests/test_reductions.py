@@ -0,0 +1,62 @@
+import pytest
+from speedreader.cell import unwrap
+from speedreader.reductions import Reduction
+from speedreader.vm import VM, VMError
+from .helpers import compile_src, run
+
+LOOPS = {
+    "map": "let mut x = 0\nfor (i in 0..100) {\n  x = i * i + 3\n}\nprint x\nprint i\n",
+    "sum": "let mut x = 5\nfor (i in 0..=100; step 3) {\n  x = x + i * i - 2 * i + 7\n}\nprint x\n",
+    "affine": "let mut x = 1\nfor (i in 0..60) {\n  x = 3 * x + 2\n}\nprint x\n",
+    "product": "let mut x = 1\nfor (i in 1..=40) {\n  x = x * i\n}\nprint x\n",
+    "generic": "let mut x = 1\nfor (i in 0..50) {\n  x = x * i + i\n}\nprint x\n",
+    "several": "let mut a = 0\nlet mut b = 1\nfor (i in 0..30) {\n  a = a + i\n  b = b * 2\n}\nprint a\nprint b\n",
+    "negative step": "let mut x = 0\nfor (i in 100..0; step 0 - 7) {\n  x = x + i * 3\n}\nprint x\nprint i\n",
+    "negative inclusive": "let mut x = 1\nfor (i in 20..=2; step 0 - 2) {\n  x = x * i\n}\nprint x\n",
+    "step binding": "let k = 3\nlet mut x = 0\nfor (i in 0..100; step k) {\n  x = x + i\n}\nprint x\nprint i\n",
+    "negative step binding": "let k = 0 - 4\nlet mut x = 0\nfor (i in 50..=0; step k) {\n  x = x + i\n}\nprint x\n",
+    "empty": "let mut x = 9\nfor (i in 5..5) {\n  x = x + i\n}\nprint x\nprint i\n",
+}
+
+def folded(blob) -> bool:
+    vm = VM(blob, stdout=lambda v: None)
+    return any(isinstance(r, Reduction) for r in vm.reductions.values())
+
+@pytest.mark.parametrize("name", LOOPS)
+def test_folded_loop_matches_interpreter(name):
+    for opt in (False, True):
+        blob = compile_src(LOOPS[name], opt)
+        assert folded(blob)
+        assert run(blob) == run(blob, fold_loops=False)
+
+def test_non_int_values_are_interpreted():
+    src = 'let mut x = ""\nfor (i in 0..3) {\n  x = x + "ab"\n}\nprint x\n'
+    blob = compile_src(src)
+    assert run(blob) == run(blob, fold_loops=False) == ["ababab"]
+
+def test_folded_loop_burns_the_same_fuel():
+    blob = compile_src(LOOPS["sum"])
+    vms = [VM(blob, stdout=lambda v: None, fuel=1000, fold_loops=f) for f in (True, False)]
+    for vm in vms: vm.run()
+    assert vms[0].fuel == vms[1].fuel
+
+def test_fuel_fallback():
+    # fewer units of fuel than trips: interpreted, so it runs out at the same point
+    blob = compile_src("let mut x = 0\nfor (i in 0..100) {\n  x = x + i\n}\nprint x\n")
+    errors = []
+    for f in (True, False):
+        vm = VM(blob, stdout=lambda v: None, fuel=40, fold_loops=f)
+        with pytest.raises(VMError, match="Fuel exhausted") as e:
+            vm.run()
+        errors.append((str(e.value), unwrap(vm.env_stack[0]["x"])))
+    assert errors[0] == errors[1]
+
+def test_memory_fallback():
+    blob = compile_src(LOOPS["product"].replace("40", "3000"))
+    errors = []
+    for f in (True, False):
+        with pytest.raises(VMError, match="MEMORY budget exceeded") as e:
+            VM(blob, stdout=lambda v: None, memory=2000, fold_loops=f).run()
+        errors.append(str(e.value))
+    assert errors[0] == errors[1]
+    assert run(blob, memory=10**6) == run(blob, memory=10**6, fold_loops=False)
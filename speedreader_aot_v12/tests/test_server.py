@@ -0,0 +1,61 @@
+import base64, json, sys
+from concurrent.futures import ThreadPoolExecutor
+from speedreader.server import CompileCache, handle, handle_line
+from .helpers import compile_src
+
+LOOP = "let mut s = 0\nfor (i in 0..4) {\n  s = s + i\n}\nprint s\n"
+
+def test_handle_source():
+    cache = CompileCache()
+    resp = handle({"id": 7, "source": LOOP}, cache)
+    assert resp["id"] == 7 and resp["ok"] and resp["output"] == "6\n"
+    assert not resp["cached"] and set(resp["timings"]) == {"compile", "run"}
+    assert handle({"id": 8, "source": LOOP}, cache)["cached"]
+
+def test_handle_options_and_blob():
+    cache = CompileCache()
+    for opt in (False, True):
+        for trusted in (False, True):
+            resp = handle({"source": LOOP, "opt": opt, "trusted": trusted, "verify": True}, cache)
+            assert resp["ok"] and resp["output"] == "6\n" and not resp["cached"]
+    blob = base64.b64encode(compile_src(LOOP)).decode("ascii")
+    resp = handle({"blob": blob, "opt": True, "trusted": True}, cache)
+    assert resp["ok"] and resp["output"] == "6\n"
+
+def test_handle_errors_keep_partial_output():
+    resp = handle({"source": "print 1\nprint y\n"}, CompileCache())
+    assert not resp["ok"] and resp["error"].startswith("VMError") and resp["output"] == "1\n"
+    resp = handle({"source": "let mut x = 0\nwhile x < 1 {\n  print 1\n}\n", "max_instructions": 50}, CompileCache())
+    assert not resp["ok"] and "Instruction budget exceeded: 50" in resp["error"]
+    assert not handle({"id": 3}, CompileCache())["ok"]
+
+def test_handle_line():
+    resp = json.loads(handle_line(json.dumps({"id": 1, "source": "print 2"})))
+    assert resp["id"] == 1 and resp["ok"] and resp["output"] == "2\n"
+    for line in ("not json", "[1, 2]"):
+        resp = json.loads(handle_line(line))
+        assert resp == {"id": None, "ok": False, "error": resp["error"]}
+        assert resp["error"].startswith("BadRequest")
+
+def test_cache_keys_and_eviction():
+    cache = CompileCache(size=2)
+    blob, cert, hit = cache.get(LOOP, False, False)
+    assert not hit and cert is None and blob == compile_src(LOOP)
+    assert cache.get(LOOP, True, False)[0] == compile_src(LOOP, opt=True)
+    assert cache.get(LOOP, False, True)[1] is not None
+    assert not cache.get(LOOP, False, False)[2]   # evicted as least recently used
+    assert cache.get(LOOP, False, True)[2]
+
+def test_concurrent_compiles_match_sequential():
+    # Scope ids come from a process-wide counter; the cache lock keeps
+    # compiles on different threads from interleaving it.
+    srcs = [LOOP * (20 + k) + f"print {k}\n" for k in range(16)]
+    expected = [compile_src(src) for src in srcs]
+    cache = CompileCache(); interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            blobs = list(pool.map(lambda src: cache.get(src, False, False)[0], srcs))
+    finally:
+        sys.setswitchinterval(interval)
+    assert blobs == expected
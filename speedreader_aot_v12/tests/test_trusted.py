@@ -0,0 +1,60 @@
+import glob, os
+import pytest
+from speedreader.emitter import _load_blob
+from speedreader.verifier import Certificate, VerifyError, certify, code_hash
+from speedreader.vm import VM, VMError
+from .helpers import BUDGETS, compile_src, run, run_trusted
+
+PROGRAMS = [
+    "let mut g = 1\nfn set(v) capture[g] {\n  g = v\n  print g\n}\nset(5)\nset(7)\nprint g\n",
+    "for (i in 0..5) {\n  print i\n}\nfor (j in 3..=9; step 3) {\n  print j\n}\n",
+    'let x = 4\nif x > 3 {\n  print "big"\n} else {\n  print "small"\n}\nwhile x < 3 {\n  print x\n}\n',
+    "let mut t = 0\nfn add(a, b) capture[t] {\n  t = a + b\n}\nfor (i in 0..20) {\n  add(t, i)\n}\nprint t\n",
+    'let mut s = ""\nlet mut n = 0\nwhile n < 5 {\n  s = s + "x"\n  n = n + 1\n}\nprint s\nprint n\n',
+    "fn down(n) {\n  if n > 0 {\n    print n\n    down(n - 1)\n  }\n}\ndown(4)\n",
+]
+EXAMPLES = os.path.join(os.path.dirname(__file__), os.pardir, "examples")
+
+@pytest.mark.parametrize("src", PROGRAMS + [open(p).read() for p in sorted(glob.glob(os.path.join(EXAMPLES, "*.sr")))])
+def test_trusted_matches_checked(src):
+    expected = run(compile_src(src))
+    assert run(compile_src(src, True)) == expected
+    assert run_trusted(compile_src(src, True)) == expected
+
+@pytest.mark.parametrize("fn, checked", [
+    ("fn f() capture[g] {\n  print g\n}\n", "Capture 'g' not found"),
+    ("fn f() {\n  print g\n}\n", "Unknown variable g"),
+])
+def test_global_must_be_bound_at_every_call(fn, checked):
+    # the first call binds g only on a branch that is not taken
+    src = fn + "let c = 1\nif c > 5 {\n  let g = 5\n  f()\n}\nf()\n"
+    with pytest.raises(VMError, match=checked):
+        run(compile_src(src))
+    with pytest.raises(VerifyError):
+        certify(compile_src(src, True), BUDGETS)
+
+def test_global_bound_before_every_call_certifies():
+    src = "fn f() capture[g] {\n  print g\n}\nlet g = 2\nf()\nf()\n"
+    assert run_trusted(compile_src(src, True)) == [2, 2]
+
+def test_store_sharing_a_name_with_another_functions_param():
+    src = "fn show(x) {\n  print x\n}\nlet mut x = 3\nshow(x)\nx = 4\nshow(x)\n"
+    assert run_trusted(compile_src(src, True)) == [3, 4]
+
+def test_store_reaching_a_callers_param_is_rejected():
+    src = ("let mut x = 0\nfn set() {\n  x = 7\n}\nfn outer(x) {\n  set()\n  print x\n}\n"
+           "outer(1)\n")
+    with pytest.raises(VerifyError, match="Store to non-mutable x in set"):
+        certify(compile_src(src, True), BUDGETS)
+
+def test_trusted_load_of_unbound_name_fails_loudly():
+    blob = compile_src("print g\n", True)
+    meta, code = _load_blob(blob)
+    cert = Certificate(code_hash(meta["strings"], code), {"<main>": 4}, {})
+    with pytest.raises(VMError, match="Unknown variable g"):
+        VM(blob, stdout=lambda v: None, trusted=True, certificate=cert).run()
+
+def test_certificate_is_bound_to_the_code():
+    cert = certify(compile_src("print 1\n", True), BUDGETS)
+    with pytest.raises(VMError):
+        VM(compile_src("print 2\n", True), stdout=lambda v: None, trusted=True, certificate=cert).run()
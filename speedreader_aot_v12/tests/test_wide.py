@@ -0,0 +1,64 @@
+import pytest
+from speedreader.emitter import _load_blob
+from speedreader.verifier import certify
+from speedreader.vm import VM, VMError
+from speedreader.wide import is_wide, to_compact, to_wide
+from .helpers import BUDGETS, compile_src, run, ops
+
+LOOPS = """fn show(n) {
+  print n
+}
+let mut n = 0
+while n < 10 {
+  n = n + 1
+  if n % 3 == 0 { continue }
+  if n == 8 { break }
+  show(n)
+}
+for (i in 0..3) {
+  for (j in 0..=4; step 2) {
+    if j == 4 { break }
+    print i * 10 + j
+  }
+}
+let mut t = 0
+for (i in 0..50) {
+  t = t + i * i
+}
+print t
+"""
+
+def test_every_loop_enters_through_loop_head():
+    names = ops(compile_src(LOOPS))
+    assert names.count("LOOP_HEAD") == names.count("LOOP_END") == 4
+
+@pytest.mark.parametrize("opt", [False, True])
+def test_wide_runs_like_compact(opt):
+    blob = compile_src(LOOPS, opt)
+    wide = to_wide(blob)
+    assert is_wide(wide) and not is_wide(blob)
+    expected = run(blob)
+    assert expected == [1, 2, 4, 5, 7, 0, 2, 10, 12, 20, 22, sum(i * i for i in range(50))]
+    assert run(wide) == expected
+    assert run(wide, fold_loops=False) == expected
+
+def test_conversion_round_trips():
+    blob = compile_src(LOOPS, True)
+    assert to_compact(to_wide(blob)) == blob
+    assert to_wide(to_wide(blob)) == to_wide(blob)
+
+def test_errors_report_the_same_line():
+    src = "let x = 1\nfor (i in 0..3) {\n  print i\n}\nprint y\n"
+    lines = []
+    for blob in (compile_src(src), to_wide(compile_src(src))):
+        with pytest.raises(VMError) as e:
+            run(blob)
+        lines.append(e.value.line)
+    assert lines == [5, 5]
+
+def test_certificates_stay_with_compact_code():
+    blob = compile_src(LOOPS, True)
+    cert = certify(blob, BUDGETS)
+    assert "cert" not in _load_blob(to_wide(blob))[0]
+    with pytest.raises(VMError, match="Trusted mode requires the compact encoding"):
+        VM(to_wide(blob), stdout=lambda v: None, trusted=True, certificate=cert)